@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+# Benchmarks the database layer and folder listings against synthetic libraries
+#
+# Usage: python benchmark/benchmark.py [--books 10000 --books 100000]
+#
+# The Kodi modules are replaced by the stubs in benchmark/stubs so this runs
+# outside of Kodi (it does still need Python 2 and mutagen). Every run starts
+# with a new database, so the results can be compared before and after a change
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import argparse
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, 'stubs'))
+
+import xbmcaddon
+import xbmcvfs
+
+LIBRARY_ROOT = '/library'
+BOOKS_PER_FOLDER = 50
+TRACKS_PER_BOOK = 3
+
+
+# Creates an in memory library with the given number of books, half are m4b
+# files and half are folders of mp3 files, returns the path of each folder
+# and the details of each book
+def createLibrary(numBooks):
+    xbmcvfs.FILESYSTEM.clear()
+
+    folders = []
+    books = []
+    numFolders = (numBooks + BOOKS_PER_FOLDER - 1) // BOOKS_PER_FOLDER
+    for folderIdx in range(numFolders):
+        folderName = "Author %05d" % folderIdx
+        folderPath = "%s/%s" % (LIBRARY_ROOT, folderName)
+        bookDirs = []
+        bookFiles = ['fanart.jpg']
+
+        firstBook = folderIdx * BOOKS_PER_FOLDER
+        for bookIdx in range(firstBook, min(firstBook + BOOKS_PER_FOLDER, numBooks)):
+            if bookIdx % 2 == 0:
+                bookName = "Book %06d.m4b" % bookIdx
+                bookFiles.append(bookName)
+                numChapters = 0
+            else:
+                bookName = "Book %06d" % bookIdx
+                bookDirs.append(bookName)
+                trackFiles = ['folder.jpg']
+                for trackIdx in range(TRACKS_PER_BOOK):
+                    trackFiles.append("%02d Chapter.mp3" % (trackIdx + 1))
+                xbmcvfs.FILESYSTEM["%s/%s" % (folderPath, bookName)] = ([], trackFiles)
+                numChapters = TRACKS_PER_BOOK
+            books.append({'fullpath': "%s/%s" % (folderPath, bookName),
+                          'title': "Synthetic Book %d" % bookIdx,
+                          'artist': folderName,
+                          'numChapters': numChapters})
+
+        xbmcvfs.FILESYSTEM[folderPath] = (bookDirs, bookFiles)
+        folders.append(folderPath)
+
+    xbmcvfs.FILESYSTEM[LIBRARY_ROOT] = ([os.path.basename(folder) for folder in folders], [])
+    xbmcaddon.SETTINGS['audioBooksFolder'] = LIBRARY_ROOT
+    return folders, books
+
+
+# Each plugin call is a new invocation, so starts with nothing already listed
+def listFolder(menuNav, folder):
+    from resources.lib.settings import clear_dir_cache
+    from resources.lib.covercache import CoverCache
+    clear_dir_cache()
+    CoverCache.clear()
+    menuNav.showAudiobooks(folder)
+
+
+# Runs the given function once for each of the arguments, returning how long
+# each call took in milliseconds
+def timeCalls(function, argumentList):
+    timings = []
+    for arguments in argumentList:
+        startTime = time.time()
+        function(*arguments)
+        timings.append((time.time() - startTime) * 1000)
+    return timings
+
+
+def percentile(sortedTimings, percent):
+    index = int(round((percent / 100.0) * (len(sortedTimings) - 1)))
+    return sortedTimings[index]
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    mean = sum(timings) / len(timings)
+    print("%-22s %7d %9.3f %9.3f %9.3f %9.3f %9.3f" % (name, len(timings), mean, percentile(timings, 50),
+                                                       percentile(timings, 90), percentile(timings, 99), timings[-1]))
+
+
+def runBenchmark(numBooks, samples, listings):
+    # Each library gets a clean addon_data directory, the database module
+    # reads the location each time a database instance is created
+    profileDir = tempfile.mkdtemp(prefix='audiobooks_benchmark_')
+    xbmcaddon.PROFILE = profileDir
+
+    # Imported here so the stubs are set up before any addon code is loaded
+    from resources.lib.database import AudioBooksDB
+    from plugin import MenuNavigator
+
+    try:
+        folders, books = createLibrary(numBooks)
+        print("")
+        print("Library of %d books in %d folders" % (len(books), len(folders)))
+        print("%-22s %7s %9s %9s %9s %9s %9s" % ("operation (ms)", "count", "mean", "p50", "p90", "p99", "max"))
+
+        audiobookDB = AudioBooksDB.getInstance()
+        audiobookDB.createDatabase()
+
+        insertArgs = []
+        for book in books:
+            insertArgs.append((book['fullpath'], book['title'], book['numChapters'], "1400000000:4096", book['artist'], book['title']))
+        report("insert", timeCalls(audiobookDB.addAudioBook, insertArgs))
+
+        # The listing would otherwise try and read the artwork from the media
+        with audiobookDB.transaction():
+            for book in books:
+                audiobookDB.setHasArtwork(book['fullpath'], 0)
+
+        randomBooks = [random.choice(books)['fullpath'] for i in range(samples)]
+        report("lookup", timeCalls(audiobookDB.getAudioBookDetails, [(fullpath,) for fullpath in randomBooks]))
+
+        folderBooks = []
+        for folder in random.sample(folders, min(listings, len(folders))):
+            folderBooks.append(([book['fullpath'] for book in books if book['fullpath'].startswith(folder + '/')],))
+        report("batch lookup (folder)", timeCalls(audiobookDB.getAudioBookDetailsBatch, folderBooks))
+
+        progressArgs = [(fullpath, random.randint(0, 36000), random.randint(0, 10), False) for fullpath in randomBooks]
+        report("progress update", timeCalls(audiobookDB.setPosition, progressArgs))
+
+        report("full listing", timeCalls(audiobookDB.getAllAudioBooks, [()] * max(1, listings // 4)))
+
+        # The first time a folder is displayed it is read from the media, after that
+        # it should be served from what is stored, so time both
+        menuNav = MenuNavigator('plugin://script.audiobooks/', 1)
+        listingFolders = [(menuNav, folder) for folder in random.sample(folders, min(listings, len(folders)))]
+        for label in ["folder listing (cold)", "folder listing (warm)"]:
+            for key in xbmcvfs.CALLS.keys():
+                xbmcvfs.CALLS[key] = 0
+            report(label, timeCalls(listFolder, listingFolders))
+            print("%-22s %s" % ("", ", ".join(["%s %.1f" % (key, float(value) / len(listingFolders)) for key, value in sorted(xbmcvfs.CALLS.items())]) + " per listing"))
+    finally:
+        AudioBooksDB.closeInstance()
+        shutil.rmtree(profileDir, ignore_errors=True)
+
+
+#########################
+# Main
+#########################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the AudioBooks database layer with synthetic libraries")
+    parser.add_argument('--books', type=int, action='append', help="number of books in the library, can be given more than once (default 1000 and 10000)")
+    parser.add_argument('--samples', type=int, default=1000, help="number of lookups and progress updates to time")
+    parser.add_argument('--listings', type=int, default=20, help="number of folders to list")
+    parser.add_argument('--seed', type=int, default=1, help="seed for choosing the random books")
+    parser.add_argument('--debug-logging', action='store_true', help="enable debug logging, to include the cost of building log messages")
+    options = parser.parse_args()
+
+    random.seed(options.seed)
+    if options.debug_logging:
+        xbmcaddon.SETTINGS['logEnabled'] = 'true'
+
+    for numBooks in (options.books or [1000, 10000]):
+        runBenchmark(numBooks, options.samples, options.listings)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# Minimal stand-in for the Kodi xbmc module, only what the addon uses
+import xbmcaddon
+
+LOGDEBUG = 0
+LOGINFO = 1
+LOGNOTICE = 2
+LOGWARNING = 3
+LOGERROR = 4
+
+PLAYLIST_MUSIC = 0
+
+
+def log(msg, level=LOGDEBUG):
+    pass
+
+
+def translatePath(path):
+    return path.replace('special://profile/addon_data/script.audiobooks', xbmcaddon.PROFILE).replace('special://profile', xbmcaddon.PROFILE)
+
+
+def sleep(timeInMillis):
+    pass
+
+
+def executebuiltin(function):
+    pass
+
+
+def getCondVisibility(condition):
+    return False
+
+
+def getInfoLabel(infoTag):
+    return ""
+
+
+class Monitor():
+    def abortRequested(self):
+        return False
+
+    def waitForAbort(self, timeout=0):
+        return False
+
+
+class Player():
+    def isPlaying(self):
+        return False
+
+
+class PlayList():
+    def __init__(self, playList):
+        self.items = []
+
+    def clear(self):
+        self.items = []
+
+    def add(self, url, listitem=None, index=-1):
+        self.items.append(url)
+
+
+class Keyboard():
+    def __init__(self, default='', heading='', hidden=False):
+        self.text = default
+
+    def doModal(self):
+        pass
+
+    def isConfirmed(self):
+        return False
+
+    def getText(self):
+        return self.text
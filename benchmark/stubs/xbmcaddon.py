@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Minimal stand-in for the Kodi xbmcaddon module, settings start with the
+# defaults from resources/settings.xml and can be changed through SETTINGS
+import os
+import tempfile
+import xml.etree.ElementTree as ET
+
+ADDON_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Location of the addon_data directory, the database is created in here
+PROFILE = tempfile.gettempdir()
+
+SETTINGS = {}
+for setting in ET.parse(os.path.join(ADDON_DIR, 'resources', 'settings.xml')).iter('setting'):
+    if setting.get('id') is not None:
+        SETTINGS[setting.get('id')] = setting.get('default', '')
+
+
+class Addon():
+    def __init__(self, id=None):
+        pass
+
+    def getAddonInfo(self, key):
+        details = {'id': 'script.audiobooks',
+                   'name': 'AudioBooks',
+                   'version': 'benchmark',
+                   'path': ADDON_DIR,
+                   'profile': PROFILE,
+                   'icon': os.path.join(ADDON_DIR, 'icon.png'),
+                   'fanart': os.path.join(ADDON_DIR, 'fanart.jpg')}
+        return details.get(key, '')
+
+    def getSetting(self, key):
+        return SETTINGS.get(key, '')
+
+    def setSetting(self, key, value):
+        SETTINGS[key] = value
+
+    def getLocalizedString(self, stringId):
+        return str(stringId)
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# Minimal stand-in for the Kodi xbmcgui module, only what the addon uses
+
+
+class ListItem():
+    def __init__(self, label='', label2='', iconImage='', thumbnailImage='', path=''):
+        self.label = label
+
+    def setProperty(self, key, value):
+        pass
+
+    def setInfo(self, type, infoLabels):
+        pass
+
+    def addContextMenuItems(self, items, replaceItems=False):
+        pass
+
+    def setIconImage(self, iconImage):
+        pass
+
+    def setThumbnailImage(self, thumbnailImage):
+        pass
+
+
+class Window():
+    # Properties are shared by every instance, as they are for a Kodi window
+    PROPERTIES = {}
+
+    def __init__(self, windowId=-1):
+        self.windowId = windowId
+
+    def getProperty(self, key):
+        return Window.PROPERTIES.get((self.windowId, key), '')
+
+    def setProperty(self, key, value):
+        Window.PROPERTIES[(self.windowId, key)] = value
+
+    def clearProperty(self, key):
+        Window.PROPERTIES.pop((self.windowId, key), None)
+
+
+class Dialog():
+    def ok(self, heading, line1, line2='', line3=''):
+        return True
+
+    def yesno(self, heading, line1, line2='', line3=''):
+        return False
+
+    def browseSingle(self, type, heading, shares):
+        return ''
+
+
+class DialogProgressBG():
+    def create(self, heading, message=''):
+        pass
+
+    def update(self, percent=0, heading='', message=''):
+        pass
+
+    def close(self):
+        pass
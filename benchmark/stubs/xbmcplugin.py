@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Minimal stand-in for the Kodi xbmcplugin module, counts the items added
+
+ITEM_COUNT = 0
+
+
+def addDirectoryItem(handle, url, listitem, isFolder=False, totalItems=0):
+    global ITEM_COUNT
+    ITEM_COUNT += 1
+    return True
+
+
+def addDirectoryItems(handle, items, totalItems=0):
+    global ITEM_COUNT
+    ITEM_COUNT += len(items)
+    return True
+
+
+def endOfDirectory(handle, succeeded=True, updateListing=False, cacheToDisc=True):
+    pass
+
+
+def setContent(handle, content):
+    pass
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# Minimal stand-in for the Kodi xbmcvfs module. Paths that have been added to
+# FILESYSTEM are served from memory (so very large synthetic libraries can be
+# used), everything else goes to the real filesystem. Each call is counted in
+# CALLS as on a network share every one of them would be a round trip
+import os
+import shutil
+
+# Synthetic directories, path -> (list of directories, list of files)
+FILESYSTEM = {}
+
+CALLS = {'listdir': 0, 'exists': 0, 'stat': 0}
+
+
+def _split(path):
+    if path.endswith("/"):
+        path = path[:-1]
+    return path.rsplit("/", 1)
+
+
+def listdir(path):
+    CALLS['listdir'] += 1
+    if path.endswith("/"):
+        path = path[:-1]
+    if path in FILESYSTEM:
+        dirs, files = FILESYSTEM[path]
+        return list(dirs), list(files)
+    dirs = []
+    files = []
+    if os.path.isdir(path):
+        for name in os.listdir(path):
+            if os.path.isdir(os.path.join(path, name)):
+                dirs.append(name)
+            else:
+                files.append(name)
+    return dirs, files
+
+
+def exists(path):
+    CALLS['exists'] += 1
+    if path.endswith("/"):
+        path = path[:-1]
+    if path in FILESYSTEM:
+        return True
+    parent, name = _split(path)
+    if parent in FILESYSTEM:
+        return name in FILESYSTEM[parent][1]
+    return os.path.exists(path)
+
+
+def mkdir(path):
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    return True
+
+
+def delete(path):
+    if os.path.exists(path):
+        os.remove(path)
+    return True
+
+
+def rmdir(path):
+    os.rmdir(path)
+    return True
+
+
+def copy(source, destination):
+    shutil.copyfile(source, destination)
+    return True
+
+
+class Stat():
+    def __init__(self, path):
+        CALLS['stat'] += 1
+        if path.endswith("/"):
+            path = path[:-1]
+        parent, name = _split(path)
+        if (path in FILESYSTEM) or ((parent in FILESYSTEM) and (name in FILESYSTEM[parent][1])):
+            self.mtime = 1400000000
+            self.size = 4096
+        else:
+            details = os.stat(path)
+            self.mtime = int(details.st_mtime)
+            self.size = details.st_size
+
+    def st_mtime(self):
+        return self.mtime
+
+    def st_size(self):
+        return self.size
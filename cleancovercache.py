@@ -10,6 +10,7 @@ from resources.lib.settings import Settings
 from resources.lib.settings import log
 from resources.lib.settings import dir_exists
 from resources.lib.settings import os_path_join
+from resources.lib.covercache import CoverCache
 
 ADDON = xbmcaddon.Addon(id='script.audiobooks')
 
@@ -36,6 +37,10 @@ if __name__ == '__main__':
             # Now remove the actual directory
             xbmcvfs.rmdir(coverCache)
 
+            # The index is held separately by each invocation, so record that the
+            # covers have gone for any that have already listed the cache
+            CoverCache.markCleared()
+
         except:
             log("AudioBookCoverCleanup: %s" % traceback.format_exc(), xbmc.LOGERROR)
 
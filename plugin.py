@@ -19,9 +19,14 @@ else:
 from resources.lib.settings import Settings
 from resources.lib.settings import log
 from resources.lib.settings import os_path_join
+from resources.lib.settings import os_path_split
+from resources.lib.settings import clear_dir_cache
 from resources.lib.audiobook import AudioBookHandler
 from resources.lib.bookplayer import BookPlayer
 from resources.lib.database import AudioBooksDB
+from resources.lib.foldersnapshot import FolderSnapshot
+from resources.lib.covercache import CoverCache
+from resources.lib.tempcopies import TempCopies
 
 ADDON = xbmcaddon.Addon(id='script.audiobooks')
 FANART = ADDON.getAddonInfo('fanart')
@@ -42,8 +47,9 @@ class MenuNavigator():
     def _build_url(self, query):
         return self.base_url + '?' + urllib.urlencode(query)
 
-    # Show all the EBooks that are in the eBook directory
-    def showAudiobooks(self, directory=None):
+    # Show all the EBooks that are in the eBook directory, large directories
+    # are split into pages with only the books on the given page being loaded
+    def showAudiobooks(self, directory=None, page=0, pageSize=None):
         # Get the setting for the audio book directory
         audioBookFolder = Settings.getAudioBookFolder()
 
@@ -60,29 +66,35 @@ class MenuNavigator():
             log("AudioBooksPlugin: Setting Audio Books folder to %s" % audioBookFolder)
             Settings.setAudioBookFolder(audioBookFolder)
 
+        # All the items are added to the display in one go once they have been created
+        dirItems = []
+
         # We may be looking at a subdirectory
         if directory not in [None, ""]:
             audioBookFolder = directory
+        else:
+            # At the top level, so allow the user to search all the books
+            url = self._build_url({'mode': 'search'})
+            li = xbmcgui.ListItem(ADDON.getLocalizedString(32037), iconImage='DefaultAddonsSearch.png')
+            li.setProperty("Fanart_Image", FANART)
+            li.addContextMenuItems([], replaceItems=True)
+            dirItems.append((url, li, True))
 
-        dirs, files = xbmcvfs.listdir(audioBookFolder)
-        files.sort()
-        dirs.sort()
+        # Use the stored contents of the folder rather than listing it every time
+        folderSnapshot = FolderSnapshot.getSnapshot(audioBookFolder)
+
+        # The directories are only shown on the first page, before the books
+        subFolders = folderSnapshot.subFolders
+        if page > 0:
+            subFolders = []
 
-        bookDirs = []
         # For each directory list allow the user to navigate into it
-        for adir in dirs:
-            if adir.startswith('.'):
-                continue
+        for subFolder in subFolders:
+            adir = subFolder['name']
+            log("AudioBooksPlugin: Adding directory %s" % adir)
 
             fullDir = os_path_join(audioBookFolder, adir)
 
-            # Check if this directory is a book directory
-            if self._isAudioBookDir(fullDir):
-                bookDirs.append(fullDir)
-                continue
-
-            log("AudioBooksPlugin: Adding directory %s" % adir)
-
             try:
                 displayName = "[%s]" % adir.encode("utf-8")
             except:
@@ -101,43 +113,47 @@ class MenuNavigator():
             # Check if there are any images for this directory
             iconImage = 'DefaultFolder.png'
             fanartImage = FANART
-            subDirs, subFiles = xbmcvfs.listdir(fullDir)
-            for fileInDir in subFiles:
-                if fileInDir.lower() in ['fanart.jpg', 'fanart.png']:
-                    fanartImage = os_path_join(fullDir, fileInDir)
-                elif fileInDir.lower() in ['folder.jpg', 'folder.png']:
-                    iconImage = os_path_join(fullDir, fileInDir)
+            if subFolder['fanart'] not in [None, ""]:
+                fanartImage = os_path_join(fullDir, subFolder['fanart'])
+            if subFolder['icon'] not in [None, ""]:
+                iconImage = os_path_join(fullDir, subFolder['icon'])
 
             url = self._build_url({'mode': 'directory', 'directory': fullDir})
             li = xbmcgui.ListItem(displayName, iconImage=iconImage)
             li.setProperty("Fanart_Image", fanartImage)
             li.setInfo('video', {'Plot': plot})
             li.addContextMenuItems([], replaceItems=True)
-            xbmcplugin.addDirectoryItem(handle=self.addon_handle, url=url, listitem=li, isFolder=True)
-
-        m4bAudioBooks = []
-        for m4bBookFile in files:
-            # Check to ensure that this is an eBook
-            if not m4bBookFile.lower().endswith('.m4b'):
-                log("AudioBooksPlugin: Skipping non audiobook file: %s" % m4bBookFile)
-                continue
+            dirItems.append((url, li, True))
 
-            fullpath = os_path_join(audioBookFolder, m4bBookFile)
+        # Get all the audiobook in a nicely sorted order, the titles already stored
+        # are used so that only the books on this page need to be loaded
+        audiobookDB = AudioBooksDB.getInstance()
+        allAudioBooks = audiobookDB.sortAudioBooks(folderSnapshot.getAudioBooks())
 
-            m4bAudioBooks.append(fullpath)
+        if pageSize is None:
+            pageSize = Settings.getPageSize()
+        pageBooks, nextPage = self._getPage(allAudioBooks, page, pageSize)
 
-        # Get all the audiobook in a nicely sorted order
-        allAudioBooks = sorted(bookDirs + m4bAudioBooks)
+        # Read the details for all the books on this page in one go, rather
+        # than each book reading its own details
+        audiobookDetails = audiobookDB.getAudioBookDetailsBatch(pageBooks)
 
         audioBookHandlers = []
         # Now list all of the books
-        for audioBookFile in allAudioBooks:
+        for audioBookFile in pageBooks:
             log("AudioBooksPlugin: Adding audiobook %s" % audioBookFile)
 
-            audioBookHandlers.append(AudioBookHandler.createHandler(audioBookFile))
+            audioBookHandler = AudioBookHandler.createHandler(audioBookFile, audiobookDetails.get(audioBookFile, None))
+            # Reading any new books can take a while, so their details are saved once
+            # they have all been read, rather than holding the database lock meanwhile
+            audioBookHandler.holdDatabaseWrites()
+            audioBookHandlers.append(audioBookHandler)
 
-        # Now sort the list by title
-        audioBookHandlers.sort()
+        # The books are already in order apart from any that have only just been
+        # read, so sort the page by title, each sort key is only worked out once
+        audioBookHandlers.sort(key=AudioBookHandler.getSortKey)
+
+        markCompletedItems = Settings.isMarkCompletedItems()
 
         # Now list all of the books
         for audioBookHandler in audioBookHandlers:
@@ -147,7 +163,7 @@ class MenuNavigator():
             coverTargetName = audioBookHandler.getCoverImage(True)
 
             isRead = False
-            if Settings.isMarkCompletedItems():
+            if markCompletedItems:
                 if audioBookHandler.isCompleted():
                     isRead = True
 
@@ -176,28 +192,118 @@ class MenuNavigator():
             li = xbmcgui.ListItem(displayString, iconImage=coverTargetName)
             li.setProperty("Fanart_Image", audioBookHandler.getFanArt())
             li.setInfo('video', {'Plot': plot})
-            li.addContextMenuItems(self._getContextMenu(audioBookHandler), replaceItems=True)
-            xbmcplugin.addDirectoryItem(handle=self.addon_handle, url=url, listitem=li, isFolder=True)
-
-            del audioBookHandler
+            secondsIn, chapterPosition = audioBookHandler.getPosition()
+            li.addContextMenuItems(self._getContextMenu(audioBookHandler.getFile(True), secondsIn, chapterPosition, audioBookHandler.isCompleted()), replaceItems=True)
+            dirItems.append((url, li, True))
+
+        # Any new books (and artwork details) found while listing are all saved in
+        # a single short transaction rather than one commit per book
+        with audiobookDB.transaction():
+            for audioBookHandler in audioBookHandlers:
+                audioBookHandler.savePendingWrites()
+        del audioBookHandlers
+
+        if nextPage is not None:
+            nextPageDir = audioBookFolder
+            try:
+                nextPageDir = nextPageDir.encode("utf-8")
+            except:
+                pass
+            dirItems.append(self._getNextPageItem({'mode': 'directory', 'directory': nextPageDir, 'page': nextPage, 'pageSize': pageSize}))
 
+        xbmcplugin.addDirectoryItems(self.addon_handle, dirItems, len(dirItems))
         xbmcplugin.endOfDirectory(self.addon_handle)
 
-    def _isAudioBookDir(self, fullDir):
-        # Check to see if this directory contains audio files (non m4b), if it does then we construct the
-        # book using each audio file file as a chapter
-        dirs, files = xbmcvfs.listdir(fullDir)
+        # If the snapshot is old, the service checks if the folder has changed since it
+        # was taken, and if it has then the listing is displayed again with the new contents
+        if folderSnapshot.isStale():
+            folderSnapshot.queueRefresh()
+
+    # Gets the items that are on the given page, and the number of the next
+    # page (None if this is the last page)
+    def _getPage(self, allItems, page, pageSize):
+        if pageSize < 1:
+            return allItems, None
+
+        startIdx = page * pageSize
+        pageItems = allItems[startIdx:startIdx + pageSize]
+
+        nextPage = None
+        if len(allItems) > startIdx + pageSize:
+            nextPage = page + 1
+        return pageItems, nextPage
+
+    # Creates the item at the end of a page that moves on to the next page
+    def _getNextPageItem(self, query):
+        url = self._build_url(query)
+        li = xbmcgui.ListItem(ADDON.getLocalizedString(32043), iconImage='DefaultFolder.png')
+        li.setProperty("Fanart_Image", FANART)
+        li.addContextMenuItems([], replaceItems=True)
+        return (url, li, True)
+
+    # Show all the books that match the search text, these are all read from
+    # the database so no media needs to be read
+    def search(self, searchText=None):
+        if searchText in [None, ""]:
+            keyboard = xbmc.Keyboard('', ADDON.getLocalizedString(32037), False)
+            keyboard.doModal()
+            if not keyboard.isConfirmed():
+                # Let Kodi know there is nothing to display, otherwise it keeps waiting
+                xbmcplugin.endOfDirectory(self.addon_handle, succeeded=False)
+                return
+            searchText = keyboard.getText()
+
+        if searchText in [None, ""]:
+            xbmcplugin.endOfDirectory(self.addon_handle, succeeded=False)
+            return
+
+        log("AudioBooksPlugin: Searching for %s" % searchText)
+
+        audiobookDB = AudioBooksDB.getInstance()
+        searchResults = audiobookDB.searchAudioBooks(searchText)
+
+        if len(searchResults) < 1:
+            xbmcgui.Dialog().ok(ADDON.getLocalizedString(32001), ADDON.getLocalizedString(32038))
+
+        fallbackCoverImage = Settings.getFallbackCoverImage()
+        markCompletedItems = Settings.isMarkCompletedItems()
+        dirItems = []
+        for audiobookDetails in searchResults:
+            # Only use a cover if it has already been cached, the media is not read
+            coverImage = fallbackCoverImage
+            if audiobookDetails['hasArtwork'] == 1:
+                cachedCover = CoverCache.getCachedCover(os_path_split(audiobookDetails['fullpath'])[-1])
+                if cachedCover not in [None, ""]:
+                    try:
+                        coverImage = cachedCover.encode("utf-8")
+                    except:
+                        coverImage = cachedCover
+
+            # Values from the database will already be utf-8
+            displayString = audiobookDetails['title']
+            if displayString in [None, ""]:
+                displayString = audiobookDetails['fullpath']
+
+            plot = ""
+            try:
+                plot = "[B]%s[/B]" % displayString
+            except:
+                plot = displayString
+
+            if markCompletedItems and audiobookDetails['complete']:
+                displayString = '* %s' % displayString
 
-        containsMP3 = False
-        for aFile in files:
-            if Settings.isPlainAudioFile(aFile):
-                log("AudioBooksPlugin: Directory contains MP3 files: %s" % fullDir)
-                containsMP3 = True
-                break
+            url = self._build_url({'mode': 'chapters', 'filename': audiobookDetails['fullpath'], 'cover': coverImage})
+            li = xbmcgui.ListItem(displayString, iconImage=coverImage)
+            li.setProperty("Fanart_Image", FANART)
+            li.setInfo('video', {'Plot': plot})
+            li.addContextMenuItems(self._getContextMenu(audiobookDetails['fullpath'], audiobookDetails['position'], audiobookDetails['chapterPosition'], audiobookDetails['complete']), replaceItems=True)
+            dirItems.append((url, li, True))
 
-        return containsMP3
+        xbmcplugin.addDirectoryItems(self.addon_handle, dirItems, len(dirItems))
+        xbmcplugin.endOfDirectory(self.addon_handle)
 
-    def listChapters(self, fullpath, defaultImage):
+    def listChapters(self, fullpath, defaultImage, page=0, pageSize=None):
         log("AudioBooksPlugin: Listing chapters for %s" % fullpath)
 
         audioBookHandler = AudioBookHandler.createHandler(fullpath)
@@ -208,20 +314,30 @@ class MenuNavigator():
         except:
             plot = audioBookHandler.getTitle()
 
+        # These are the same for every item, so only get them once
+        fanart = audioBookHandler.getFanArt()
+        bookFile = audioBookHandler.getFile(True)
+        dirItems = []
+
         chapters = audioBookHandler.getChapterDetails()
 
+        if pageSize is None:
+            pageSize = Settings.getPageSize()
+        pageChapters, nextPage = self._getPage(chapters, page, pageSize)
+
         if len(chapters) < 1:
-            url = self._build_url({'mode': 'play', 'filename': audioBookHandler.getFile(True), 'startTime': 0, 'chapter': 0})
+            url = self._build_url({'mode': 'play', 'filename': bookFile, 'startTime': 0, 'chapter': 0})
 
             li = xbmcgui.ListItem(ADDON.getLocalizedString(32018), iconImage=defaultImage)
-            li.setProperty("Fanart_Image", audioBookHandler.getFanArt())
+            li.setProperty("Fanart_Image", fanart)
             li.addContextMenuItems([], replaceItems=True)
             li.setInfo('video', {'Plot': plot})
-            xbmcplugin.addDirectoryItem(handle=self.addon_handle, url=url, listitem=li, isFolder=False)
+            dirItems.append((url, li, False))
 
         secondsIn, chapterPosition = audioBookHandler.getPosition()
-        if (secondsIn > 0) or (chapterPosition > 1):
-            url = self._build_url({'mode': 'play', 'filename': audioBookHandler.getFile(True), 'startTime': secondsIn, 'chapter': chapterPosition})
+        # The resume option is only at the start of the first page
+        if (page < 1) and ((secondsIn > 0) or (chapterPosition > 1)):
+            url = self._build_url({'mode': 'play', 'filename': bookFile, 'startTime': secondsIn, 'chapter': chapterPosition})
 
             displayTime = self._getDisplayTimeFromSeconds(secondsIn)
             displayName = "%s %s" % (ADDON.getLocalizedString(32019), displayTime)
@@ -231,19 +347,26 @@ class MenuNavigator():
                 displayName = "%s (%s: %d)" % (displayName, ADDON.getLocalizedString(32017), chapterPosition)
 
             li = xbmcgui.ListItem(displayName, iconImage=defaultImage)
-            li.setProperty("Fanart_Image", audioBookHandler.getFanArt())
+            li.setProperty("Fanart_Image", fanart)
             li.setInfo('video', {'Plot': plot})
             li.addContextMenuItems([], replaceItems=True)
-            xbmcplugin.addDirectoryItem(handle=self.addon_handle, url=url, listitem=li, isFolder=False)
+            dirItems.append((url, li, False))
 
-        # Add all the chapters to the display
+        # The settings will not change while the chapters are being added
+        showPlayButton = Settings.isShowPlayButtonIfOneChapter()
+        autoNumberChapters = Settings.autoNumberChapters()
+        markCompletedItems = Settings.isMarkCompletedItems()
+
+        # Add all the chapters on this page to the display
         chapterNum = 0
-        for chapter in chapters:
+        if pageSize > 0:
+            chapterNum = page * pageSize
+        for chapter in pageChapters:
             chapterNum += 1
-            url = self._build_url({'mode': 'play', 'filename': audioBookHandler.getFile(True), 'startTime': audioBookHandler.getChapterStart(chapterNum), 'chapter': chapterNum})
+            url = self._build_url({'mode': 'play', 'filename': bookFile, 'startTime': audioBookHandler.getChapterStart(chapterNum), 'chapter': chapterNum})
 
             displayString = ""
-            if Settings.isShowPlayButtonIfOneChapter() and (len(chapters) == 1):
+            if showPlayButton and (len(chapters) == 1):
                 displayString = ADDON.getLocalizedString(32030)
             else:
                 try:
@@ -252,14 +375,14 @@ class MenuNavigator():
                     displayString = chapter['title']
 
             # Check if we need to add a number at the start of the chapter
-            if Settings.autoNumberChapters() and (len(displayString) > 0) and (len(chapters) > 1):
+            if autoNumberChapters and (len(displayString) > 0) and (len(chapters) > 1):
                 # Check to make sure that the display chapter does not already
                 # start with a number, or end with a number
                 if not (displayString[0].isdigit() or displayString[-1].isdigit()):
                     displayString = "%d. %s" % (chapterNum, displayString)
 
             # Check if the current position means that this chapter has already been played
-            if Settings.isMarkCompletedItems():
+            if markCompletedItems:
                 if (audioBookHandler.isCompleted()) or ((chapter['endTime'] < secondsIn) and (chapter['endTime'] > 0)) or (chapterNum < chapterPosition):
                     displayString = '* %s' % displayString
 
@@ -274,12 +397,19 @@ class MenuNavigator():
                 # how far through the book the chapter is
                 li.setInfo('music', {'Duration': durationEntry})
 
-            li.setProperty("Fanart_Image", audioBookHandler.getFanArt())
+            li.setProperty("Fanart_Image", fanart)
             li.setInfo('video', {'Plot': plot})
             li.addContextMenuItems([], replaceItems=True)
-            xbmcplugin.addDirectoryItem(handle=self.addon_handle, url=url, listitem=li, isFolder=False)
+            dirItems.append((url, li, False))
+
+        if nextPage is not None:
+            nextPageQuery = {'mode': 'chapters', 'filename': bookFile, 'page': nextPage, 'pageSize': pageSize}
+            if defaultImage not in [None, ""]:
+                nextPageQuery['cover'] = defaultImage
+            dirItems.append(self._getNextPageItem(nextPageQuery))
 
         del audioBookHandler
+        xbmcplugin.addDirectoryItems(self.addon_handle, dirItems, len(dirItems))
         xbmcplugin.endOfDirectory(self.addon_handle)
 
     def play(self, fullpath, startTime=0, chapter=0):
@@ -296,13 +426,12 @@ class MenuNavigator():
         xbmc.executebuiltin("Container.Refresh")
 
     # Construct the context menu
-    def _getContextMenu(self, bookHandle):
+    def _getContextMenu(self, bookFile, secondsIn, chapterPosition, isComplete):
         ctxtMenu = []
 
         # Play from resume point
-        secondsIn, chapterPosition = bookHandle.getPosition()
         if (secondsIn > 0) or (chapterPosition > 1):
-            cmd = self._build_url({'mode': 'play', 'filename': bookHandle.getFile(True), 'startTime': secondsIn, 'chapter': chapterPosition})
+            cmd = self._build_url({'mode': 'play', 'filename': bookFile, 'startTime': secondsIn, 'chapter': chapterPosition})
             displayTime = self._getDisplayTimeFromSeconds(secondsIn)
             displayName = "%s %s" % (ADDON.getLocalizedString(32019), displayTime)
 
@@ -312,40 +441,38 @@ class MenuNavigator():
             ctxtMenu.append((displayName, 'RunPlugin(%s)' % cmd))
 
         # Play from start
-        cmd = self._build_url({'mode': 'play', 'filename': bookHandle.getFile(True), 'startTime': 0, 'chapter': 0})
+        cmd = self._build_url({'mode': 'play', 'filename': bookFile, 'startTime': 0, 'chapter': 0})
         ctxtMenu.append((ADDON.getLocalizedString(32018), 'RunPlugin(%s)' % cmd))
 
         # If this item is not already complete, allow it to be marked as complete
-        if not bookHandle.isCompleted():
+        if not isComplete:
             # Mark as complete
-            cmd = self._build_url({'mode': 'progress', 'filename': bookHandle.getFile(True), 'isComplete': 1, 'startTime': 0})
+            cmd = self._build_url({'mode': 'progress', 'filename': bookFile, 'isComplete': 1, 'startTime': 0})
             ctxtMenu.append((ADDON.getLocalizedString(32010), 'RunPlugin(%s)' % cmd))
 
         # Clear History
-        cmd = self._build_url({'mode': 'clear', 'filename': bookHandle.getFile(True)})
+        cmd = self._build_url({'mode': 'clear', 'filename': bookFile})
         ctxtMenu.append((ADDON.getLocalizedString(32011), 'RunPlugin(%s)' % cmd))
 
         # Add delete support if it is enabled
         if Settings.isDeleteSupported():
-            cmd = self._build_url({'mode': 'delete', 'filename': bookHandle.getFile(True)})
+            cmd = self._build_url({'mode': 'delete', 'filename': bookFile})
             ctxtMenu.append((ADDON.getLocalizedString(32032), 'RunPlugin(%s)' % cmd))
 
         return ctxtMenu
 
     def progress(self, fullpath, isComplete=True, startTime=0):
         # At the moment the only time progress is called is to mark as complete
-        audiobookDB = AudioBooksDB()
+        audiobookDB = AudioBooksDB.getInstance()
         audiobookDB.setPosition(fullpath, startTime, isComplete)
-        del audiobookDB
 
         xbmc.executebuiltin("Container.Refresh")
 
     def clear(self, fullpath):
         log("AudioBooksPlugin: Clearing history for %s" % fullpath)
         # Remove the item from the database, it will then be rescanned
-        audiobookDB = AudioBooksDB()
+        audiobookDB = AudioBooksDB.getInstance()
         audiobookDB.deleteAudioBook(fullpath)
-        del audiobookDB
 
         xbmc.executebuiltin("Container.Refresh")
 
@@ -388,6 +515,9 @@ class MenuNavigator():
             # Tell the user that the delete failed
             xbmcgui.Dialog().ok(ADDON.getLocalizedString(32001), ADDON.getLocalizedString(32034), fullpath)
 
+        # Make sure the folder is read again so the deleted item is not displayed
+        AudioBooksDB.getInstance().deleteFolderSnapshot(os_path_split(fullpath)[0])
+
         # Refresh the page without the file that was deleted
         xbmc.executebuiltin("Container.Refresh")
 
@@ -405,6 +535,18 @@ class MenuNavigator():
         return displayName
 
 
+# Reads the page number or page size from the arguments, the default is used when
+# it is missing or is not a number, and negative values are treated as zero
+def getPageArg(pageArg, default):
+    if (pageArg is None) or (len(pageArg) < 1):
+        return default
+    try:
+        return max(0, int(pageArg[0]))
+    except ValueError:
+        log("AudioBooksPlugin: Invalid page argument %s" % pageArg[0])
+        return default
+
+
 ################################
 # Main of the eBooks Plugin
 ################################
@@ -434,27 +576,50 @@ if __name__ == '__main__':
         log("AudioBooksPlugin: Mode is Directory")
 
         directory = args.get('directory', None)
+        pageArg = args.get('page', None)
+        pageSizeArg = args.get('pageSize', None)
+
+        page = getPageArg(pageArg, 0)
+        pageSize = getPageArg(pageSizeArg, None)
 
         if (directory is not None) and (len(directory) > 0):
             menuNav = MenuNavigator(base_url, addon_handle)
-            menuNav.showAudiobooks(directory[0])
+            menuNav.showAudiobooks(directory[0], page, pageSize)
             del menuNav
 
+    elif mode[0] == 'search':
+        log("AudioBooksPlugin: Mode is SEARCH")
+
+        searchText = args.get('query', None)
+        if (searchText is not None) and (len(searchText) > 0):
+            searchText = searchText[0]
+        else:
+            searchText = None
+
+        menuNav = MenuNavigator(base_url, addon_handle)
+        menuNav.search(searchText)
+        del menuNav
+
     elif mode[0] == 'chapters':
         log("AudioBooksPlugin: Mode is CHAPTERS")
 
         # Get the actual folder that was navigated to
         filename = args.get('filename', None)
         cover = args.get('cover', None)
+        pageArg = args.get('page', None)
+        pageSizeArg = args.get('pageSize', None)
 
         if (cover is not None) and (len(cover) > 0):
             cover = cover[0]
         else:
             cover = None
 
+        page = getPageArg(pageArg, 0)
+        pageSize = getPageArg(pageSizeArg, None)
+
         if (filename is not None) and (len(filename) > 0):
             menuNav = MenuNavigator(base_url, addon_handle)
-            menuNav.listChapters(filename[0], cover)
+            menuNav.listChapters(filename[0], cover, page, pageSize)
             del menuNav
 
     elif mode[0] == 'play':
@@ -520,3 +685,10 @@ if __name__ == '__main__':
             menuNav = MenuNavigator(base_url, addon_handle)
             menuNav.delete(filename[0])
             del menuNav
+
+    # Make sure the database connection used by this invocation is closed, and
+    # nothing listed is kept if the interpreter is re-used for the next call
+    AudioBooksDB.closeInstance()
+    clear_dir_cache()
+    CoverCache.clear()
+    TempCopies.clear()
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+import xbmcaddon
+import xbmcgui
+
+# Import the common settings
+from resources.lib.settings import log
+from resources.lib.database import AudioBooksDB
+from resources.lib.scanner import LibraryScanner
+
+ADDON = xbmcaddon.Addon(id='script.audiobooks')
+
+
+#########################
+# Main
+#########################
+if __name__ == '__main__':
+    log("AudioBookRescan: Rescan library called (version %s)" % ADDON.getAddonInfo('version'))
+
+    progressDialog = xbmcgui.DialogProgressBG()
+    progressDialog.create(ADDON.getLocalizedString(32001), ADDON.getLocalizedString(32035))
+
+    # Only books that have changed since they were last scanned will be read
+    scanner = LibraryScanner(progressDialog)
+    scanner.scan()
+    del scanner
+
+    progressDialog.close()
+    AudioBooksDB.closeInstance()
+
+    xbmcgui.Dialog().ok(ADDON.getLocalizedString(32001), ADDON.getLocalizedString(32036))
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 import os
+import hashlib
+import threading
 import traceback
 import xbmc
 import xbmcvfs
@@ -12,12 +14,125 @@ from settings import Settings
 from settings import log
 from settings import os_path_join
 from settings import os_path_split
+from settings import file_fingerprint
+from settings import list_dir
+from settings import file_exists
+from settings import get_sort_key
+from settings import INSTANCE_TOKEN
 from database import AudioBooksDB
 from ffmpegLib import FfmpegBase
+from ffmpegLib import FFMPEG_BATCH_SIZE
+from threadpool import ThreadPool
+from covercache import CoverCache
+from vfsfile import VfsFile
+from mp4reader import MP4Reader
+from coverreader import CoverReader
+from tempcopies import TempCopies
 
 ADDON = xbmcaddon.Addon(id='script.audiobooks')
 FANART = ADDON.getAddonInfo('fanart')
 
+# Stops more than one thread writing the cover image at the same time
+COVER_LOCK = threading.Lock()
+
+# Names of the tags that hold each detail, for each of the formats that mutagen
+# reads (ID3, MP4, Vorbis comments and ASF)
+TITLE_TAGS = ['TIT2', '\xa9nam', 'title', 'Title']
+ALBUM_TAGS = ['TALB', '\xa9alb', 'album', 'WM/AlbumTitle']
+ARTIST_TAGS = ['TPE1', '\xa9ART', 'artist', 'Author']
+
+
+# Gets the text of the first of the given tags that has a value
+def _getTagText(tags, tagNames):
+    for tagName in tagNames:
+        try:
+            if tagName not in tags:
+                continue
+            tagValue = tags[tagName]
+        except:
+            continue
+
+        # ID3 frames hold the values as text
+        if hasattr(tagValue, 'text'):
+            tagValue = tagValue.text
+        if isinstance(tagValue, list):
+            if len(tagValue) < 1:
+                continue
+            tagValue = tagValue[0]
+        # ASF attributes hold the value separately
+        if hasattr(tagValue, 'value'):
+            tagValue = tagValue.value
+
+        if tagValue not in [None, ""]:
+            return tagValue
+    return ""
+
+
+# Gets the data for the first cover image in the file, None if there is not one
+def _getTagCover(mutagenFile):
+    # FLAC files store the pictures separate to the tags
+    if hasattr(mutagenFile, 'pictures'):
+        if len(mutagenFile.pictures) > 0:
+            log("AudioBookHandler: Found pictures attribute")
+            return mutagenFile.pictures[0].data
+
+    tags = mutagenFile.tags
+    if tags is None:
+        return None
+
+    if 'covr' in tags:
+        log("AudioBookHandler: Found COVR attribute")
+        if len(tags['covr']) > 0:
+            return tags['covr'][0]
+
+    for aTag in tags.keys():
+        if 'APIC:' in aTag:
+            log("AudioBookHandler: Found APIC: attribute: %s" % aTag)
+            return tags[aTag].data
+    return None
+
+
+# Gets any chapters stored in the tags, these are ID3 CHAP frames, or for MP4
+# files the chapters that newer versions of mutagen read
+def _getTagChapters(mutagenFile, duration):
+    chapterTimes = []
+    mp4Chapters = getattr(mutagenFile, 'chapters', None)
+    if mp4Chapters is not None:
+        for mp4Chapter in mp4Chapters:
+            # Each chapter runs until the next one starts
+            chapterTimes.append((mp4Chapter.start, None, mp4Chapter.title))
+    elif hasattr(mutagenFile.tags, 'getall'):
+        for chapFrame in mutagenFile.tags.getall('CHAP'):
+            chapterTitle = ""
+            if 'TIT2' in chapFrame.sub_frames:
+                chapterTitle = chapFrame.sub_frames['TIT2'].text[0]
+            chapterTimes.append((chapFrame.start_time / 1000.0, chapFrame.end_time / 1000.0, chapterTitle))
+    return _getChapterList(chapterTimes, duration)
+
+
+# Converts a list of chapter start times, end times (None if the chapter runs until
+# the next one starts) and titles into the chapter details. If the duration of the
+# book is not known then neither is the end of the last chapter, so it is left as 0
+def _getChapterList(chapterTimes, duration):
+    chapterTimes.sort()
+
+    chapters = []
+    for idx, chapterTime in enumerate(chapterTimes):
+        startTime, endTime, chapterTitle = chapterTime
+        if endTime is None:
+            endTime = 0
+            if idx + 1 < len(chapterTimes):
+                endTime = chapterTimes[idx + 1][0]
+            elif (duration is not None) and (duration > 0):
+                endTime = duration
+
+        chapterDuration = 0
+        if endTime > 0:
+            chapterDuration = int(endTime - startTime)
+        chapters.append({'title': chapterTitle, 'startTime': int(startTime), 'endTime': int(endTime), 'duration': chapterDuration})
+    return chapters
+
+
 
 # Generic class for handling audiobook details
 class AudioBookHandler():
@@ -26,6 +141,8 @@ class AudioBookHandler():
         self.fileName = os_path_split(audioBookFilePath)[-1]
         self.coverImage = None
         self.title = None
+        self.artist = None
+        self.album = None
         self.chapters = []
         self.numChapters = 0
         self.position = -1
@@ -33,12 +150,19 @@ class AudioBookHandler():
         self.totalDuration = -1
         self.isComplete = None
         self.hasArtwork = -1
-
-    def __lt__(self, other):
-        return self.getTitle() < other.getTitle()
-
+        # When writes are held back, the details that need saving are only recorded
+        # until savePendingWrites is called
+        self.holdWrites = False
+        self.pendingNewBook = False
+        self.pendingArtwork = False
+        # Set if Kodi was shutting down while the media was being read, in which
+        # case the details are incomplete and must not be stored
+        self.readAborted = False
+
+    # Creates the handler for the given audiobook, if the database details have
+    # already been read (e.g. for a whole directory) they can be passed in
     @staticmethod
-    def createHandler(audioBookFilePath):
+    def createHandler(audioBookFilePath, audiobookDetails=None):
         audiobookType = None
         # Check which type of Audiobook it is
         if audioBookFilePath.lower().endswith('.m4b'):
@@ -46,208 +170,225 @@ class AudioBookHandler():
         else:
             audiobookType = FolderHandler(audioBookFilePath)
 
+        if audiobookDetails not in [None, ""]:
+            audiobookType._applyDetails(audiobookDetails)
+
         return audiobookType
 
+    # Gets a local copy of files that are not local, this is shared with anything
+    # else reading the same file, so must be given back with _removeCopiedFile
     def _getCopiedFileIfNeeded(self, fullPath):
         copiedFile = None
         if fullPath.startswith('smb://') or fullPath.startswith('nfs://'):
-            try:
-                # Copy the file to the local disk
-                justFileName = os_path_split(fullPath)[-1]
-                copiedFile = os_path_join(Settings.getTempLocation(), justFileName)
-                copy = xbmcvfs.copy(fullPath, copiedFile)
-                if copy:
-                    log("AudioBookHandler: copy successful for %s" % copiedFile)
-                else:
-                    log("AudioBookHandler: copy failed from %s to %s" % (fullPath, copiedFile))
-                    copiedFile = None
-            except:
-                log("AudioBookHandler: Failed to copy file %s to local directory" % fullPath)
-                copiedFile = None
-
+            copiedFile = TempCopies.acquire(fullPath)
         return copiedFile
 
     def _removeCopiedFile(self, copiedFile):
-        # If we had to copy the file locally, make sure we delete it
+        # If we had to copy the file locally, it may now be removed
         if copiedFile not in [None, ""]:
-            if xbmcvfs.exists(copiedFile):
-                xbmcvfs.delete(copiedFile)
+            TempCopies.release(copiedFile)
+
+    # Gets what mutagen should read the given file from, files that are not local
+    # are read where they are so only the parts mutagen needs are transferred. If
+    # that is not possible then the file is copied locally, in which case the
+    # copied file is also returned so it can be removed afterwards
+    def _getMutagenSource(self, fullPath):
+        if not (fullPath.startswith('smb://') or fullPath.startswith('nfs://')):
+            return fullPath, None
 
+        try:
+            return VfsFile(fullPath), None
+        except:
+            log("AudioBookHandler: Failed to open %s, it will be copied: %s" % (fullPath, traceback.format_exc()))
+
+        copiedFile = self._getCopiedFileIfNeeded(fullPath)
+        if copiedFile in [None, ""]:
+            return fullPath, None
+        return copiedFile, copiedFile
+
+    # Gets a file object for the source, remote files are already open
+    def _openMutagenSource(self, mutagenSource):
+        if isinstance(mutagenSource, VfsFile):
+            return mutagenSource
+        try:
+            return open(mutagenSource, 'rb')
+        except:
+            try:
+                return open(mutagenSource.encode('utf-8'), 'rb')
+            except:
+                log("AudioBookHandler: Failed to open %s, %s" % (mutagenSource, traceback.format_exc()))
+        return None
+
+    def _closeMutagenSource(self, mutagenSource, copiedFile):
+        if isinstance(mutagenSource, VfsFile):
+            mutagenSource.close()
+        # If we had to copy the file locally, make sure we delete it
+        self._removeCopiedFile(copiedFile)
+
+    # Reads the details of the given file from its tags, the cover is saved at
+    # the same time if there is not one already, so the file does not need to be
+    # read again for it. Returns None if the file could not be read
     def _readMetaData(self, inputFileName):
+        tagDetails = self._readTags(inputFileName)
+
+        if (tagDetails is not None) and (tagDetails['coverData'] not in [None, ""]):
+            # Tracks may be read at the same time, so only one can save the cover
+            with COVER_LOCK:
+                if self._getExistingCoverImage() in [None, ""]:
+                    self._saveCoverData(tagDetails['coverData'])
+
+        return tagDetails
+
+    # Parses the tags of the given file once, getting the title, album, artist,
+    # duration, chapters and cover image data. Returns None if it failed
+    def _readTags(self, inputFileName):
         log("AudioBookHandler: Reading Metadata for audio book %s" % inputFileName)
 
-        # If the file is not local, we might need to copy it
-        fullPath = inputFileName
-        copiedFile = self._getCopiedFileIfNeeded(inputFileName)
-        if copiedFile not in [None, ""]:
-            fullPath = copiedFile
+        # If the file is not local, it is either read remotely or copied
+        mutagenSource, copiedFile = self._getMutagenSource(inputFileName)
 
-        title = ""
-        album = ""
-        artist = ""
-        duration = -1
+        tagDetails = {'title': "", 'album': "", 'artist': "", 'duration': -1, 'chapters': [], 'coverData': None}
         try:
             mutagenFile = None
             # First try with the default encoding
             try:
-                mutagenFile = mutagen.File(fullPath, easy=True)
+                mutagenFile = mutagen.File(mutagenSource)
             except:
-                log("AudioBookHandler: Failed to read metadata for audio book %s, %s" % (fullPath, traceback.format_exc()))
-                try:
-                    fullPath = fullPath.encode('utf-8')
-                    mutagenFile = mutagen.File(fullPath, easy=True)
-                except:
-                    log("AudioBookHandler: Failed to encode as utf-8, %s" % traceback.format_exc())
+                log("AudioBookHandler: Failed to read metadata for audio book %s, %s" % (inputFileName, traceback.format_exc()))
+                # Only a path can be tried again with a different encoding, not an open file
+                if not isinstance(mutagenSource, VfsFile):
+                    try:
+                        mutagenFile = mutagen.File(mutagenSource.encode('utf-8'))
+                    except:
+                        log("AudioBookHandler: Failed to encode as utf-8, %s" % traceback.format_exc())
 
             if mutagenFile not in [None, ""]:
-                # We construct an empty array for items that are not found
-                emptyArray = [""]
-                # Get all the available data
-                title = mutagenFile.get('title', emptyArray)[0]
-                album = mutagenFile.get('album', emptyArray)[0]
-                artist = mutagenFile.get('artist', emptyArray)[0]
                 if mutagenFile.info not in [None, ""]:
                     if mutagenFile.info.length not in [None, ""]:
-                        duration = int(float(mutagenFile.info.length))
+                        tagDetails['duration'] = int(float(mutagenFile.info.length))
+
+                if mutagenFile.tags is not None:
+                    tagDetails['title'] = _getTagText(mutagenFile.tags, TITLE_TAGS)
+                    tagDetails['album'] = _getTagText(mutagenFile.tags, ALBUM_TAGS)
+                    tagDetails['artist'] = _getTagText(mutagenFile.tags, ARTIST_TAGS)
+                tagDetails['chapters'] = _getTagChapters(mutagenFile, tagDetails['duration'])
+                tagDetails['coverData'] = _getTagCover(mutagenFile)
             del mutagenFile
 
-            log("AudioBookHandler: title = %s, album = %s, duration = %d" % (title, album, duration))
+            # Older versions of mutagen do not read the chapters in m4b files
+            if (len(tagDetails['chapters']) < 1) and inputFileName.lower().endswith('.m4b'):
+                self._readMp4Details(mutagenSource, tagDetails)
 
-            # If we have had to copy the file locally, check if we need to also
-            # get the image as well, otherwise we might copy the file twice
-            if copiedFile not in [None, ""]:
-                if self._getExistingCoverImage() in [None, ""]:
-                    self._saveAlbumArtFromMetadata(fullPath)
+            log("AudioBookHandler: title = %s, album = %s, duration = %d, chapters = %d" % (tagDetails['title'], tagDetails['album'], tagDetails['duration'], len(tagDetails['chapters'])))
         except:
-            log("AudioBookHandler: Failed to read metadata for audio book %s, %s" % (fullPath, traceback.format_exc()))
-            title = None
-            album = None
-            artist = None
-            duration = None
+            log("AudioBookHandler: Failed to read metadata for audio book %s, %s" % (inputFileName, traceback.format_exc()))
+            tagDetails = None
 
-        # If we had to copy the file locally, make sure we delete it
-        self._removeCopiedFile(copiedFile)
+        self._closeMutagenSource(mutagenSource, copiedFile)
+
+        return tagDetails
+
+    # Reads the chapters straight from the boxes of an MP4 file, along with the
+    # duration and cover if mutagen did not find them
+    def _readMp4Details(self, mutagenSource, tagDetails):
+        mp4File = self._openMutagenSource(mutagenSource)
+        if mp4File is None:
+            return
+
+        mp4Details = None
+        try:
+            mp4Details = MP4Reader(mp4File).getDetails()
+        except:
+            log("AudioBookHandler: Failed to read MP4 boxes, %s" % traceback.format_exc())
+
+        if mp4File is not mutagenSource:
+            mp4File.close()
+
+        if mp4Details is None:
+            return
+
+        if tagDetails['duration'] in [None, 0, -1]:
+            tagDetails['duration'] = mp4Details['duration']
+        if tagDetails['coverData'] in [None, ""]:
+            tagDetails['coverData'] = mp4Details['coverData']
 
-        return title, album, artist, duration
+        chapterTimes = []
+        for startTime, chapterTitle in mp4Details['chapters']:
+            chapterTimes.append((startTime, None, chapterTitle))
+        tagDetails['chapters'] = _getChapterList(chapterTimes, tagDetails['duration'])
 
     def _saveAlbumArtFromMetadata(self, inputFileName):
         log("AudioBookHandler: Saving album art for audio book %s" % inputFileName)
 
-        # If the file is not local, we might need to copy it
-        fullPath = inputFileName
-        copiedFile = self._getCopiedFileIfNeeded(inputFileName)
-        if copiedFile not in [None, ""]:
-            fullPath = copiedFile
+        # Copy the image straight out of a local file if possible, so it is not all
+        # read into memory, the tags are only parsed if it could not be found
+        coverFile = self._copyCoverFromFile(inputFileName)
+        if coverFile not in [None, ""]:
+            return coverFile
 
-        coverArt = None
-        try:
-            mutagenFile = None
-            # First try with the default encoding
-            try:
-                mutagenFile = mutagen.File(fullPath)
-            except:
-                log("AudioBookHandler: Failed to read art work for audio book %s, %s" % (fullPath, traceback.format_exc()))
-                try:
-                    fullPath = fullPath.encode('utf-8')
-                    mutagenFile = mutagen.File(fullPath)
-                except:
-                    log("AudioBookHandler: Failed to encode as utf-8, %s" % traceback.format_exc())
+        tagDetails = self._readTags(inputFileName)
+        if (tagDetails is None) or (tagDetails['coverData'] in [None, ""]):
+            return None
 
-            mutagenFile = mutagen.File(fullPath)
+        return self._saveCoverData(tagDetails['coverData'])
 
-            if mutagenFile not in [None, ""]:
-                # Get the name that the cached cover will have been stored as
-                targetFile = self._getMainCoverLocation()
-                log("AudioBookHandler: Cached cover target: %s" % targetFile)
+    # Copies the cover image from a local file into the cover cache without parsing
+    # the tags, returns None if the position of the image could not be found. Files
+    # on network shares are not read this way, as finding the image could need a
+    # full copy of the file or many small remote reads, so their tags are used
+    def _copyCoverFromFile(self, inputFileName):
+        if ("://" in inputFileName) or (not os.path.exists(inputFileName)):
+            return None
 
-                # First try without encoding
-                try:
-                    # Check to see if the pictures attribute is there
-                    if hasattr(mutagenFile, 'pictures'):
-                        log("AudioBookHandler: Found pictures attribute")
-                        if len(mutagenFile.pictures) > 0:
-                            # write artwork to new image
-                            with open(targetFile, 'wb') as img:
-                                img.write(mutagenFile.pictures[0].data)
-                            coverArt = targetFile
-
-                    if (coverArt in [None, ""]) and ('covr' in mutagenFile):
-                        log("AudioBookHandler: Found COVR attribute")
-                        if len(mutagenFile['covr']) > 0:
-                            with open(targetFile, 'wb') as img:
-                                img.write(mutagenFile['covr'][0])
-                            coverArt = targetFile
-
-                    if (coverArt in [None, ""]):
-                        for aTag in mutagenFile:
-                            if 'APIC:' in aTag:
-                                log("AudioBookHandler: Found APIC: attribute: %s" % aTag)
-                                with open(targetFile, 'wb') as img:
-                                    img.write(mutagenFile[aTag].data)
-                                coverArt = targetFile
-                                break
-                except:
-                    log("AudioBookHandler: Failed to save Album Art without encoding, %s" % traceback.format_exc())
-                    try:
-                        targetFile = targetFile.encode('utf-8')
-                        # Check to see if the pictures attribute is there
-                        if hasattr(mutagenFile, 'pictures'):
-                            log("AudioBookHandler: Found pictures attribute")
-                            if len(mutagenFile.pictures) > 0:
-                                # write artwork to new image
-                                with open(targetFile, 'wb') as img:
-                                    img.write(mutagenFile.pictures[0].data)
-                                coverArt = targetFile
-
-                        if (coverArt in [None, ""]) and ('covr' in mutagenFile):
-                            log("AudioBookHandler: Found COVR attribute")
-                            if len(mutagenFile['covr']) > 0:
-                                with open(targetFile, 'wb') as img:
-                                    img.write(mutagenFile['covr'][0])
-                                coverArt = targetFile
-
-                        if (coverArt in [None, ""]):
-                            for aTag in mutagenFile:
-                                if 'APIC:' in aTag:
-                                    log("AudioBookHandler: Found APIC: attribute: %s" % aTag)
-                                    with open(targetFile, 'wb') as img:
-                                        img.write(mutagenFile[aTag].data)
-                                    coverArt = targetFile
-                                    break
-                    except:
-                        log("AudioBookHandler: Failed to encode as utf-8, %s" % traceback.format_exc())
+        mediaFile = self._openMutagenSource(inputFileName)
+        if mediaFile is None:
+            return None
 
-            del mutagenFile
+        targetFile = None
+        try:
+            coverTarget = self._getMainCoverLocation()
+            if CoverReader.saveCover(mediaFile, coverTarget):
+                CoverCache.addCover(coverTarget)
+                targetFile = coverTarget
         except:
-            log("AudioBookHandler: Failed to read art work for audio book %s, %s" % (fullPath, traceback.format_exc()))
-            coverArt = None
+            log("AudioBookHandler: Failed to copy cover from %s, %s" % (inputFileName, traceback.format_exc()))
 
-        # If we had to copy the file locally, make sure we delete it
-        self._removeCopiedFile(copiedFile)
+        mediaFile.close()
+        return targetFile
 
-        return coverArt
+    # Saves the cover image read from the tags into the cover cache
+    def _saveCoverData(self, coverData):
+        # Get the name that the cached cover will have been stored as
+        targetFile = self._getMainCoverLocation()
+        log("AudioBookHandler: Cached cover target: %s" % targetFile)
+
+        # First try without encoding
+        try:
+            with open(targetFile, 'wb') as img:
+                img.write(coverData)
+        except:
+            log("AudioBookHandler: Failed to save Album Art without encoding, %s" % traceback.format_exc())
+            try:
+                targetFile = targetFile.encode('utf-8')
+                with open(targetFile, 'wb') as img:
+                    img.write(coverData)
+            except:
+                log("AudioBookHandler: Failed to encode as utf-8, %s" % traceback.format_exc())
+                return None
+
+        CoverCache.addCover(targetFile)
+        return targetFile
 
     # Will load the basic details needed for simple listings
     def _loadDetails(self):
         log("AudioBookHandler: Loading audio book %s (%s)" % (self.filePath, self.fileName))
 
         # Check in the database to see if this audio book is already recorded
-        audiobookDB = AudioBooksDB()
+        audiobookDB = AudioBooksDB.getInstance()
         audiobookDetails = audiobookDB.getAudioBookDetails(self.filePath)
 
         if audiobookDetails not in [None, ""]:
-            # Convert to unicode when reading from DB. This fixes problems when
-            # comparing to new items returned by mutagen which are unicode.
-            try:
-                self.title = audiobookDetails['title'].decode('utf-8')
-            except:
-                self.title = audiobookDetails['title']
-
-            self.numChapters = audiobookDetails['numChapters']
-            self.position = audiobookDetails['position']
-            self.chapterPosition = audiobookDetails['chapterPosition']
-            self.isComplete = audiobookDetails['complete']
-            self.hasArtwork = audiobookDetails['hasArtwork']
+            self._applyDetails(audiobookDetails)
         else:
             self.position = 0
             self.chapterPosition = 0
@@ -264,12 +405,177 @@ class AudioBookHandler():
 
             self.numChapters = len(self.chapters)
 
-            # Now update the database entry for this audio book
-            audiobookDB.addAudioBook(self.filePath, self.title, self.numChapters)
+            if self.holdWrites:
+                self.pendingNewBook = True
+            else:
+                self._saveNewBook()
+
+    # Adds the details of a book that has just been read to the database
+    def _saveNewBook(self):
+        if self.readAborted:
+            log("AudioBookHandler: Not storing %s as reading was stopped" % self.filePath)
+            return
+        audiobookDB = AudioBooksDB.getInstance()
+        audiobookDB.addAudioBook(self.filePath, self.title, self.numChapters, self._getFingerprint(), self.artist, self.album)
+
+        # If the chapters were read as part of the scan, store them so
+        # they do not need to be read again
+        if self.numChapters > 0:
+            self._storeChapters()
+
+    # Stops the details read for this book being written to the database straight
+    # away, so that the media can be read without holding the database lock
+    def holdDatabaseWrites(self):
+        self.holdWrites = True
+
+    # Writes the details that were held back, this should be done in a transaction
+    # along with those of the other books being read
+    def savePendingWrites(self):
+        if self.pendingNewBook:
+            self._saveNewBook()
+        if self.pendingArtwork:
+            AudioBooksDB.getInstance().setHasArtwork(self.filePath, self.hasArtwork)
+        self.pendingNewBook = False
+        self.pendingArtwork = False
+
+    # Sets the values for this book using the details read from the database
+    def _applyDetails(self, audiobookDetails):
+        # Convert to unicode when reading from DB. This fixes problems when
+        # comparing to new items returned by mutagen which are unicode.
+        try:
+            self.title = audiobookDetails['title'].decode('utf-8')
+        except:
+            self.title = audiobookDetails['title']
+
+        self.numChapters = audiobookDetails['numChapters']
+        self.artist = audiobookDetails['artist']
+        self.album = audiobookDetails['album']
+        self.position = audiobookDetails['position']
+        self.chapterPosition = audiobookDetails['chapterPosition']
+        self.isComplete = audiobookDetails['complete']
+        self.hasArtwork = audiobookDetails['hasArtwork']
+        if audiobookDetails['duration'] not in [None, "", 0, -1]:
+            self.totalDuration = audiobookDetails['duration']
+
+    # Loads the chapters that were stored in the database when the book was
+    # scanned, returns True if they were found
+    def _loadStoredChapters(self):
+        audiobookDB = AudioBooksDB.getInstance()
+        storedChapters = audiobookDB.getChapters(self.filePath)
+
+        if storedChapters is None:
+            return False
+
+        chapters = []
+        chapterFiles = []
+        for storedChapter in storedChapters:
+            # Convert to unicode when reading from DB, in the same way as the title
+            try:
+                storedChapter['title'] = storedChapter['title'].decode('utf-8')
+            except:
+                pass
+            storedChapter.pop('fingerprint')
+            chapterFile = storedChapter.pop('filePath')
+            if chapterFile not in [None, ""]:
+                try:
+                    chapterFile = chapterFile.decode('utf-8')
+                except:
+                    pass
+                chapterFiles.append(chapterFile)
+            chapters.append(storedChapter)
+
+        self.chapters = chapters
+        self._setChapterFiles(chapterFiles)
+        self.numChapters = len(self.chapters)
+
+        # The duration is set by the end of the last chapter
+        if (len(self.chapters) > 0) and (self.chapters[-1]['endTime'] > 0):
+            self.totalDuration = self.chapters[-1]['endTime']
+        return True
+
+    # Saves the chapters that have been read from the media into the database
+    def _storeChapters(self):
+        if self.readAborted:
+            log("AudioBookHandler: Not storing chapters for %s as reading was stopped" % self.filePath)
+            return
+        audiobookDB = AudioBooksDB.getInstance()
+        audiobookDB.setChapters(self.filePath, self.chapters, self._getChapterFiles(), self.totalDuration, self._getChapterFingerprints())
+
+    # Checks if the media for this book has changed since it was last scanned, if
+    # it has then the details are read again, keeping the listening progress
+    # Returns True if the book needed to be scanned
+    def refreshIfChanged(self):
+        audiobookDB = AudioBooksDB.getInstance()
+        audiobookDetails = audiobookDB.getAudioBookDetails(self.filePath)
+
+        # If the book has never been scanned, then just do the normal load
+        if audiobookDetails in [None, ""]:
+            self._loadDetails()
+            return True
+
+        self._applyDetails(audiobookDetails)
+        fingerprint = self._getFingerprint()
+        if (fingerprint not in [None, ""]) and (fingerprint == audiobookDetails['fingerprint']):
+            log("AudioBookHandler: No change to %s" % self.filePath)
+            return False
+
+        log("AudioBookHandler: Media has changed for %s, rescanning" % self.filePath)
+
+        # Any chapters already stored can be used for the parts that have not changed
+        storedChapters = audiobookDB.getChapters(self.filePath)
+
+        self.title = None
+        self.artist = None
+        self.album = None
+        self.chapters = []
+        self._setChapterFiles([])
+        self.totalDuration = -1
+        self._loadBookDetails(storedChapters)
+
+        if self.title in [None, ""]:
+            log("AudioBookHandler: No title found for %s, trying ffmpeg load" % self.filePath)
+            self._loadDetailsFromFfmpeg()
+        elif len(self.chapters) < 1:
+            self._loadDetailsFromFfmpeg(includeCover=False)
+
+        if self.title in [None, ""]:
+            log("AudioBookHandler: No title found for %s, using filename" % self.filePath)
+            self.title = self._getFallbackTitle()
+
+        self.numChapters = len(self.chapters)
+
+        # Keep the details that were stored before rather than the partial ones
+        if self.readAborted:
+            log("AudioBookHandler: Not updating %s as reading was stopped" % self.filePath)
+            return True
 
-        del audiobookDB
+        audiobookDB.updateAudioBook(self.filePath, self.title, self.numChapters, self._getFingerprint(), self.artist, self.album)
+        self._storeChapters()
+        return True
 
-    def _loadBookDetails(self):
+    # Records the artist and album for the book, the first values found are used
+    def _setArtistAlbum(self, artist, album):
+        if (self.artist in [None, ""]) and (artist not in [None, ""]):
+            self.artist = artist
+        if (self.album in [None, ""]) and (album not in [None, ""]):
+            self.album = album
+
+    # Gets a value that will change if the media for this book changes
+    def _getFingerprint(self):
+        return file_fingerprint(self.filePath)
+
+    def _setChapterFiles(self, chapterFiles):
+        pass
+
+    def _getChapterFiles(self):
+        return None
+
+    def _getChapterFingerprints(self):
+        return None
+
+    # Reads the details from the media, storedChapters are the chapters that were
+    # previously stored for this book (if any) and can be used if not changed
+    def _loadBookDetails(self, storedChapters=None):
         pass
 
     def _loadDetailsFromFfmpeg(self, includeCover=True):
@@ -289,6 +595,10 @@ class AudioBookHandler():
             self._loadDetails()
         return self.title
 
+    # Gets the key to sort the book by, the title is loaded if it is not already known
+    def getSortKey(self):
+        return get_sort_key(self.getTitle())
+
     def getCoverImage(self, tryUtf8=False):
         if self.coverImage is None:
             # Check to see if we already have an image available
@@ -308,13 +618,17 @@ class AudioBookHandler():
                 self._loadDetailsFromFfmpeg()
 
             # Check if we have now found artwork that we want to store
-            audiobookDB = AudioBooksDB()
+            previousArtwork = self.hasArtwork
             self.hasArtwork = 0
             if self.coverImage not in [None, ""]:
                 self.hasArtwork = 1
-            # Update the database with the artwork status
-            audiobookDB.setHasArtwork(self.filePath, self.hasArtwork)
-            del audiobookDB
+            # Update the database with the artwork status, only if it has changed
+            if previousArtwork != self.hasArtwork:
+                if self.holdWrites:
+                    self.pendingArtwork = True
+                else:
+                    audiobookDB = AudioBooksDB.getInstance()
+                    audiobookDB.setHasArtwork(self.filePath, self.hasArtwork)
 
         coverImageValue = self.coverImage
         # Make sure the cover is correctly encoded
@@ -334,7 +648,7 @@ class AudioBookHandler():
             fullpathLocalImage, bookExt = os.path.splitext(self.filePath)
             fullpathLocalImage = "%s-fanart.jpg" % fullpathLocalImage
 
-            if xbmcvfs.exists(fullpathLocalImage):
+            if file_exists(fullpathLocalImage):
                 log("AudioBookHandler: Found book fanart image %s" % fullpathLocalImage)
                 return fullpathLocalImage
 
@@ -343,7 +657,7 @@ class AudioBookHandler():
 
         # Now check if there is a default fanart file
         fanartImage = FANART
-        subdirs, filesInDir = xbmcvfs.listdir(baseDirectory)
+        subdirs, filesInDir = list_dir(baseDirectory)
         for fileInDir in filesInDir:
             if fileInDir.lower() in ['fanart.jpg', 'fanart.png']:
                 fanartImage = os_path_join(baseDirectory, fileInDir)
@@ -357,14 +671,26 @@ class AudioBookHandler():
         return self.position, self.chapterPosition
 
     def getChapterDetails(self):
-        # If the chapter information has not been loaded yet, then we need to load it
-        if len(self.chapters) < 1:
+        # If the chapter information has not been loaded yet, then check if
+        # it was stored when the book was scanned
+        if (len(self.chapters) < 1) and (not self._loadStoredChapters()):
+            # Not stored, so need to read it from the media
             self._loadBookDetails()
-        if len(self.chapters) < 1:
-            self._loadDetailsFromFfmpeg(includeCover=False)
+            if len(self.chapters) < 1:
+                self._loadDetailsFromFfmpeg(includeCover=False)
+            # Only store chapters that were found, so the book is read again next time
+            # (for example once ffmpeg has been set up)
+            if len(self.chapters) > 0:
+                self._storeChapters()
         return self.chapters
 
     def getTotalDuration(self):
+        if self.totalDuration < 1:
+            # Check the details stored in the database first
+            if self.title in [None, ""]:
+                self._loadDetails()
+            if self.totalDuration < 1:
+                self.getChapterDetails()
         if self.totalDuration < 0:
             # The duration is actually set by the last chapter
             self._loadBookDetails()
@@ -444,16 +770,16 @@ class AudioBookHandler():
             fullpathLocalImage3 = "%s.png" % fullpathLocalImage
             fullpathLocalImage4 = "%s.PNG" % fullpathLocalImage
 
-            if xbmcvfs.exists(fullpathLocalImage1):
+            if file_exists(fullpathLocalImage1):
                 log("AudioBookHandler: Found local cached image %s" % fullpathLocalImage1)
                 return fullpathLocalImage1
-            if xbmcvfs.exists(fullpathLocalImage2):
+            if file_exists(fullpathLocalImage2):
                 log("AudioBookHandler: Found local cached image %s" % fullpathLocalImage2)
                 return fullpathLocalImage2
-            if xbmcvfs.exists(fullpathLocalImage3):
+            if file_exists(fullpathLocalImage3):
                 log("AudioBookHandler: Found local cached image %s" % fullpathLocalImage3)
                 return fullpathLocalImage3
-            if xbmcvfs.exists(fullpathLocalImage4):
+            if file_exists(fullpathLocalImage4):
                 log("AudioBookHandler: Found local cached image %s" % fullpathLocalImage4)
                 return fullpathLocalImage4
 
@@ -462,7 +788,7 @@ class AudioBookHandler():
 
         # Check for a file in the same directory but with the name
         # "cover.jpg" or "folder.jpg
-        dirs, files = xbmcvfs.listdir(parentPath)
+        dirs, files = list_dir(parentPath)
         for file in files:
             if file.lower() in ['folder.jpg', 'cover.jpg', 'folder.png', 'cover.png']:
                 fullpathLocalImage = os_path_join(parentPath, file)
@@ -474,31 +800,7 @@ class AudioBookHandler():
 
     # Checks the cache to see if there is a cover for this audiobook
     def _getCachedCover(self, fileName):
-        cachedCover = None
-        # check if the directory exists before searching
-        dirs, files = xbmcvfs.listdir(Settings.getCoverCacheLocation())
-        for aFile in files:
-            # Get the filename without extension
-            coverSrc, ext = os.path.splitext(aFile)
-
-            # Get the name that the cached cover will have been stored as
-            targetSrc, bookExt = os.path.splitext(fileName)
-
-            # Make sure both are utf-8 when comparing
-            try:
-                coverSrc = coverSrc.encode("utf-8")
-            except:
-                pass
-            try:
-                targetSrc = targetSrc.encode("utf-8")
-            except:
-                pass
-
-            if targetSrc == coverSrc:
-                cachedCover = os_path_join(Settings.getCoverCacheLocation(), aFile)
-                log("AudioBookHandler: Cached cover found: %s" % cachedCover)
-
-        return cachedCover
+        return CoverCache.getCachedCover(fileName)
 
     def _getFallbackTitle(self):
         # Remove anything after the final dot
@@ -528,12 +830,7 @@ class AudioBookHandler():
             fullFileName = copiedFile
 
         # Check if we need the image
-        coverTempName = None
-        if coverTargetName not in [None, '']:
-            coverTempName = os_path_join(Settings.getTempLocation(), 'maincover.jpg')
-            # Remove the temporary name if it is already there
-            if xbmcvfs.exists(coverTempName):
-                xbmcvfs.delete(coverTempName)
+        coverTempName = self._getCoverTempName(coverTargetName)
 
         # Now make the call to gather the information
         ffmpegOutput = ffmpegCmds.getMediaInfo(fullFileName, coverTempName)
@@ -542,6 +839,24 @@ class AudioBookHandler():
         # If we had to copy the file locally, make sure we delete it
         self._removeCopiedFile(copiedFile)
 
+        self._moveCoverToCache(coverTempName, coverTargetName)
+
+        return ffmpegOutput
+
+    # Gets the temporary file that ffmpeg saves the cover image to, None if the
+    # cover is not needed
+    def _getCoverTempName(self, coverTargetName):
+        if coverTargetName in [None, '']:
+            return None
+        # The name needs to be different for each thread, as more than one may be running
+        coverTempName = os_path_join(Settings.getTempLocation(), 'maincover_%s_%s.jpg' % (INSTANCE_TOKEN, threading.current_thread().name))
+        # Remove the temporary name if it is already there
+        if xbmcvfs.exists(coverTempName):
+            xbmcvfs.delete(coverTempName)
+        return coverTempName
+
+    # Moves the image that ffmpeg saved (if there was one) into the cover cache
+    def _moveCoverToCache(self, coverTempName, coverTargetName):
         # Check if there is an image in the temporary location
         if coverTempName not in [None, ""]:
             if xbmcvfs.exists(coverTempName):
@@ -549,18 +864,59 @@ class AudioBookHandler():
                 copy = xbmcvfs.copy(coverTempName, coverTargetName)
                 if copy:
                     log("AudioBookHandler: copy successful for %s" % coverTargetName)
+                    CoverCache.addCover(coverTargetName)
                 else:
                     log("AudioBookHandler: copy failed from %s to %s" % (coverTempName, coverTargetName))
 
                 # Tidy up the image that we actually do not need
                 xbmcvfs.delete(coverTempName)
 
-        return ffmpegOutput
+    # Runs ffmpeg for several files at once, returning the details for each of them
+    # in the same order, if a cover target is given the image in the first file is
+    # saved by the same call
+    def _runFFmpegBatchCommand(self, inputFileNames, coverTargetName=None):
+        ffmpegCmds = FfmpegBase.createHandler()
+
+        if ffmpegCmds in [None, ""]:
+            log("AudioBookHandler: ffmpeg not enabled")
+            return [None] * len(inputFileNames)
+
+        log("AudioBookHandler: Running ffmpeg for %d files" % len(inputFileNames))
+
+        coverTempName = self._getCoverTempName(coverTargetName)
+        batchCover = coverTempName
+
+        ffmpegOutputs = []
+        # The files are read a batch at a time, so only the local copies that are
+        # needed for the current batch are held rather than those for every file
+        for batchStart in range(0, len(inputFileNames), FFMPEG_BATCH_SIZE):
+            # Any files on network shares need to be copied locally first
+            copiedFiles = []
+            fullFileNames = []
+            for inputFileName in inputFileNames[batchStart:batchStart + FFMPEG_BATCH_SIZE]:
+                copiedFile = self._getCopiedFileIfNeeded(inputFileName)
+                copiedFiles.append(copiedFile)
+                if copiedFile not in [None, ""]:
+                    fullFileNames.append(copiedFile)
+                else:
+                    fullFileNames.append(inputFileName)
+
+            ffmpegOutputs.extend(ffmpegCmds.getMediaInfoList(fullFileNames, batchCover))
+            # The cover is only read from the first file
+            batchCover = None
+
+            for copiedFile in copiedFiles:
+                self._removeCopiedFile(copiedFile)
+        del ffmpegCmds
+
+        self._moveCoverToCache(coverTempName, coverTargetName)
+
+        return ffmpegOutputs
 
     def _getMainCoverLocation(self):
         coverFileName, oldExt = os.path.splitext(self.fileName)
         targetCoverName = "%s.jpg" % coverFileName
-        coverTargetName = os_path_join(Settings.getCoverCacheLocation(), targetCoverName)
+        coverTargetName = os_path_join(CoverCache.getLocation(), targetCoverName)
 
         log("AudioBookHandler: Cached cover target location is %s" % coverTargetName)
         return coverTargetName
@@ -579,9 +935,16 @@ class M4BHandler(AudioBookHandler):
     def __init__(self, audioBookFilePath):
         AudioBookHandler.__init__(self, audioBookFilePath)
 
-    def _loadBookDetails(self):
+    def _loadBookDetails(self, storedChapters=None):
         # For the m4b book details we can just read from the meta data
-        title, album, artist, duration = self._readMetaData(self.filePath)
+        tagDetails = self._readMetaData(self.filePath)
+        if tagDetails is None:
+            return
+
+        title = tagDetails['title']
+        artist = tagDetails['artist']
+        duration = tagDetails['duration']
+        self._setArtistAlbum(artist, tagDetails['album'])
 
         if title not in [None, ""]:
             self.title = title
@@ -599,6 +962,10 @@ class M4BHandler(AudioBookHandler):
         if duration not in [None, "", 0, -1]:
             self.totalDuration = duration
 
+        # If the chapters were read from the file then ffmpeg does not need to be used
+        if len(tagDetails['chapters']) > 0:
+            self.chapters = tagDetails['chapters']
+
     # Will load the basic details needed for simple listings
     def _loadDetailsFromFfmpeg(self, includeCover=True):
         # check if the cover is required
@@ -615,6 +982,7 @@ class M4BHandler(AudioBookHandler):
 
         if info not in [None, ""]:
             self.title = info['title']
+            self._setArtistAlbum(info['artist'], info['album'])
 
             # Check if the title should start with the artist name
             if Settings.isShowArtistInBookList() and (self.title not in [None, ""]):
@@ -644,23 +1012,89 @@ class FolderHandler(AudioBookHandler):
         AudioBookHandler.__init__(self, audioBookFilePath)
         # The fileName value will be the directory name for Folder audiobooks
         self.chapterFiles = []
+        self.chapterFingerprints = []
+
+    def _setChapterFiles(self, chapterFiles):
+        self.chapterFiles = chapterFiles
+        self.chapterFingerprints = []
+
+    def _getChapterFiles(self):
+        return self.chapterFiles
+
+    def _getChapterFingerprints(self):
+        return self.chapterFingerprints
+
+    # The fingerprint of a folder book is made up from the fingerprint of
+    # every track, so it changes if any track is added, removed or modified
+    def _getFingerprint(self):
+        trackFingerprints = self.chapterFingerprints
+        trackFiles = self.chapterFiles
+        if (len(trackFingerprints) < 1) or (len(trackFingerprints) != len(trackFiles)):
+            dirs, files = list_dir(self.filePath)
+            files.sort()
+            trackFiles = []
+            trackFingerprints = []
+            for audioFile in files:
+                if Settings.isPlainAudioFile(audioFile):
+                    fullpath = os_path_join(self.filePath, audioFile)
+                    trackFiles.append(fullpath)
+                    trackFingerprints.append(file_fingerprint(fullpath))
+
+        if None in trackFingerprints:
+            return None
 
-    def _loadBookDetails(self):
+        fingerprintDetails = []
+        for trackFile, trackFingerprint in zip(trackFiles, trackFingerprints):
+            fingerprintDetails.append("%s|%s" % (os_path_split(trackFile)[-1], trackFingerprint))
+        return hashlib.md5('\n'.join(fingerprintDetails).encode('utf-8')).hexdigest()
+
+    def _loadBookDetails(self, storedChapters=None):
         # List all the files in the directory, as that will be the chapters
-        dirs, files = xbmcvfs.listdir(self.filePath)
+        dirs, files = list_dir(self.filePath)
         files.sort()
 
-        runningStartTime = 0
+        # Start with a clean list as this may be a reload
+        self.chapters = []
+        self.chapterFiles = []
+        self.chapterFingerprints = []
+
+        # Get the tracks that have been scanned before, so that any that
+        # have not changed do not need to be read again
+        knownTracks = {}
+        if storedChapters not in [None, ""]:
+            for storedChapter in storedChapters:
+                if storedChapter['fingerprint'] not in [None, ""]:
+                    try:
+                        knownTracks[storedChapter['filePath'].decode('utf-8')] = storedChapter
+                    except:
+                        knownTracks[storedChapter['filePath']] = storedChapter
+
+        # Read the details of several tracks at once, most of the time is spent
+        # waiting on the file so this makes a big difference for network shares
+        audioFiles = []
+        trackArgs = []
         for audioFile in files:
-            if not Settings.isPlainAudioFile(audioFile):
-                continue
+            if Settings.isPlainAudioFile(audioFile):
+                audioFiles.append(audioFile)
+                trackArgs.append((os_path_join(self.filePath, audioFile), knownTracks))
+        threadPool = ThreadPool(Settings.getMetadataWorkers())
+        trackDetails = threadPool.map(self._readTrackDetails, trackArgs)
+        if threadPool.isAborted():
+            log("FolderHandler: Reading of %s was stopped, details are incomplete" % self.filePath)
+            self.readAborted = True
 
+        runningStartTime = 0
+        for audioFile, trackArg, trackDetail in zip(audioFiles, trackArgs, trackDetails):
             # Store this audio file in the chapter file list
-            fullpath = os_path_join(self.filePath, audioFile)
-            self.chapterFiles.append(fullpath)
+            self.chapterFiles.append(trackArg[0])
 
-            # Make the call to metadata to get the details of the chapter
-            title, album, artist, duration = self._readMetaData(fullpath)
+            # There will be no details if Kodi is shutting down
+            if trackDetail is None:
+                trackDetail = (None, None, None, None, None)
+            fingerprint, title, album, artist, duration = trackDetail
+            self.chapterFingerprints.append(fingerprint)
+            # This is done in track order so the first values found are always used
+            self._setArtistAlbum(artist, album)
 
             chapterTitle = None
             endTime = 0
@@ -698,10 +1132,50 @@ class FolderHandler(AudioBookHandler):
         if runningStartTime > 0:
             self.totalDuration = runningStartTime
 
+        # If the stored details were used for the tracks then the album name will not
+        # have been read, so get it from the first track
+        if (self.title in [None, ""]) and (len(knownTracks) > 0) and (len(self.chapterFiles) > 0):
+            tagDetails = self._readMetaData(self.chapterFiles[0])
+            album = None
+            artist = None
+            if tagDetails is not None:
+                album = tagDetails['album']
+                artist = tagDetails['artist']
+            self._setArtistAlbum(artist, album)
+            if album not in [None, ""]:
+                self.title = album
+                if Settings.isShowArtistInBookList() and (artist not in [None, ""]):
+                    if (not album.startswith(artist)) and (not album.endswith(artist)):
+                        try:
+                            self.title = "%s - %s" % (artist, album)
+                        except:
+                            log("FolderHandler: Failed to add artist to title")
+
+    # Gets the fingerprint and details for a single track, if the track has not
+    # changed since it was stored then the stored details are used
+    def _readTrackDetails(self, fullpath, knownTracks):
+        fingerprint = file_fingerprint(fullpath)
+
+        knownTrack = knownTracks.get(fullpath, None)
+        if (knownTrack is not None) and (fingerprint is not None) and (knownTrack['fingerprint'] == fingerprint):
+            log("FolderHandler: Using stored details for unchanged track %s" % fullpath)
+            title = knownTrack['title']
+            try:
+                title = title.decode('utf-8')
+            except:
+                pass
+            return fingerprint, title, None, None, knownTrack['duration']
+
+        # Make the call to metadata to get the details of the chapter
+        tagDetails = self._readMetaData(fullpath)
+        if tagDetails is None:
+            return fingerprint, None, None, None, None
+        return fingerprint, tagDetails['title'], tagDetails['album'], tagDetails['artist'], tagDetails['duration']
+
     # Will load the basic details needed for simple listings
     def _loadDetailsFromFfmpeg(self, includeCover=True):
         # List all the files in the directory, as that will be the chapters
-        dirs, files = xbmcvfs.listdir(self.filePath)
+        dirs, files = list_dir(self.filePath)
         files.sort()
 
         # Check if the cover image is required
@@ -709,29 +1183,77 @@ class FolderHandler(AudioBookHandler):
         if includeCover and (self.coverImage in [None, ""]):
             coverTargetName = self._getMainCoverLocation()
 
-        runningStartTime = 0
-        for audioFile in files:
-            if not Settings.isPlainAudioFile(audioFile):
-                continue
+        # Start with a clean list as this may be a reload
+        self.chapters = []
+        self.chapterFiles = []
+        self.chapterFingerprints = []
 
-            # Store this audio file in the chapter file list
-            fullpath = os_path_join(self.filePath, audioFile)
-            self.chapterFiles.append(fullpath)
+        audioFiles = []
+        for audioFile in files:
+            if Settings.isPlainAudioFile(audioFile):
+                audioFiles.append(audioFile)
+                # Store this audio file in the chapter file list
+                fullpath = os_path_join(self.filePath, audioFile)
+                self.chapterFiles.append(fullpath)
+                self.chapterFingerprints.append(file_fingerprint(fullpath))
 
-            # Make the call to ffmpeg to get the details of the chapter
-            info = self._runFFmpegCommand(fullpath, coverTargetName)
+        ffmpegCmds = FfmpegBase.createHandler()
+        if (ffmpegCmds not in [None, ""]) and ffmpegCmds.supportsBatchCalls():
+            # All the tracks are read by one process, which also saves the cover
+            # from the first track
+            trackInfos = self._runFFmpegBatchCommand(self.chapterFiles, coverTargetName)
+            trackCovers = [coverTargetName] * len(self.chapterFiles)
+        else:
+            # If ffmpeg is being run as a separate process then several tracks can be read at
+            # once, each saves any cover to its own file so the one used is always from the
+            # first track that has a cover
+            numWorkers = 1
+            if (ffmpegCmds not in [None, ""]) and ffmpegCmds.supportsConcurrentCalls():
+                numWorkers = Settings.getMetadataWorkers()
+
+            trackArgs = []
+            trackCovers = []
+            for idx, fullpath in enumerate(self.chapterFiles):
+                trackCover = None
+                if coverTargetName not in [None, ""]:
+                    trackCover = coverTargetName
+                    if numWorkers > 1:
+                        trackCover = os_path_join(Settings.getTempLocation(), 'trackcover_%s_%d.jpg' % (INSTANCE_TOKEN, idx))
+                trackCovers.append(trackCover)
+                trackArgs.append((fullpath, trackCover))
+
+            if numWorkers > 1:
+                trackInfos = ThreadPool(numWorkers).map(self._runFFmpegCommand, trackArgs)
+            else:
+                # Read one at a time so no more covers are read once one is found
+                trackInfos = []
+                for trackArg in trackArgs:
+                    if (coverTargetName not in [None, ""]) and xbmcvfs.exists(coverTargetName):
+                        trackArg = (trackArg[0], None)
+                    trackInfos.append(self._runFFmpegCommand(*trackArg))
+
+        # ffmpeg is stopped if Kodi is shutting down, so some tracks will have no details
+        if xbmc.Monitor().abortRequested():
+            log("FolderHandler: Reading of %s was stopped, details are incomplete" % self.filePath)
+            self.readAborted = True
 
+        runningStartTime = 0
+        for audioFile, trackCover, info in zip(audioFiles, trackCovers, trackInfos):
             # If we needed the cover, then save the details
             if coverTargetName not in [None, ""]:
+                if (trackCover != coverTargetName) and xbmcvfs.exists(trackCover):
+                    if not xbmcvfs.exists(coverTargetName):
+                        if xbmcvfs.copy(trackCover, coverTargetName):
+                            CoverCache.addCover(coverTargetName)
+                    xbmcvfs.delete(trackCover)
                 if xbmcvfs.exists(coverTargetName):
                     self.coverImage = coverTargetName
-                    # Clear the cover image flag so we do not get it again
-                    coverTargetName = None
 
             duration = 0
             chapterTitle = None
             endTime = 0
             if info not in [None, ""]:
+                self._setArtistAlbum(info['artist'], info['album'])
                 if self.title in [None, ""]:
                     self.title = info['album']
 
@@ -797,6 +1319,9 @@ class FolderHandler(AudioBookHandler):
 
     def getChapterPosition(self, filename):
         chapterPosition = 0
+        if len(self.chapterFiles) < 1:
+            # Use the chapters stored in the database if there are any
+            self.getChapterDetails()
         if len(self.chapterFiles) < 1:
             self._loadBookDetails()
             # Only load specific details if the basic version failed
@@ -826,7 +1351,7 @@ class FolderHandler(AudioBookHandler):
         return self.fileName.replace('.', ' ')
 
     def _saveAlbumArtFromMetadata(self, fullPath):
-        dirs, files = xbmcvfs.listdir(self.filePath)
+        dirs, files = list_dir(self.filePath)
 
         coverImg = None
         for audioFile in files:
@@ -843,7 +1368,7 @@ class FolderHandler(AudioBookHandler):
         # There is an extra check that we can make for folder audiobooks
         # so if one has not been found then look in the folder for folder.jpg
         if coverImg is None:
-            dirs, files = xbmcvfs.listdir(self.filePath)
+            dirs, files = list_dir(self.filePath)
 
             for coverFile in files:
                 if coverFile.lower() in ['folder.jpg', 'folder.png']:
@@ -81,6 +81,5 @@ class BookPlayer(xbmc.Player):
                     log("BookPlayer: Marking book as complete")
                     bookComplete = True
 
-            audiobookDB = AudioBooksDB()
+            audiobookDB = AudioBooksDB.getInstance()
             audiobookDB.setPosition(audioBookHandler.getFile(), currentTime, chapterPosition, bookComplete)
-            del audiobookDB
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import threading
+import xbmcvfs
+import xbmcgui
+
+# Import the common settings
+from settings import Settings
+from settings import log
+from settings import os_path_join
+from settings import os_path_split
+
+# Index of the covers in the cache, the name of the book (without extension)
+# maps to the name of the cover file
+COVER_INDEX = None
+COVER_LOCATION = None
+# The cache can be emptied by another invocation (the cleanup script), which
+# changes this home window property, so an index listed before then is not used
+CLEARED_PROPERTY = "script.audiobooks.coverCacheCleared"
+COVER_INDEX_CLEARED = None
+# Covers may be added by more than one thread at once
+INDEX_LOCK = threading.Lock()
+
+
+# Gets the name a book is indexed under, this is the name without extension
+# and is always utf-8 so names read from different places can be compared
+def _getCoverKey(fileName):
+    coverKey, ext = os.path.splitext(fileName)
+    try:
+        coverKey = coverKey.encode("utf-8")
+    except:
+        pass
+    return coverKey
+
+
+#########################################################
+# Class to find covers in the cover cache, the cache
+# directory is only listed the first time it is needed
+#########################################################
+class CoverCache():
+    # Gets the directory that the covers are stored in
+    @staticmethod
+    def getLocation():
+        global COVER_LOCATION
+        if COVER_LOCATION is None:
+            COVER_LOCATION = Settings.getCoverCacheLocation()
+        return COVER_LOCATION
+
+    # Gets the cached cover for the given book file (or directory) name, None if there is not one
+    @staticmethod
+    def getCachedCover(fileName):
+        coverFile = CoverCache._getIndex().get(_getCoverKey(fileName), None)
+        if coverFile is None:
+            return None
+
+        cachedCover = os_path_join(CoverCache.getLocation(), coverFile)
+        log("CoverCache: Cached cover found: %s" % cachedCover)
+        return cachedCover
+
+    # Records that a cover has been saved into the cache, covers that have been
+    # saved anywhere else (like the temp directory) are ignored
+    @staticmethod
+    def addCover(coverPath):
+        coverDir, coverFile = os_path_split(coverPath)
+        if os_path_join(coverDir, coverFile) != os_path_join(CoverCache.getLocation(), coverFile):
+            return
+        with INDEX_LOCK:
+            CoverCache._getIndex()[_getCoverKey(coverFile)] = coverFile
+
+    # Forgets all the covers, the cache will be listed again the next time it is used
+    @staticmethod
+    def clear():
+        global COVER_INDEX
+        global COVER_LOCATION
+        with INDEX_LOCK:
+            COVER_INDEX = None
+            COVER_LOCATION = None
+
+    # Records that the cache has been emptied, so that any other invocation that
+    # has already listed it (like the service) lists it again
+    @staticmethod
+    def markCleared():
+        xbmcgui.Window(10000).setProperty(CLEARED_PROPERTY, str(time.time()))
+        CoverCache.clear()
+
+    @staticmethod
+    def _getIndex():
+        global COVER_INDEX
+        global COVER_INDEX_CLEARED
+        clearedMarker = xbmcgui.Window(10000).getProperty(CLEARED_PROPERTY)
+        if (COVER_INDEX is not None) and (clearedMarker != COVER_INDEX_CLEARED):
+            log("CoverCache: Cache has been emptied since it was listed")
+            COVER_INDEX = None
+
+        if COVER_INDEX is None:
+            coverIndex = {}
+            dirs, files = xbmcvfs.listdir(CoverCache.getLocation())
+            for aFile in files:
+                coverIndex[_getCoverKey(aFile)] = aFile
+            log("CoverCache: %d covers in the cache" % len(coverIndex))
+            COVER_INDEX = coverIndex
+            COVER_INDEX_CLEARED = clearedMarker
+        return COVER_INDEX
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+import os
+import struct
+import traceback
+
+# Import the common settings
+from settings import log
+from mp4reader import MP4Reader
+
+# Amount of the image that is copied at a time
+COVER_CHUNK_SIZE = 64 * 1024
+
+# The most that is read to find where the image starts in a picture frame, this
+# only needs to hold the description and mime type
+MAX_PICTURE_HEADER_SIZE = 4096
+
+
+#########################################################
+# Class to copy the cover image stored in a media file
+# straight into the cover cache. Only the position of the
+# image is found, it is then copied a chunk at a time, so
+# large images are never held in memory. Reads ID3v2
+# (APIC/PIC frames), FLAC (PICTURE block) and MP4 (covr)
+#########################################################
+class CoverReader():
+    # Copies the cover in the file to the target, returning True if it was copied
+    @staticmethod
+    def saveCover(mediaFile, targetFile):
+        coverPosition = CoverReader.getCoverPosition(mediaFile)
+        if coverPosition is None:
+            return False
+
+        start, end = coverPosition
+        log("CoverReader: Copying %d bytes of cover image to %s" % (end - start, targetFile))
+
+        try:
+            img = open(targetFile, 'wb')
+        except:
+            img = open(targetFile.encode('utf-8'), 'wb')
+
+        copied = 0
+        try:
+            mediaFile.seek(start)
+            while start + copied < end:
+                chunk = mediaFile.read(min(COVER_CHUNK_SIZE, end - start - copied))
+                if len(chunk) < 1:
+                    break
+                img.write(chunk)
+                copied += len(chunk)
+        finally:
+            img.close()
+
+        # Do not leave part of an image in the cache
+        if copied < end - start:
+            log("CoverReader: Only copied %d of %d bytes of the cover image" % (copied, end - start))
+            try:
+                os.remove(targetFile)
+            except:
+                log("CoverReader: Failed to remove %s" % targetFile)
+            return False
+        return True
+
+    # Finds where the first cover image is in the file, returning the start and end
+    # of the image data, None if there is not one or it can not be copied directly
+    @staticmethod
+    def getCoverPosition(mediaFile):
+        try:
+            mediaFile.seek(0)
+            header = mediaFile.read(12)
+            if header[0:3] == b'ID3':
+                return CoverReader._getId3CoverPosition(mediaFile, header)
+            if header[0:4] == b'fLaC':
+                return CoverReader._getFlacCoverPosition(mediaFile)
+            if header[4:8] == b'ftyp':
+                return MP4Reader(mediaFile).getCoverPosition()
+        except:
+            log("CoverReader: Failed to find cover: %s" % traceback.format_exc())
+        return None
+
+    @staticmethod
+    def _getId3CoverPosition(mediaFile, header):
+        majorVersion = ord(header[3:4])
+        flags = ord(header[5:6])
+        tagEnd = 10 + CoverReader._getSyncsafeInt(header[6:10])
+
+        # If the whole tag is unsynchronised the image is not stored as it is
+        if (majorVersion not in [2, 3, 4]) or (flags & 0x80):
+            return None
+
+        position = 10
+        if flags & 0x40:
+            # Skip the extended header, in version 3 the size does not include itself
+            mediaFile.seek(position)
+            sizeData = mediaFile.read(4)
+            if majorVersion == 4:
+                position += CoverReader._getSyncsafeInt(sizeData)
+            else:
+                position += struct.unpack('>I', sizeData)[0] + 4
+
+        headerSize = 10
+        if majorVersion == 2:
+            headerSize = 6
+
+        while position + headerSize <= tagEnd:
+            mediaFile.seek(position)
+            frameHeader = mediaFile.read(headerSize)
+            if (len(frameHeader) < headerSize) or (frameHeader[0:1] == b'\x00'):
+                # Reached the padding
+                break
+
+            frameFlags = 0
+            if majorVersion == 2:
+                frameId = frameHeader[0:3]
+                frameSize = struct.unpack('>I', b'\x00' + frameHeader[3:6])[0]
+            else:
+                frameId = frameHeader[0:4]
+                if majorVersion == 4:
+                    frameSize = CoverReader._getSyncsafeInt(frameHeader[4:8])
+                else:
+                    frameSize = struct.unpack('>I', frameHeader[4:8])[0]
+                frameFlags = ord(frameHeader[9:10])
+
+            frameStart = position + headerSize
+            frameEnd = frameStart + frameSize
+            position = frameEnd
+
+            if frameId not in [b'APIC', b'PIC']:
+                continue
+
+            # Compressed, encrypted or unsynchronised frames are not stored as they are
+            if (majorVersion == 3) and (frameFlags & 0xe0):
+                return None
+            if (majorVersion == 4) and (frameFlags & 0x4f):
+                return None
+
+            return CoverReader._getPictureFramePosition(mediaFile, frameId, frameStart, frameEnd)
+        return None
+
+    # Finds where the image starts in an APIC (or version 2 PIC) frame, which has
+    # the text encoding, mime type (or image format), picture type and description
+    @staticmethod
+    def _getPictureFramePosition(mediaFile, frameId, frameStart, frameEnd):
+        mediaFile.seek(frameStart)
+        frameData = mediaFile.read(min(frameEnd - frameStart, MAX_PICTURE_HEADER_SIZE))
+        if len(frameData) < 4:
+            return None
+
+        encoding = ord(frameData[0:1])
+        if frameId == b'PIC':
+            position = 4
+        else:
+            mimeEnd = frameData.find(b'\x00', 1)
+            if mimeEnd < 0:
+                return None
+            position = mimeEnd + 1
+        # Skip the picture type
+        position += 1
+
+        # The description ends with a null, which is two bytes for UTF-16
+        if encoding in [1, 2]:
+            descriptionEnd = position
+            while True:
+                descriptionEnd = frameData.find(b'\x00\x00', descriptionEnd)
+                if (descriptionEnd < 0) or ((descriptionEnd - position) % 2 == 0):
+                    break
+                descriptionEnd += 1
+            terminatorSize = 2
+        else:
+            descriptionEnd = frameData.find(b'\x00', position)
+            terminatorSize = 1
+        if descriptionEnd < 0:
+            return None
+
+        imageStart = frameStart + descriptionEnd + terminatorSize
+        if imageStart >= frameEnd:
+            return None
+        return (imageStart, frameEnd)
+
+    @staticmethod
+    def _getFlacCoverPosition(mediaFile):
+        position = 4
+        isLast = False
+        while not isLast:
+            mediaFile.seek(position)
+            blockHeader = mediaFile.read(4)
+            if len(blockHeader) < 4:
+                break
+            isLast = (ord(blockHeader[0:1]) & 0x80) != 0
+            blockType = ord(blockHeader[0:1]) & 0x7f
+            blockSize = struct.unpack('>I', b'\x00' + blockHeader[1:4])[0]
+            blockStart = position + 4
+            position = blockStart + blockSize
+
+            # Type 6 is a picture
+            if blockType != 6:
+                continue
+
+            # Skip the picture type, then the mime type and description (each has
+            # its length before it), then the width, height, depth and colours
+            dataPosition = blockStart + 4
+            for i in range(2):
+                mediaFile.seek(dataPosition)
+                dataPosition += 4 + struct.unpack('>I', mediaFile.read(4))[0]
+            dataPosition += 16
+
+            mediaFile.seek(dataPosition)
+            imageSize = struct.unpack('>I', mediaFile.read(4))[0]
+            imageStart = dataPosition + 4
+            if imageStart + imageSize > position:
+                return None
+            return (imageStart, imageStart + imageSize)
+        return None
+
+    # ID3 sizes only use 7 bits of each byte
+    @staticmethod
+    def _getSyncsafeInt(data):
+        value = 0
+        for i in range(4):
+            value = (value << 7) | (ord(data[i:i + 1]) & 0x7f)
+        return value
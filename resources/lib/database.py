@@ -1,15 +1,135 @@
 # -*- coding: utf-8 -*-
 import xbmc
 import xbmcaddon
-import xbmcvfs
 import sqlite3
+import time
+import traceback
+from contextlib import contextmanager
 
 # Import the common settings
 from settings import log
 from settings import os_path_join
+from settings import os_path_split
+from settings import get_sort_key
 
 ADDON = xbmcaddon.Addon(id='script.audiobooks')
 
+# Single database handler shared by everything in this process
+DB_INSTANCE = None
+
+# Maximum number of values used in a single "IN" query, SQLite has a default
+# limit of 999 variables per statement
+BATCH_CHUNK_SIZE = 500
+
+# Number of seconds to wait for another process to finish writing
+DB_TIMEOUT = 30
+
+# Maximum number of books returned from a search
+SEARCH_LIMIT = 200
+
+# Start of the name of the properties that hold the folders waiting to be checked for changes
+FOLDER_REFRESH_PREFIX = "folderRefresh:"
+
+# Adds books to the full text search index, the index row uses the same id
+# as the book, and all of the chapter titles are indexed together
+SEARCH_INDEX_INSERT = "INSERT INTO books_search (rowid, title, artist, album, chapters) SELECT id, title, artist, album, (SELECT group_concat(title, ' ') FROM chapters WHERE chapters.book_id = books.id)"
+
+
+# Converts a value read from the database (utf-8) into unicode
+def _toUnicode(value):
+    try:
+        return value.decode('utf-8')
+    except:
+        return value
+
+
+# Folders are stored without a trailing slash, so the same folder always
+# has the same entry however the path was created
+def _folderKey(folder):
+    if folder.endswith("/") or folder.endswith("\\"):
+        folder = folder[:-1]
+    return folder
+
+
+# Gets the sort key for a book that has not been read yet, this is the same as the
+# key of the title it would be given if it has no tags
+def _getFileSortKey(fullpath):
+    fileName = os_path_split(fullpath)[-1]
+    if fileName.lower().endswith('.m4b'):
+        fileName = fileName[:-4]
+    return get_sort_key(fileName.replace('.', ' '))
+
+
+# Sets the parent folder for all the books that were added before it was recorded
+def _setParentPaths(c):
+    c.execute('SELECT id, fullpath FROM books')
+    updates = []
+    for row in c.fetchall():
+        updates.append((_toUnicode(os_path_split(_toUnicode(row[1]))[0]), row[0]))
+    c.executemany('UPDATE books SET parent_path = ? WHERE id = ?', updates)
+
+
+# Sets the sort key for all the books that were added before it was recorded
+def _setSortKeys(c):
+    c.execute('SELECT id, title FROM books')
+    updates = []
+    for row in c.fetchall():
+        updates.append((get_sort_key(row[1]), row[0]))
+    c.executemany('UPDATE books SET sort_key = ? WHERE id = ?', updates)
+
+
+# Creates the full text search index, not all versions of SQLite have support
+# for FTS5, if it is not available then searches fall back to using LIKE
+def _createSearchIndex(c):
+    try:
+        c.execute("CREATE VIRTUAL TABLE books_search USING fts5(title, artist, album, chapters)")
+    except sqlite3.OperationalError:
+        log("AudioBooksDB: Full text search not supported: %s" % traceback.format_exc())
+        return
+    c.execute(SEARCH_INDEX_INSERT + " FROM books")
+
+
+# The changes needed to bring the database up to each version, these are applied
+# in order, starting with the first version greater than the current database
+# version. Each step is either an SQL statement or a function that is passed
+# a cursor. Never change an existing entry, always add a new version.
+MIGRATIONS = [
+    # The "id" will be auto-generated as the primary key
+    # Note: Index will automatically be created for "unique" values
+    (1, ["CREATE TABLE version (version text primary key)",
+         "CREATE TABLE books (id integer primary key, fullpath text unique, title text, num_chapters integer, position integer, complete integer)"]),
+    (2, ["ALTER TABLE books ADD COLUMN chapter_position integer DEFAULT 0"]),
+    (3, ["ALTER TABLE books ADD COLUMN has_artwork integer DEFAULT -1"]),
+    # Store the chapters so the media does not need to be read each time they are needed
+    (4, ["ALTER TABLE books ADD COLUMN duration integer DEFAULT -1",
+         "ALTER TABLE books ADD COLUMN chapters_loaded integer DEFAULT 0",
+         "CREATE TABLE chapters (id integer primary key, book_id integer, chapter_index integer, title text, start_time integer, end_time integer, duration integer, file_path text, UNIQUE (book_id, chapter_index))"]),
+    # Fingerprints used to tell if the media has changed since it was scanned
+    (5, ["ALTER TABLE books ADD COLUMN fingerprint text",
+         "ALTER TABLE chapters ADD COLUMN fingerprint text"]),
+    # Parent folder and last played time, with indexes for the common queries
+    (6, ["ALTER TABLE books ADD COLUMN parent_path text",
+         "ALTER TABLE books ADD COLUMN last_played integer DEFAULT 0",
+         _setParentPaths,
+         "CREATE INDEX books_complete_idx ON books (complete)",
+         "CREATE INDEX books_last_played_idx ON books (last_played)",
+         "CREATE INDEX books_parent_path_idx ON books (parent_path)"]),
+    # Artist and album details, plus the full text index used for searching
+    (7, ["ALTER TABLE books ADD COLUMN artist text",
+         "ALTER TABLE books ADD COLUMN album text",
+         _createSearchIndex]),
+    # Snapshots of the contents of each folder so they do not need to be listed each time
+    (8, ["CREATE TABLE folders (id integer primary key, path text unique, fingerprint text, contents text, scanned_time integer)"]),
+    # General values that need to be kept between runs, like where the last scan got to
+    (9, ["CREATE TABLE properties (name text primary key, value text)"]),
+    # Normalised title so books can be put in order without reading them
+    (10, ["ALTER TABLE books ADD COLUMN sort_key text",
+          _setSortKeys,
+          "CREATE INDEX books_sort_key_idx ON books (parent_path, sort_key)"]),
+    # Remove chapters left behind when a book was added again with a new id
+    (11, ["DELETE FROM chapters WHERE book_id NOT IN (SELECT id FROM books)"])
+]
+
 
 #################################
 # Class to handle database access
@@ -20,84 +140,155 @@ class AudioBooksDB():
         self.configPath = xbmc.translatePath(ADDON.getAddonInfo('profile'))
         self.databasefile = os_path_join(self.configPath, "audiobooks_database.db")
         log("AudioBooksDB: Database file location = %s" % self.databasefile)
-
-    # Creates the database if the file does not already exist
+        # The connection is opened the first time it is needed and then
+        # kept open until close is called
+        self.conn = None
+        self.transactionDepth = 0
+        self.hasSearchIndex = False
+
+    # Gets the database handler that is shared for the life of this invocation
+    # (plugin call or service) so the connection is only opened once
+    @staticmethod
+    def getInstance():
+        global DB_INSTANCE
+        if DB_INSTANCE is None:
+            DB_INSTANCE = AudioBooksDB()
+        return DB_INSTANCE
+
+    # Closes the shared database handler, should be called once the invocation is done
+    @staticmethod
+    def closeInstance():
+        global DB_INSTANCE
+        if DB_INSTANCE is not None:
+            DB_INSTANCE.close()
+            DB_INSTANCE = None
+
+    # Creates the database if it does not already exist, and brings it up to
+    # the latest version if it does
     def createDatabase(self):
-        # Make sure the database does not already exist
-        if not xbmcvfs.exists(self.databasefile):
-            # Get a connection to the database, this will create the file
-            conn = sqlite3.connect(self.databasefile)
-            conn.text_factory = str
-            c = conn.cursor()
+        self.getConnection()
 
-            # Create the version number table, this is a simple table
-            # that just holds the version details of what created it
-            # It should make upgrade later easier
-            c.execute('''CREATE TABLE version (version text primary key)''')
-
-            # Insert a row for the version
-            versionNum = "3"
-
-            # Run the statement passing in an array with one value
-            c.execute("INSERT INTO version VALUES (?)", (versionNum,))
-
-            # Create the table that will be used to store the dat for each book
-            # The "id" will be auto-generated as the primary key
-            # Note: Index will automatically be created for "unique" values, so no
-            # need to manually create them
-            c.execute('''CREATE TABLE books (id integer primary key, fullpath text unique, title text, num_chapters integer, position integer, complete integer, chapter_position integer, has_artwork integer)''')
+    # Get a connection to the current database, this is only opened once and
+    # then re-used for all further calls
+    def getConnection(self):
+        if self.conn is None:
+            log("AudioBooksDB: Opening database connection")
+            # Statements are cached by the connection, so re-using the same
+            # SQL text means it is only prepared once per connection
+            # The timeout allows for the service and plugin both writing at once
+            # Note: If the database does not exist, this will create the file
+            conn = sqlite3.connect(self.databasefile, timeout=DB_TIMEOUT, cached_statements=50)
+            conn.text_factory = str
 
-            # Save (commit) the changes
-            conn.commit()
+            # Use write-ahead logging so that reads are never blocked by another
+            # process writing, with that a lower sync level is still safe
+            try:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+            except:
+                log("AudioBooksDB: Failed to set journal mode: %s" % traceback.format_exc())
+
+            # Make sure the database is at the latest version before it is used
+            try:
+                self._applyMigrations(conn)
+            except:
+                conn.close()
+                raise
 
-            # We can also close the connection if we are done with it.
-            # Just be sure any changes have been committed or they will be lost.
-            conn.close()
-        else:
-            # The database was already created, check to see if they need to be updated
-            # Check if this is an upgrade
-            conn = sqlite3.connect(self.databasefile)
-            conn.text_factory = str
             c = conn.cursor()
-            c.execute('SELECT * FROM version')
-            currentVersion = int(c.fetchone()[0])
-            log("AudioBooksDB: Current version number in DB is: %d" % currentVersion)
-
-            # If the database is at version one, add the version 2 tables
-            if currentVersion < 2:
-                log("AudioBooksDB: Updating to version 2")
-                # Add the column that was added in version 2
-                # This will always be added to the end
-                c.execute('''ALTER TABLE books ADD COLUMN chapter_position integer DEFAULT 0''')
-                # Update the new version of the database
-                currentVersion = 2
-                c.execute('DELETE FROM version')
-                c.execute("INSERT INTO version VALUES (?)", (currentVersion,))
-                # Save (commit) the changes
-                conn.commit()
-
-            # If the database is at version 2, add the version 3 tables
-            if currentVersion < 3:
-                log("AudioBooksDB: Updating to version 3")
-                # Add the column that was added in version 2
-                # This will always be added to the end
-                c.execute('''ALTER TABLE books ADD COLUMN has_artwork integer DEFAULT -1''')
-                # Update the new version of the database
-                currentVersion = 3
-                c.execute('DELETE FROM version')
-                c.execute("INSERT INTO version VALUES (?)", (currentVersion,))
-                # Save (commit) the changes
-                conn.commit()
-
-    # Get a connection to the current database
-    def getConnection(self):
-        # Check if the database does not already exist
-        if not xbmcvfs.exists(self.databasefile):
-            self.createDatabase()
+            c.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'books_search'")
+            self.hasSearchIndex = c.fetchone() is not None
+            self.conn = conn
+        return self.conn
+
+    # Applies all the migrations that have not yet been applied to the database
+    # This is done in a single transaction, so if any of them fail the database
+    # is left as it was
+    def _applyMigrations(self, conn):
+        currentVersion = self._getVersion(conn)
+        log("AudioBooksDB: Current version number in DB is: %d" % currentVersion)
+
+        pendingMigrations = [migration for migration in MIGRATIONS if migration[0] > currentVersion]
+        if len(pendingMigrations) < 1:
+            return
+
+        # Take control of the transaction, otherwise the sqlite3 module will
+        # commit before each of the schema changes
+        isolationLevel = conn.isolation_level
+        conn.isolation_level = None
+        c = conn.cursor()
+        try:
+            c.execute('BEGIN IMMEDIATE')
+            # Another process may have upgraded the database while we were waiting
+            currentVersion = self._getVersion(conn)
+            for version, steps in pendingMigrations:
+                if version <= currentVersion:
+                    continue
+                log("AudioBooksDB: Updating to version %d" % version)
+                for step in steps:
+                    if callable(step):
+                        step(c)
+                    else:
+                        c.execute(step)
+                currentVersion = version
+
+            # Record the new version of the database
+            c.execute('DELETE FROM version')
+            c.execute("INSERT INTO version VALUES (?)", (str(currentVersion),))
+            c.execute('COMMIT')
+        except:
+            log("AudioBooksDB: Failed to update database: %s" % traceback.format_exc(), xbmc.LOGERROR)
+            c.execute('ROLLBACK')
+            raise
+        finally:
+            conn.isolation_level = isolationLevel
+
+    # Gets the version of the database, 0 if it has not been created yet
+    def _getVersion(self, conn):
+        c = conn.cursor()
+        c.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'version'")
+        if c.fetchone() is None:
+            return 0
+        c.execute('SELECT * FROM version')
+        row = c.fetchone()
+        if row is None:
+            return 0
+        return int(row[0])
+
+    # Closes the connection to the database, anything not yet committed is saved
+    def close(self):
+        if self.conn is not None:
+            log("AudioBooksDB: Closing database connection")
+            try:
+                self.conn.commit()
+            finally:
+                self.conn.close()
+                self.conn = None
+            self.transactionDepth = 0
+
+    # Groups a number of database changes into a single commit, any updates made
+    # inside the "with" block will only be saved when the block completes
+    # This is used for bulk loading, e.g. all the new books found when a folder
+    # is scanned for the first time are added with a single disk sync
+    @contextmanager
+    def transaction(self):
+        conn = self.getConnection()
+        self.transactionDepth += 1
+        try:
+            yield conn.cursor()
+        except:
+            self.transactionDepth -= 1
+            if self.transactionDepth == 0:
+                conn.rollback()
+            raise
+        self.transactionDepth -= 1
+        if self.transactionDepth == 0:
+            conn.commit()
 
-        conn = sqlite3.connect(self.databasefile)
-        conn.text_factory = str
-        return conn
+    # Commits the changes unless they are part of a larger transaction
+    def _commit(self):
+        if self.transactionDepth < 1:
+            self.getConnection().commit()
 
     def getAudioBookDetails(self, fullpath):
         log("AudioBooksDB: Get book details for %s" % fullpath)
@@ -111,11 +302,92 @@ class AudioBooksDB():
 
         if row is None:
             log("AudioBooksDB: No entry found in the database for %s" % fullpath)
-            conn.close()
             return None
 
         log("AudioBooksDB: Database info: %s" % str(row))
 
+        return self._getDetailsFromRow(row)
+
+    # Gets the details for a number of books with as few queries as possible,
+    # the result is a dictionary keyed by the path that was passed in, books
+    # that are not in the database will not be in the result
+    def getAudioBookDetailsBatch(self, fullpaths):
+        log("AudioBooksDB: Get book details for %d books" % len(fullpaths))
+
+        # The paths read back from the database will be utf-8, so create a
+        # lookup to get back to the path that was passed in
+        requestedPaths = {}
+        for fullpath in fullpaths:
+            requestedPaths[_toUnicode(fullpath)] = fullpath
+
+        results = {}
+        if len(requestedPaths) < 1:
+            return results
+
+        # Get a connection to the DB
+        conn = self.getConnection()
+        c = conn.cursor()
+
+        # There is a limit to the number of variables that can be used in a
+        # single statement, so split the request up into chunks
+        lookupPaths = list(requestedPaths.keys())
+        for idx in range(0, len(lookupPaths), BATCH_CHUNK_SIZE):
+            chunk = lookupPaths[idx:idx + BATCH_CHUNK_SIZE]
+            cmd = 'SELECT * FROM books where fullpath IN (%s)' % ','.join('?' * len(chunk))
+            c.execute(cmd, chunk)
+            for row in c.fetchall():
+                requestedPath = requestedPaths.get(_toUnicode(row[1]), None)
+                if requestedPath is not None:
+                    results[requestedPath] = self._getDetailsFromRow(row)
+
+        log("AudioBooksDB: Found %d of %d books in the database" % (len(results), len(requestedPaths)))
+        return results
+
+    # Puts the given books into title order using the sort keys already stored, so
+    # the books do not need to be loaded to sort them. Any books that are not in
+    # the database yet are put in place using their file name, which is the title
+    # they are given if their tags have none, so the order stays the same as pages
+    # of the listing are read and the books are added
+    def sortAudioBooks(self, fullpaths):
+        log("AudioBooksDB: Sorting %d books" % len(fullpaths))
+
+        sortKeys = {}
+        parentPaths = []
+        for fullpath in fullpaths:
+            sortKeys[_toUnicode(fullpath)] = None
+            parentPath = _toUnicode(os_path_split(_toUnicode(fullpath))[0])
+            if parentPath not in parentPaths:
+                parentPaths.append(parentPath)
+
+        # Get a connection to the DB
+        conn = self.getConnection()
+        c = conn.cursor()
+
+        numStored = 0
+        if len(parentPaths) > 0:
+            cmd = 'SELECT fullpath, sort_key FROM books WHERE parent_path IN (%s)' % ','.join('?' * len(parentPaths))
+            c.execute(cmd, parentPaths)
+            for row in c.fetchall():
+                bookPath = _toUnicode(row[0])
+                if (bookPath in sortKeys) and (row[1] is not None):
+                    sortKeys[bookPath] = _toUnicode(row[1])
+                    numStored += 1
+
+        decoratedPaths = []
+        for fullpath in fullpaths:
+            bookPath = _toUnicode(fullpath)
+            sortKey = sortKeys[bookPath]
+            if sortKey is None:
+                sortKey = _getFileSortKey(bookPath)
+            # Books with the same title are kept in the order of their paths
+            decoratedPaths.append((sortKey, bookPath.lower(), fullpath))
+        decoratedPaths.sort()
+
+        log("AudioBooksDB: %d of %d books sorted by stored title" % (numStored, len(fullpaths)))
+        return [decoratedPath[2] for decoratedPath in decoratedPaths]
+
+    # Converts a row from the books table into the details of a book
+    def _getDetailsFromRow(self, row):
         # Return will contain
         # row[0] - Unique Index in the DB
         # row[1] - Full Path of the book
@@ -125,28 +397,61 @@ class AudioBooksDB():
         # row[5] - 1 if complete, otherwise 0
         # row[6] - Chapter number listened until
         # row[7] - If this item has artwork (-1 = not checked, 0 = No, 1 = Yes)
+        # row[8] - Total duration of the book in seconds (-1 if not known)
+        # row[9] - 1 if the chapters have been stored in the chapters table
+        # row[10] - Fingerprint of the media when it was scanned
+        # row[11] - The folder that the book is in
+        # row[12] - Time the book was last played (seconds since epoch)
+        # row[13] - Artist read from the metadata
+        # row[14] - Album read from the metadata
+        # row[15] - Normalised title used for sorting
         completeStatus = False
         if row[5] == 1:
             completeStatus = True
-        returnData = {'fullpath': row[1], 'title': row[2], 'numChapters': row[3], 'chapterPosition': row[6], 'position': row[4], 'complete': completeStatus, 'hasArtwork': row[7]}
+        returnData = {'fullpath': row[1], 'title': row[2], 'numChapters': row[3], 'chapterPosition': row[6], 'position': row[4], 'complete': completeStatus, 'hasArtwork': row[7], 'duration': row[8], 'chaptersLoaded': (row[9] == 1), 'fingerprint': row[10], 'parentPath': row[11], 'lastPlayed': row[12], 'artist': row[13], 'album': row[14], 'sortKey': row[15]}
 
-        conn.close()
         return returnData
 
-    def addAudioBook(self, fullPath, title, numChapters=0):
+    def addAudioBook(self, fullPath, title, numChapters=0, fingerprint=None, artist=None, album=None):
         log("AudioBooksDB: Adding %s" % fullPath)
 
         # Get a connection to the DB
         conn = self.getConnection()
         c = conn.cursor()
 
-        insertData = (fullPath, title, numChapters)
-        cmd = 'INSERT OR REPLACE INTO books (fullpath, title, num_chapters, position, complete, chapter_position) VALUES (?,?,?,0,0,0)'
+        # If there is already an entry it will be replaced (with a new id), so remove it
+        # from the search and remove its chapters, they would be left behind otherwise
+        self._removeFromSearchIndex(c, fullPath)
+        c.execute('DELETE FROM chapters WHERE book_id IN (SELECT id FROM books WHERE fullpath = ?)', (fullPath,))
+
+        insertData = (fullPath, title, numChapters, fingerprint, os_path_split(fullPath)[0], artist, album, get_sort_key(title))
+        cmd = 'INSERT OR REPLACE INTO books (fullpath, title, num_chapters, position, complete, chapter_position, fingerprint, parent_path, artist, album, sort_key) VALUES (?,?,?,0,0,0,?,?,?,?,?)'
         c.execute(cmd, insertData)
 
         rowId = c.lastrowid
-        conn.commit()
-        conn.close()
+        self._addToSearchIndex(c, fullPath)
+        self._commit()
+
+        return rowId
+
+    # Updates the details of a book that has been rescanned, the listening
+    # progress is left as it is
+    def updateAudioBook(self, fullPath, title, numChapters=0, fingerprint=None, artist=None, album=None):
+        log("AudioBooksDB: Updating %s" % fullPath)
+
+        # Get a connection to the DB
+        conn = self.getConnection()
+        c = conn.cursor()
+
+        # The chapters will need to be stored again as they may have changed
+        updateData = (title, numChapters, fingerprint, artist, album, get_sort_key(title), fullPath)
+        cmd = 'UPDATE books SET title = ?, num_chapters = ?, fingerprint = ?, artist = ?, album = ?, sort_key = ?, duration = -1, chapters_loaded = 0 WHERE fullpath = ?'
+        c.execute(cmd, updateData)
+
+        rowId = c.lastrowid
+        self._removeFromSearchIndex(c, fullPath)
+        self._addToSearchIndex(c, fullPath)
+        self._commit()
 
         return rowId
 
@@ -163,8 +468,7 @@ class AudioBooksDB():
         c.execute(cmd, insertData)
 
         rowId = c.lastrowid
-        conn.commit()
-        conn.close()
+        self._commit()
 
         return rowId
 
@@ -178,14 +482,13 @@ class AudioBooksDB():
         completeStatus = 0
         if complete:
             completeStatus = 1
-        insertData = (position, completeStatus, chapterPosition, fullPath)
-        cmd = 'UPDATE books SET position = ?, complete = ?, chapter_position = ? WHERE fullpath = ?'
+        insertData = (position, completeStatus, chapterPosition, int(time.time()), fullPath)
+        cmd = 'UPDATE books SET position = ?, complete = ?, chapter_position = ?, last_played = ? WHERE fullpath = ?'
 
         c.execute(cmd, insertData)
 
         rowId = c.lastrowid
-        conn.commit()
-        conn.close()
+        self._commit()
 
         return rowId
 
@@ -206,26 +509,83 @@ class AudioBooksDB():
             # No data
             log("AudioBooksDB: No entry found in books database")
         else:
-            log("AudioBooksDB: Database info: %s" % str(rows))
-
-            # row[0] - Unique Index in the DB
-            # row[1] - Full Path of the book
-            # row[2] - Title
-            # row[3] - Number of chapters in the book
-            # row[4] - Position listened until
-            # row[5] - 1 if complete, otherwise 0
-            # row[6] - Chapter number listened until
-            # row[7] - If this item has artwork (-1 = not checked, 0 = No, 1 = Yes)
+            # Only log the number of books, logging every row is very slow for large libraries
+            log("AudioBooksDB: Found %d books in the database" % len(rows))
+
             for row in rows:
-                completeStatus = False
-                if row[5] == 1:
-                    completeStatus = True
-                details = {'fullpath': row[1], 'title': row[2], 'numChapters': row[3], 'chapterPosition': row[6], 'position': row[4], 'complete': completeStatus, 'hasArtwork': row[7]}
-                results.append(details)
+                results.append(self._getDetailsFromRow(row))
 
-        conn.close()
         return results
 
+    # Get the chapters stored for a book, None is returned if the chapters have
+    # never been stored, an empty list means the book has no chapters
+    def getChapters(self, fullPath):
+        log("AudioBooksDB: Get chapters for %s" % fullPath)
+
+        # Get a connection to the DB
+        conn = self.getConnection()
+        c = conn.cursor()
+        c.execute('SELECT id, chapters_loaded FROM books where fullpath = ?', (fullPath,))
+        row = c.fetchone()
+
+        if (row is None) or (row[1] != 1):
+            log("AudioBooksDB: No chapters stored for %s" % fullPath)
+            return None
+
+        c.execute('SELECT title, start_time, end_time, duration, file_path, fingerprint FROM chapters where book_id = ? ORDER BY chapter_index', (row[0],))
+        rows = c.fetchall()
+
+        # Books marked as loaded without any chapters (by earlier versions) are read again
+        if len(rows) < 1:
+            log("AudioBooksDB: No chapters stored for %s" % fullPath)
+            return None
+
+        chapters = []
+        for chapterRow in rows:
+            chapters.append({'title': chapterRow[0], 'startTime': chapterRow[1], 'endTime': chapterRow[2], 'duration': chapterRow[3], 'filePath': chapterRow[4], 'fingerprint': chapterRow[5]})
+
+        log("AudioBooksDB: Found %d stored chapters for %s" % (len(chapters), fullPath))
+        return chapters
+
+    # Stores the chapters for a book, replacing any that were there before
+    def setChapters(self, fullPath, chapters, chapterFiles=None, duration=-1, chapterFingerprints=None):
+        log("AudioBooksDB: Setting %d chapters for %s" % (len(chapters), fullPath))
+
+        # Get a connection to the DB
+        conn = self.getConnection()
+        c = conn.cursor()
+        c.execute('SELECT id FROM books where fullpath = ?', (fullPath,))
+        row = c.fetchone()
+
+        if row is None:
+            log("AudioBooksDB: No entry found to store chapters for %s" % fullPath)
+            return
+
+        bookId = row[0]
+        insertData = []
+        for idx, chapter in enumerate(chapters):
+            chapterFile = None
+            if (chapterFiles is not None) and (len(chapterFiles) > idx):
+                chapterFile = chapterFiles[idx]
+            chapterFingerprint = None
+            if (chapterFingerprints is not None) and (len(chapterFingerprints) > idx):
+                chapterFingerprint = chapterFingerprints[idx]
+            insertData.append((bookId, idx + 1, chapter['title'], chapter['startTime'], chapter['endTime'], chapter['duration'], chapterFile, chapterFingerprint))
+
+        c.execute('DELETE FROM chapters WHERE book_id = ?', (bookId,))
+        c.executemany('INSERT INTO chapters (book_id, chapter_index, title, start_time, end_time, duration, file_path, fingerprint) VALUES (?,?,?,?,?,?,?,?)', insertData)
+        # If there are no chapters then the book is not marked as loaded, so it is read again
+        chaptersLoaded = 0
+        if len(chapters) > 0:
+            chaptersLoaded = 1
+        c.execute('UPDATE books SET num_chapters = ?, duration = ?, chapters_loaded = ? WHERE id = ?', (len(chapters), duration, chaptersLoaded, bookId))
+
+        # Make sure the chapter titles can be searched
+        self._removeFromSearchIndex(c, fullPath)
+        self._addToSearchIndex(c, fullPath)
+
+        self._commit()
+
     # Delete an entry from the database
     def deleteAudioBook(self, fullPath):
         log("AudioBooksDB: delete for %s" % fullPath)
@@ -233,11 +593,139 @@ class AudioBooksDB():
         # Get a connection to the DB
         conn = self.getConnection()
         c = conn.cursor()
+        # Delete any chapters stored for the book
+        c.execute('DELETE FROM chapters where book_id IN (SELECT id FROM books where fullpath = ?)', (fullPath,))
+        self._removeFromSearchIndex(c, fullPath)
         # Delete any existing data from the database
         cmd = 'DELETE FROM books where fullpath = ?'
         c.execute(cmd, (fullPath,))
-        conn.commit()
+        self._commit()
+
+        log("AudioBooksDB: delete for %s removed %d rows" % (fullPath, c.rowcount))
+
+    # Finds all the books where the title, artist, album or chapter titles
+    # match the given text
+    def searchAudioBooks(self, searchText, limit=SEARCH_LIMIT):
+        log("AudioBooksDB: Searching for %s" % searchText)
 
-        log("AudioBooksDB: delete for %s removed %d rows" % (fullPath, conn.total_changes))
+        searchText = _toUnicode(searchText).strip()
+        if searchText in [None, ""]:
+            return []
 
-        conn.close()
+        # Get a connection to the DB
+        conn = self.getConnection()
+        c = conn.cursor()
+
+        rows = None
+        if self.hasSearchIndex:
+            # Each word is quoted so that any special characters are not treated as
+            # part of the query syntax, and is matched as a prefix
+            terms = []
+            for word in searchText.split():
+                terms.append('"%s"*' % word.replace('"', '""'))
+            try:
+                c.execute('SELECT books.* FROM books_search JOIN books ON books.id = books_search.rowid WHERE books_search MATCH ? ORDER BY rank LIMIT ?', (' '.join(terms), limit))
+                rows = c.fetchall()
+            except sqlite3.OperationalError:
+                log("AudioBooksDB: Full text search failed, using fallback: %s" % traceback.format_exc())
+
+        if rows is None:
+            likeText = "%%%s%%" % searchText
+            cmd = 'SELECT * FROM books WHERE title LIKE ? OR artist LIKE ? OR album LIKE ? OR id IN (SELECT book_id FROM chapters WHERE title LIKE ?) ORDER BY sort_key LIMIT ?'
+            c.execute(cmd, (likeText, likeText, likeText, likeText, limit))
+            rows = c.fetchall()
+
+        results = []
+        for row in rows:
+            results.append(self._getDetailsFromRow(row))
+
+        log("AudioBooksDB: Search for %s found %d books" % (searchText, len(results)))
+        return results
+
+    # Adds the given book to the full text search index
+    def _addToSearchIndex(self, c, fullPath):
+        if self.hasSearchIndex:
+            c.execute(SEARCH_INDEX_INSERT + " FROM books WHERE fullpath = ?", (fullPath,))
+
+    # Removes the given book from the full text search index
+    def _removeFromSearchIndex(self, c, fullPath):
+        if self.hasSearchIndex:
+            c.execute('DELETE FROM books_search WHERE rowid IN (SELECT id FROM books WHERE fullpath = ?)', (fullPath,))
+
+    # Gets the stored contents of a folder, None if the folder has not been stored
+    def getFolderSnapshot(self, folder):
+        log("AudioBooksDB: Get folder snapshot for %s" % folder)
+
+        # Get a connection to the DB
+        conn = self.getConnection()
+        c = conn.cursor()
+        c.execute('SELECT fingerprint, contents, scanned_time FROM folders WHERE path = ?', (_folderKey(folder),))
+        row = c.fetchone()
+
+        if row is None:
+            log("AudioBooksDB: No folder snapshot found for %s" % folder)
+            return None
+
+        return {'fingerprint': row[0], 'contents': row[1], 'scannedTime': row[2]}
+
+    # Saves the contents of a folder
+    def setFolderSnapshot(self, folder, fingerprint, contents, scannedTime):
+        log("AudioBooksDB: Set folder snapshot for %s" % folder)
+
+        # Get a connection to the DB
+        conn = self.getConnection()
+        c = conn.cursor()
+        c.execute('INSERT OR REPLACE INTO folders (path, fingerprint, contents, scanned_time) VALUES (?,?,?,?)', (_folderKey(folder), fingerprint, contents, scannedTime))
+        self._commit()
+
+    # Removes the stored contents of a folder so that it is read again next time
+    def deleteFolderSnapshot(self, folder):
+        log("AudioBooksDB: Delete folder snapshot for %s" % folder)
+
+        # Get a connection to the DB
+        conn = self.getConnection()
+        c = conn.cursor()
+        c.execute('DELETE FROM folders WHERE path = ?', (_folderKey(folder),))
+        self._commit()
+
+    # Records that a folder needs to be checked for changes, each folder has its own
+    # property so the plugin and service never overwrite each other's changes
+    def queueFolderRefresh(self, folder):
+        folder = _folderKey(folder)
+        self.setProperty(FOLDER_REFRESH_PREFIX + folder, folder)
+
+    # Gets the folders that are waiting to be checked for changes, and removes
+    # them from the queue
+    def takeQueuedFolderRefreshes(self):
+        with self.transaction() as c:
+            c.execute('SELECT name, value FROM properties WHERE substr(name, 1, ?) = ?', (len(FOLDER_REFRESH_PREFIX), FOLDER_REFRESH_PREFIX))
+            rows = c.fetchall()
+            c.executemany('DELETE FROM properties WHERE name = ?', [(row[0],) for row in rows])
+
+        log("AudioBooksDB: Found %d folders waiting to be checked" % len(rows))
+        return [_toUnicode(row[1]) for row in rows]
+
+    # Gets a value that was saved with setProperty, None if it is not set
+    def getProperty(self, name):
+        # Get a connection to the DB
+        conn = self.getConnection()
+        c = conn.cursor()
+        c.execute('SELECT value FROM properties WHERE name = ?', (name,))
+        row = c.fetchone()
+
+        if row is None:
+            return None
+        return row[0]
+
+    # Saves a value, setting it to None will remove it
+    def setProperty(self, name, value):
+        log("AudioBooksDB: Set property %s to %s" % (name, value))
+
+        # Get a connection to the DB
+        conn = self.getConnection()
+        c = conn.cursor()
+        if value is None:
+            c.execute('DELETE FROM properties WHERE name = ?', (name,))
+        else:
+            c.execute('INSERT OR REPLACE INTO properties (name, value) VALUES (?,?)', (name, value))
+        self._commit()
@@ -3,11 +3,18 @@ import sys
 import locale
 import re
 import subprocess
+import threading
+import time
 import traceback
 import xbmc
 import xbmcvfs
 import xbmcaddon
 
+if sys.version_info >= (2, 7):
+    import json
+else:
+    import simplejson as json
+
 from ctypes import CDLL, RTLD_GLOBAL
 from ctypes import Structure, POINTER
 from ctypes import c_int, c_uint, c_char, c_char_p, c_void_p, c_int64
@@ -15,6 +22,7 @@ from ctypes import c_int, c_uint, c_char, c_char_p, c_void_p, c_int64
 from settings import Settings
 from settings import log
 from settings import os_path_join
+from settings import os_path_split
 from settings import dir_exists
 
 ADDON = xbmcaddon.Addon(id='script.audiobooks')
@@ -126,13 +134,46 @@ class AVFormatContext3(Structure):
 FFMPEG_INSTANCE = None
 FFMPEG_VERSION = 2
 
+# The settings the handler was created for, it is only created again if they change,
+# this lets long running processes (like the service) keep using the same handler
+FFMPEG_INSTANCE_SETTINGS = None
+HANDLER_LOCK = threading.Lock()
+
+# Functions from the libraries that have already been loaded and initialised by this
+# process, keyed by the location of the libraries, libraries can not be unloaded so
+# they only ever need to be loaded once
+LOADED_LIBRARIES = {}
+LIBRARY_LOCK = threading.Lock()
+
+# How long (in seconds) an ffmpeg process can run for, and how often to check on it
+FFMPEG_TIMEOUT = 120
+FFMPEG_POLL_INTERVAL = 0.2
+
+# Most files that are read by a single ffmpeg process, and the longest the command
+# line can get (Windows has a limit of 32K characters)
+FFMPEG_BATCH_SIZE = 50
+FFMPEG_MAX_COMMAND_LENGTH = 8000
+
 
 # Utility class for ffmpeg operations
 class FfmpegBase():
     @staticmethod
     def createHandler():
         global FFMPEG_INSTANCE
-        if FFMPEG_INSTANCE is None:
+        global FFMPEG_INSTANCE_SETTINGS
+
+        # Uses the raw values, as checking the locations is only needed when the handler is created
+        ffmpegSettings = (Settings.getFFmpegSetting(), ADDON.getSetting("ffmpegLibraryLocation"), ADDON.getSetting("ffmpegLocation"))
+
+        with HANDLER_LOCK:
+            # Also remembers when neither method is supported, so that the checks
+            # are not made again for every file
+            if ffmpegSettings == FFMPEG_INSTANCE_SETTINGS:
+                return FFMPEG_INSTANCE
+
+            FFMPEG_INSTANCE = None
+            FFMPEG_INSTANCE_SETTINGS = ffmpegSettings
+
             # If set to None or Library, then we give the library a go
             # For None, if we are on Windows, then the library files are already there
             if Settings.getFFmpegSetting() == Settings.FFMPEG_LIB:
@@ -142,6 +183,13 @@ class FfmpegBase():
                     log("FfmpegUtils: Loading by library not supported")
                     FFMPEG_INSTANCE = None
 
+            if FFMPEG_INSTANCE in [None, ""]:
+                log("FfmpegUtils: Loading Audiobook details by ffprobe")
+                FFMPEG_INSTANCE = FfprobeCmd()
+                if not FFMPEG_INSTANCE.isSupported():
+                    log("FfmpegUtils: Loading by ffprobe not supported")
+                    FFMPEG_INSTANCE = None
+
             if FFMPEG_INSTANCE in [None, ""]:
                 log("FfmpegUtils: Loading Audiobook details by executable")
                 FFMPEG_INSTANCE = FfmpegCmd()
@@ -154,6 +202,24 @@ class FfmpegBase():
     def getMediaInfo(self, mediaName, coverTempName=None):
         return None
 
+    # Gets the information for several media files, returning the details for each
+    # in the same order (None for any that could not be read), the cover image is
+    # only saved from the first file
+    def getMediaInfoList(self, mediaNames, coverTempName=None):
+        mediaInfos = []
+        for mediaName in mediaNames:
+            mediaInfos.append(self.getMediaInfo(mediaName, coverTempName))
+            coverTempName = None
+        return mediaInfos
+
+    # Checks if getMediaInfoList reads more than one file in a single call
+    def supportsBatchCalls(self):
+        return False
+
+    # Checks if getMediaInfo can be called from more than one thread at once
+    def supportsConcurrentCalls(self):
+        return False
+
     def _getDefaultChapterName(self, chapterNumber=''):
         chapterTitle = "%s %d" % (ADDON.getLocalizedString(32017), chapterNumber)
         return chapterTitle
@@ -162,7 +228,6 @@ class FfmpegBase():
 # Class to handle using the libraries
 class FFMpegLib(FfmpegBase):
     def __init__(self):
-        self.av_register_all = None
         self.avformat_open_input = None
         self.avformat_close_input = None
         self.avformat_find_stream_info = None
@@ -177,60 +242,93 @@ class FFMpegLib(FfmpegBase):
         if libLocation in [None, ""]:
             return
 
-        try:
-            # Need to load in the following order, otherwise things do not work
-            # avutil, avresample, avcodec, avformat
-            avutil = CDLL(libLocation['avutil'], mode=RTLD_GLOBAL)
-            CDLL(libLocation['swresample'], mode=RTLD_GLOBAL)
-            CDLL(libLocation['avcodec'], mode=RTLD_GLOBAL)
-            avformat = CDLL(libLocation['avformat'], mode=RTLD_GLOBAL)
-
-            self.av_register_all = avformat.av_register_all
-            self.av_register_all.restype = None
-            self.av_register_all.argtypes = []
-
-            self.avformat_open_input = avformat.avformat_open_input
-            self.avformat_open_input.restype = c_int
-            if FFMPEG_VERSION == 3:
-                self.avformat_open_input.argtypes = [POINTER(POINTER(AVFormatContext3)), c_char_p, POINTER(AVInputFormat), POINTER(POINTER(AVDictionary))]
-            else:
-                self.avformat_open_input.argtypes = [POINTER(POINTER(AVFormatContext)), c_char_p, POINTER(AVInputFormat), POINTER(POINTER(AVDictionary))]
-
-            self.avformat_close_input = avformat.avformat_close_input
-            self.avformat_close_input.restype = None
-            if FFMPEG_VERSION == 3:
-                self.avformat_close_input.argtypes = [POINTER(POINTER(AVFormatContext3))]
-            else:
-                self.avformat_close_input.argtypes = [POINTER(POINTER(AVFormatContext))]
-
-            self.avformat_find_stream_info = avformat.avformat_find_stream_info
-            self.avformat_find_stream_info.restype = c_int
-            if FFMPEG_VERSION == 3:
-                self.avformat_find_stream_info.argtypes = [POINTER(AVFormatContext3), POINTER(POINTER(AVDictionary))]
-            else:
-                self.avformat_find_stream_info.argtypes = [POINTER(AVFormatContext), POINTER(POINTER(AVDictionary))]
-
-            self.av_dict_get = avutil.av_dict_get
-            self.av_dict_get.restype = POINTER(AVDictionaryEntry)
-            self.av_dict_get.argtypes = [POINTER(AVDictionary), c_char_p, POINTER(AVDictionaryEntry), c_int]
+        libFunctions = FFMpegLib._loadLibraries(libLocation)
+        if libFunctions in [None, ""]:
+            return
 
-            self.av_log_set_level = avutil.av_log_set_level
-            self.av_log_set_level.restype = None
-            self.av_log_set_level.argtypes = [c_int]
-        except:
-            log("FFMpegLib: Failed to load ffmpeg libraries: %s" % traceback.format_exc(), xbmc.LOGERROR)
-            self.av_register_all = None
-            self.avformat_open_input = None
-            self.avformat_close_input = None
-            self.avformat_find_stream_info = None
-            self.av_dict_get = None
+        self.avformat_open_input = libFunctions['avformat_open_input']
+        self.avformat_close_input = libFunctions['avformat_close_input']
+        self.avformat_find_stream_info = libFunctions['avformat_find_stream_info']
+        self.av_dict_get = libFunctions['av_dict_get']
 
     # Check if using libraries is supported
     def isSupported(self):
-        if self.av_register_all in [None, ""]:
+        if self.avformat_open_input in [None, ""]:
             return False
         return True
 
+    # Loads the libraries and binds the functions that are needed, this (and the
+    # initialisation of ffmpeg) is only done the first time for each location
+    @staticmethod
+    def _loadLibraries(libLocation):
+        libKey = libLocation['avformat']
+
+        with LIBRARY_LOCK:
+            if libKey in LOADED_LIBRARIES:
+                return LOADED_LIBRARIES[libKey]
+
+            libFunctions = None
+            try:
+                # Need to load in the following order, otherwise things do not work
+                # avutil, avresample, avcodec, avformat
+                avutil = CDLL(libLocation['avutil'], mode=RTLD_GLOBAL)
+                CDLL(libLocation['swresample'], mode=RTLD_GLOBAL)
+                CDLL(libLocation['avcodec'], mode=RTLD_GLOBAL)
+                avformat = CDLL(libLocation['avformat'], mode=RTLD_GLOBAL)
+
+                av_register_all = avformat.av_register_all
+                av_register_all.restype = None
+                av_register_all.argtypes = []
+
+                avformat_open_input = avformat.avformat_open_input
+                avformat_open_input.restype = c_int
+                if FFMPEG_VERSION == 3:
+                    avformat_open_input.argtypes = [POINTER(POINTER(AVFormatContext3)), c_char_p, POINTER(AVInputFormat), POINTER(POINTER(AVDictionary))]
+                else:
+                    avformat_open_input.argtypes = [POINTER(POINTER(AVFormatContext)), c_char_p, POINTER(AVInputFormat), POINTER(POINTER(AVDictionary))]
+
+                avformat_close_input = avformat.avformat_close_input
+                avformat_close_input.restype = None
+                if FFMPEG_VERSION == 3:
+                    avformat_close_input.argtypes = [POINTER(POINTER(AVFormatContext3))]
+                else:
+                    avformat_close_input.argtypes = [POINTER(POINTER(AVFormatContext))]
+
+                avformat_find_stream_info = avformat.avformat_find_stream_info
+                avformat_find_stream_info.restype = c_int
+                if FFMPEG_VERSION == 3:
+                    avformat_find_stream_info.argtypes = [POINTER(AVFormatContext3), POINTER(POINTER(AVDictionary))]
+                else:
+                    avformat_find_stream_info.argtypes = [POINTER(AVFormatContext), POINTER(POINTER(AVDictionary))]
+
+                av_dict_get = avutil.av_dict_get
+                av_dict_get.restype = POINTER(AVDictionaryEntry)
+                av_dict_get.argtypes = [POINTER(AVDictionary), c_char_p, POINTER(AVDictionaryEntry), c_int]
+
+                av_log_set_level = avutil.av_log_set_level
+                av_log_set_level.restype = None
+                av_log_set_level.argtypes = [c_int]
+
+                # Disable all logging from ffmpeg as that will go to standard out
+                try:
+                    av_log_set_level(-8)
+                except:
+                    log("FFMpegLib: Failed to disable ffmpeg logging")
+
+                av_register_all()
+
+                libFunctions = {'avformat_open_input': avformat_open_input,
+                                'avformat_close_input': avformat_close_input,
+                                'avformat_find_stream_info': avformat_find_stream_info,
+                                'av_dict_get': av_dict_get}
+                log("FFMpegLib: Loaded and initialised ffmpeg libraries from %s" % libKey)
+            except:
+                log("FFMpegLib: Failed to load ffmpeg libraries: %s" % traceback.format_exc(), xbmc.LOGERROR)
+
+            # A failure is remembered as well, there is no point trying to load them again
+            LOADED_LIBRARIES[libKey] = libFunctions
+            return libFunctions
+
     # Get the information for a given media file
     def getMediaInfo(self, mediaName, coverTempName=None):
         log("FFMpegLib: Get information for %s" % mediaName)
@@ -239,17 +337,9 @@ class FFMpegLib(FfmpegBase):
         pFormatCtx = None
         try:
             # Make sure we have the libraries expected
-            if self.av_register_all in [None, ""]:
+            if self.avformat_open_input in [None, ""]:
                 return None
 
-            # Disable all logging from ffmpeg as that will go to standard out
-            try:
-                self.av_log_set_level(-8)
-            except:
-                log("FFMpegLib: Failed to disable ffmpeg logging")
-
-            self.av_register_all()
-
             if FFMPEG_VERSION == 3:
                 pFormatCtx = POINTER(AVFormatContext3)()
             else:
@@ -449,21 +539,7 @@ class FfmpegCmd(FfmpegBase):
         info = None
         try:
             # Generate the ffmpeg command
-            ffmpegCmd = [self.ffmpeg, '-hide_banner', '-y', '-i', mediaName]
-
-            # Handle non ascii characters in the file name path
-            try:
-                ffmpegCmd[4] = ffmpegCmd[4].decode('utf-8').encode(locale.getpreferredencoding())
-            except:
-                log("FfmpegCmd: Failed file system encoding ffmpeg command 1, using default")
-                try:
-                    ffmpegCmd[4] = ffmpegCmd[4].encode(locale.getpreferredencoding())
-                except:
-                    log("FfmpegCmd: Failed file system encoding ffmpeg command 2, using default")
-                    try:
-                        ffmpegCmd[4] = ffmpegCmd[4].decode().encode(locale.getpreferredencoding())
-                    except:
-                        log("FfmpegCmd: Failed file system encoding ffmpeg command 3, using default")
+            ffmpegCmd = [self.ffmpeg, '-hide_banner', '-y', '-i', self._encodeFileName(mediaName)]
 
             # Add the output image to the command line if it is needed
             if coverTempName is not None:
@@ -477,25 +553,10 @@ class FfmpegCmd(FfmpegBase):
                         log("FfmpegCmd: Failed file system encoding coverTempName ffmpeg command 2, using default")
                 ffmpegCmd.append(coverTempName)
 
-            # Make the ffmpeg call
-            try:
-                log("FfmpegCmd: running subprocess command %s" % str(ffmpegCmd))
-                info = subprocess.check_output(ffmpegCmd, shell=False, startupinfo=startupinfo, stderr=subprocess.STDOUT)
-            except subprocess.CalledProcessError as error:
-                # This exception will be thrown if ffmpeg prints to STDERR, which it will do if
-                # you try and run the command without an output (i.e. image file), but in most
-                # cases it does actually have the information we need
-                log("FfmpegCmd: CalledProcessError received, processing remaining output")
-                info = error.output
-            except:
-                # Unfortunately there are still systems that use Python 2.6 which does not
-                # have check_output, so it that fails, we just use Popen
-                log("FfmpegCmd: subprocess failed, trying Popen: %s" % traceback.format_exc())
-                proc = subprocess.Popen(ffmpegCmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-                info = ""
-                for outStr in proc.communicate():
-                    if outStr not in [None, ""]:
-                        info = "%s%s\n" % (info, outStr)
+            # Make the ffmpeg call, ffmpeg will exit with an error if there is no output
+            # file (i.e. image file), but in most cases the information needed is printed
+            log("FfmpegCmd: running subprocess command %s" % str(ffmpegCmd))
+            info = self._runProcess(ffmpegCmd, False, startupinfo)
         except:
             log("FfmpegCmd: Failed to get data using ffmpeg for file %s with error %s" % (mediaName, traceback.format_exc()), xbmc.LOGERROR)
 
@@ -504,15 +565,11 @@ class FfmpegCmd(FfmpegBase):
         if info not in [None, ""]:
             ffmpegOutput = self._processFFmpegOutput(info)
 
-        if ffmpegOutput in [None, ""]:
+        if (ffmpegOutput in [None, ""]) and (not xbmc.Monitor().abortRequested()):
             try:
                 log("FfmpegCmd: Still no output from ffmpeg, trying Popen with joined arguments")
                 joinedCmd = ' '.join(ffmpegCmd)
-                proc = subprocess.Popen(joinedCmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-                info = ""
-                for outStr in proc.communicate():
-                    if outStr not in [None, ""]:
-                        info = "%s%s\n" % (info, outStr)
+                info = self._runProcess(joinedCmd, True)
                 if info not in [None, ""]:
                     ffmpegOutput = self._processFFmpegOutput(info)
             except:
@@ -520,6 +577,153 @@ class FfmpegCmd(FfmpegBase):
 
         return ffmpegOutput
 
+    # Each call runs a separate process, so more than one can be run at once
+    def supportsConcurrentCalls(self):
+        return True
+
+    # Several files can be read by the same ffmpeg process
+    def supportsBatchCalls(self):
+        return True
+
+    # Reads the details for the files using a single ffmpeg process for each batch of
+    # them, rather than starting a new process for every file. The cover image is
+    # saved from the first file by the same process
+    def getMediaInfoList(self, mediaNames, coverTempName=None):
+        mediaInfos = []
+        batch = []
+        batchLength = 0
+        batchCover = coverTempName
+        for mediaName in mediaNames:
+            encodedName = self._encodeFileName(mediaName)
+            if (len(batch) >= FFMPEG_BATCH_SIZE) or ((len(batch) > 0) and (batchLength + len(encodedName) > FFMPEG_MAX_COMMAND_LENGTH)):
+                mediaInfos.extend(self._getBatchMediaInfo(batch, batchCover))
+                batch = []
+                batchLength = 0
+                batchCover = None
+            batch.append(encodedName)
+            batchLength += len(encodedName) + 4
+
+        if len(batch) > 0:
+            mediaInfos.extend(self._getBatchMediaInfo(batch, batchCover))
+
+        # ffmpeg stops at the first file it can not open, so any files after that
+        # one are read on their own
+        for idx, mediaName in enumerate(mediaNames):
+            if (mediaInfos[idx] in [None, ""]) and (not xbmc.Monitor().abortRequested()):
+                log("FfmpegCmd: No details for %s in batch, reading on its own" % mediaName)
+                if idx == 0:
+                    mediaInfos[idx] = self.getMediaInfo(mediaName, coverTempName)
+                else:
+                    mediaInfos[idx] = self.getMediaInfo(mediaName)
+
+        return mediaInfos
+
+    # Runs ffmpeg with every file in the batch as an input, and splits the output
+    # up into the details printed for each input
+    def _getBatchMediaInfo(self, encodedNames, coverTempName=None):
+        startupinfo = None
+        if sys.platform.lower() == 'win32':
+            # Need to stop the dialog appearing on windows
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+
+        info = None
+        try:
+            ffmpegCmd = [self.ffmpeg, '-hide_banner', '-y']
+            for encodedName in encodedNames:
+                ffmpegCmd.extend(['-i', encodedName])
+
+            # Only the image in the first input is saved, if it does not have one
+            # ffmpeg will report there is no output, but still prints the details
+            if coverTempName is not None:
+                ffmpegCmd.extend(['-map', '0:v?', '-frames:v', '1', self._encodeFileName(coverTempName)])
+
+            log("FfmpegCmd: running subprocess command for %d files %s" % (len(encodedNames), str(ffmpegCmd)))
+            info = self._runProcess(ffmpegCmd, False, startupinfo)
+        except:
+            log("FfmpegCmd: Failed to get data using ffmpeg for files %s with error %s" % (str(encodedNames), traceback.format_exc()), xbmc.LOGERROR)
+
+        inputOutputs = {}
+        if info not in [None, ""]:
+            # The details for each file start with "Input #<number>, <format>, from '<file>':"
+            input_pattern = re.compile('^Input #(\d+),')
+            inputNum = None
+            for line in info.split('\n'):
+                input_match = input_pattern.match(line)
+                if input_match:
+                    inputNum = int(input_match.group(1))
+                    inputOutputs[inputNum] = []
+                elif line.startswith('Output ') or line.startswith('At least one output'):
+                    inputNum = None
+                if inputNum is not None:
+                    inputOutputs[inputNum].append(line)
+
+        mediaInfos = []
+        for inputNum in range(len(encodedNames)):
+            ffmpegOutput = None
+            if inputNum in inputOutputs:
+                try:
+                    ffmpegOutput = self._processFFmpegOutput('\n'.join(inputOutputs[inputNum]))
+                except:
+                    log("FfmpegCmd: Failed to process output for input %d: %s" % (inputNum, traceback.format_exc()))
+            mediaInfos.append(ffmpegOutput)
+        return mediaInfos
+
+    # Handle non ascii characters in the file name path
+    def _encodeFileName(self, fileName):
+        try:
+            return fileName.decode('utf-8').encode(locale.getpreferredencoding())
+        except:
+            log("FfmpegCmd: Failed file system encoding ffmpeg command 1, using default")
+        try:
+            return fileName.encode(locale.getpreferredencoding())
+        except:
+            log("FfmpegCmd: Failed file system encoding ffmpeg command 2, using default")
+        try:
+            return fileName.decode().encode(locale.getpreferredencoding())
+        except:
+            log("FfmpegCmd: Failed file system encoding ffmpeg command 3, using default")
+        return fileName
+
+    # Runs the command and returns everything it printed, the process is killed
+    # if it takes too long or Kodi is shutting down
+    def _runProcess(self, cmd, shell=False, startupinfo=None):
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, shell=shell, startupinfo=startupinfo)
+
+        # The output is read on another thread so that this one can keep checking
+        # the process, otherwise it could block once the pipe is full
+        output = []
+        reader = threading.Thread(target=self._readProcessOutput, args=(proc, output))
+        reader.daemon = True
+        reader.start()
+
+        monitor = xbmc.Monitor()
+        endTime = time.time() + FFMPEG_TIMEOUT
+        while True:
+            reader.join(FFMPEG_POLL_INTERVAL)
+            if not reader.is_alive():
+                break
+
+            if monitor.abortRequested() or (time.time() > endTime):
+                log("FfmpegCmd: Stopping ffmpeg process %s" % str(cmd))
+                try:
+                    proc.kill()
+                except:
+                    log("FfmpegCmd: Failed to stop ffmpeg process: %s" % traceback.format_exc())
+                # Do not wait for the output to finish, if this was run with a shell then
+                # the child process may still be holding it open
+                return None
+
+        if len(output) < 1:
+            return None
+        return output[0]
+
+    def _readProcessOutput(self, proc, output):
+        try:
+            output.append(proc.communicate()[0])
+        except:
+            log("FfmpegCmd: Failed to read ffmpeg output: %s" % traceback.format_exc())
+
     # Handles the processing of the text output of ffmpeg
     def _processFFmpegOutput(self, info):
         log("FfmpegCmd: FFmpeg info is: %s" % info)
@@ -654,3 +858,141 @@ class FfmpegCmd(FfmpegBase):
 
         # Return the total time in seconds
         return totalInSeconds
+
+
+# Class to read the details using ffprobe, this prints the details as json so there
+# is no need to parse the text ffmpeg prints, ffprobe is expected to be in the same
+# directory as the ffmpeg executable
+class FfprobeCmd(FfmpegCmd):
+    def __init__(self):
+        FfmpegCmd.__init__(self)
+        self.ffprobe = None
+
+        if self.ffmpeg not in [None, ""]:
+            # The location will have quotes round it if it contains a space
+            ffmpegPath = self.ffmpeg.strip('"')
+            execDir, execName = os_path_split(ffmpegPath)
+            if 'ffmpeg' in execName:
+                ffprobe = os_path_join(execDir, execName.replace('ffmpeg', 'ffprobe'))
+                if xbmcvfs.exists(ffprobe):
+                    self.ffprobe = ffprobe
+
+        if self.ffprobe in [None, ""]:
+            log("FfprobeCmd: ffprobe not found")
+        else:
+            log("FfprobeCmd: ffprobe location %s" % self.ffprobe)
+
+    # Check if using ffprobe is supported
+    def isSupported(self):
+        if self.ffprobe in [None, ""]:
+            return False
+        return True
+
+    def getMediaInfo(self, mediaName, coverTempName=None):
+        startupinfo = None
+        if sys.platform.lower() == 'win32':
+            # Need to stop the dialog appearing on windows
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+
+        info = None
+        try:
+            # Nothing apart from the json is printed, the output would not be valid otherwise.
+            # Only the video streams are listed, if there are any then the file has a cover
+            ffprobeCmd = [self.ffprobe, '-v', 'quiet', '-print_format', 'json', '-show_format', '-show_chapters', '-show_streams', '-select_streams', 'v', self._encodeFileName(mediaName)]
+
+            log("FfprobeCmd: running subprocess command %s" % str(ffprobeCmd))
+            info = self._runProcess(ffprobeCmd, False, startupinfo)
+        except:
+            log("FfprobeCmd: Failed to get data using ffprobe for file %s with error %s" % (mediaName, traceback.format_exc()), xbmc.LOGERROR)
+
+        if info in [None, ""]:
+            return None
+
+        try:
+            probeDetails = json.loads(info)
+        except:
+            log("FfprobeCmd: Failed to parse ffprobe output %s with error %s" % (info, traceback.format_exc()))
+            return None
+
+        # ffprobe can not save the cover image, so ffmpeg is run for that, but only
+        # when a cover is wanted and the file actually has one
+        if (coverTempName is not None) and (len(probeDetails.get('streams', [])) > 0):
+            self._saveCover(mediaName, coverTempName, startupinfo)
+
+        return self._processFFprobeOutput(probeDetails)
+
+    # ffprobe only reads a single file each time it is run, so the files are read
+    # one at a time rather than in batches
+    def supportsBatchCalls(self):
+        return False
+
+    def getMediaInfoList(self, mediaNames, coverTempName=None):
+        return FfmpegBase.getMediaInfoList(self, mediaNames, coverTempName)
+
+    # Saves the first image in the file as the cover, nothing else is read from it
+    def _saveCover(self, mediaName, coverTempName, startupinfo=None):
+        try:
+            ffmpegCmd = [self.ffmpeg, '-hide_banner', '-v', 'error', '-y', '-i', self._encodeFileName(mediaName), '-map', '0:v:0', '-frames:v', '1', self._encodeFileName(coverTempName)]
+
+            log("FfprobeCmd: running subprocess command %s" % str(ffmpegCmd))
+            self._runProcess(ffmpegCmd, False, startupinfo)
+        except:
+            log("FfprobeCmd: Failed to save cover using ffmpeg for file %s with error %s" % (mediaName, traceback.format_exc()), xbmc.LOGERROR)
+
+    # Handles the processing of the parsed json output of ffprobe
+    def _processFFprobeOutput(self, probeDetails):
+        formatDetails = probeDetails.get('format', {})
+        formatTags = self._getTags(formatDetails)
+
+        title = formatTags.get('title', None)
+        album = formatTags.get('album', None)
+        artist = formatTags.get('artist', None)
+        duration = None
+        if formatDetails.get('duration', None) not in [None, ""]:
+            try:
+                duration = int(float(formatDetails['duration']))
+            except:
+                log("FfprobeCmd: Invalid duration %s" % formatDetails['duration'])
+
+        log("FfprobeCmd: Title = %s, Album = %s, Duration = %s" % (title, album, duration))
+
+        chapters = []
+        totalDuration = None
+        chapterNum = 1
+        for chapter in probeDetails.get('chapters', []):
+            try:
+                start_time = int(float(chapter.get('start_time', 0)))
+                end_time = int(float(chapter.get('end_time', 0)))
+            except:
+                log("FfprobeCmd: Invalid chapter times %s" % str(chapter))
+                continue
+
+            chapterTitle = self._getTags(chapter).get('title', None)
+            if chapterTitle in [None, ""]:
+                chapterTitle = self._getDefaultChapterName(chapterNum)
+
+            chapterNum += 1
+            log("FfprobeCmd: Chapter details. Title: %s, start_time: %s, end_time: %s, duration: %d" % (chapterTitle, start_time, end_time, end_time - start_time))
+
+            detail = {'title': chapterTitle.strip(), 'startTime': start_time, 'endTime': end_time, 'duration': end_time - start_time}
+            chapters.append(detail)
+
+            # The total Duration is always the end of the last chapter
+            totalDuration = end_time
+
+        # If there is no duration, then use the last chapter duration
+        if duration in [None, 0, '']:
+            duration = totalDuration
+
+        if (title in [None, ""]) and (album in [None, ""]) and (duration in [None, ""]) and (len(chapters) < 1):
+            return None
+        return {'title': title, 'album': album, 'artist': artist, 'duration': duration, 'chapters': chapters}
+
+    # Gets the tags from a section of the ffprobe output, the case of the names
+    # depends on the type of file, so they are all made lower case
+    def _getTags(self, details):
+        tags = {}
+        for key, value in details.get('tags', {}).items():
+            tags[key.lower()] = value
+        return tags
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+import sys
+import time
+import hashlib
+import urlparse
+import traceback
+import xbmc
+import xbmcgui
+
+if sys.version_info >= (2, 7):
+    import json
+else:
+    import simplejson as json
+
+# Import the common settings
+from settings import Settings
+from settings import log
+from settings import os_path_join
+from settings import file_fingerprint
+from settings import list_dir
+from settings import clear_dir_cache
+from database import AudioBooksDB
+
+# Property set on the home window to tell the service there are folders waiting to be checked
+REFRESH_QUEUED_PROPERTY = "script.audiobooks.refreshQueued"
+
+# Start of the paths of the listings created by the plugin
+PLUGIN_URL = "plugin://script.audiobooks/"
+
+
+# Converts a folder into unicode without the trailing separator, so folders
+# from the database and from a URL can be compared
+def _folderKey(folder):
+    try:
+        folder = folder.decode('utf-8')
+    except:
+        pass
+    if folder.endswith("/") or folder.endswith("\\"):
+        folder = folder[:-1]
+    return folder
+
+
+#########################################################
+# Class to hold the classified contents of a folder, the
+# contents are saved in the database so that folders on
+# remote shares do not need to be listed every time they
+# are displayed
+#########################################################
+class FolderSnapshot():
+    def __init__(self, folder):
+        self.folder = folder
+        # Sub-folders that are not books, each one a dictionary of name, icon and fanart
+        self.subFolders = []
+        # Names of the sub-folders that are books with each audio file as a chapter
+        self.bookDirs = []
+        # Names of the m4b files in the folder
+        self.m4bFiles = []
+        # Names of the image files in the folder
+        self.artFiles = []
+        self.fingerprint = None
+        self.scannedTime = 0
+
+    # Gets the contents of the given folder, using the stored snapshot if there is one.
+    # Adding or removing a book changes the folder itself, so that is checked every
+    # time, the sub-folders are only checked once the snapshot is stale
+    @staticmethod
+    def getSnapshot(folder):
+        snapshot = FolderSnapshot(folder)
+        if not snapshot._load():
+            snapshot.scan()
+        elif not snapshot._isFolderUnchanged():
+            log("FolderSnapshot: Folder %s has been modified" % folder)
+            clear_dir_cache()
+            snapshot.scan()
+        return snapshot
+
+    # Gets the full path for each of the books in the folder
+    def getAudioBooks(self):
+        audioBooks = []
+        for bookDir in self.bookDirs:
+            audioBooks.append(os_path_join(self.folder, bookDir))
+        for m4bFile in self.m4bFiles:
+            audioBooks.append(os_path_join(self.folder, m4bFile))
+        return audioBooks
+
+    # Checks if the snapshot is older than the time it is allowed to be used for
+    def isStale(self):
+        return (time.time() - self.scannedTime) > Settings.getFolderCacheTime()
+
+    # Checks the folder has not changed since the snapshot was taken, if it has
+    # then the folder is read again, returns True if the contents changed
+    def refresh(self):
+        fingerprint = self._getFingerprint()
+        if (fingerprint is not None) and (fingerprint == self.fingerprint):
+            log("FolderSnapshot: No changes to %s" % self.folder)
+            self._save()
+            return False
+
+        # Make sure the folder is actually read again, not what was listed earlier
+        clear_dir_cache()
+        oldContents = json.dumps(self._getContents())
+        self.scan()
+        return json.dumps(self._getContents()) != oldContents
+
+    # Asks the service to check the folder for changes, so that the plugin is not
+    # held up reading the folder once the listing has been displayed
+    def queueRefresh(self):
+        log("FolderSnapshot: Queueing check for changes to %s" % self.folder)
+        AudioBooksDB.getInstance().queueFolderRefresh(self.folder)
+        xbmcgui.Window(10000).setProperty(REFRESH_QUEUED_PROPERTY, "true")
+
+    # Checks each of the folders that have been queued for changes, returns the
+    # folders where the contents changed
+    @staticmethod
+    def refreshQueued():
+        homeWindow = xbmcgui.Window(10000)
+        if homeWindow.getProperty(REFRESH_QUEUED_PROPERTY) != "true":
+            return []
+        # Cleared before the queue is read, so a folder added meanwhile is not missed
+        homeWindow.clearProperty(REFRESH_QUEUED_PROPERTY)
+
+        changedFolders = []
+        for folder in AudioBooksDB.getInstance().takeQueuedFolderRefreshes():
+            snapshot = FolderSnapshot(folder)
+            if not snapshot._load():
+                snapshot.scan()
+                changedFolders.append(folder)
+            # The same folder may have been queued more than once
+            elif snapshot.isStale() and snapshot.refresh():
+                log("FolderSnapshot: Contents of %s have changed" % folder)
+                changedFolders.append(folder)
+        return changedFolders
+
+    # Checks if the plugin listing for the folder is the one being shown, so that a
+    # refresh does not reload the listing of another addon or window
+    @staticmethod
+    def isDisplayed(folder):
+        folderPath = xbmc.getInfoLabel('Container.FolderPath')
+        if not folderPath.startswith(PLUGIN_URL):
+            return False
+
+        args = {}
+        if '?' in folderPath:
+            args = urlparse.parse_qs(folderPath.split('?', 1)[1])
+
+        # The top level of the plugin shows the audiobook folder from the settings
+        mode = args.get('mode', None)
+        if mode is None:
+            displayedFolder = Settings.getAudioBookFolder()
+        elif (mode[0] == 'directory') and (len(args.get('directory', [])) > 0):
+            displayedFolder = args['directory'][0]
+        else:
+            return False
+
+        if displayedFolder in [None, ""]:
+            return False
+        return _folderKey(displayedFolder) == _folderKey(folder)
+
+    # Reads all the contents of the folder and saves them to the database
+    def scan(self):
+        log("FolderSnapshot: Reading contents of %s" % self.folder)
+
+        self.subFolders = []
+        self.bookDirs = []
+        self.m4bFiles = []
+        self.artFiles = []
+
+        try:
+            dirs, files = list_dir(self.folder)
+        except:
+            log("FolderSnapshot: Failed to list folder %s: %s" % (self.folder, traceback.format_exc()), xbmc.LOGERROR)
+            return
+        files.sort()
+        dirs.sort()
+
+        for adir in dirs:
+            if adir.startswith('.'):
+                continue
+
+            subDirs, subFiles = list_dir(os_path_join(self.folder, adir))
+
+            # A directory that contains audio files (non m4b) is a book with each file as a chapter
+            isBookDir = False
+            iconImage = None
+            fanartImage = None
+            for fileInDir in subFiles:
+                if Settings.isPlainAudioFile(fileInDir):
+                    isBookDir = True
+                    break
+                elif fileInDir.lower() in ['fanart.jpg', 'fanart.png']:
+                    fanartImage = fileInDir
+                elif fileInDir.lower() in ['folder.jpg', 'folder.png']:
+                    iconImage = fileInDir
+
+            if isBookDir:
+                self.bookDirs.append(adir)
+            else:
+                self.subFolders.append({'name': adir, 'icon': iconImage, 'fanart': fanartImage})
+
+        for aFile in files:
+            if aFile.lower().endswith('.m4b'):
+                self.m4bFiles.append(aFile)
+            elif aFile.lower().endswith('.jpg') or aFile.lower().endswith('.png'):
+                self.artFiles.append(aFile)
+
+        self.fingerprint = self._getFingerprint()
+        self._save()
+
+    # Loads the snapshot from the database, returns False if there is not one
+    def _load(self):
+        details = AudioBooksDB.getInstance().getFolderSnapshot(self.folder)
+        if details is None:
+            return False
+
+        try:
+            contents = json.loads(details['contents'])
+            self.subFolders = contents['subFolders']
+            self.bookDirs = contents['bookDirs']
+            self.m4bFiles = contents['m4bFiles']
+            self.artFiles = contents['artFiles']
+        except:
+            log("FolderSnapshot: Failed to read snapshot for %s: %s" % (self.folder, traceback.format_exc()))
+            return False
+
+        self.fingerprint = details['fingerprint']
+        self.scannedTime = details['scannedTime']
+        return True
+
+    def _save(self):
+        self.scannedTime = int(time.time())
+        AudioBooksDB.getInstance().setFolderSnapshot(self.folder, self.fingerprint, json.dumps(self._getContents()), self.scannedTime)
+
+    def _getContents(self):
+        return {'subFolders': self.subFolders, 'bookDirs': self.bookDirs, 'm4bFiles': self.m4bFiles, 'artFiles': self.artFiles}
+
+    # Checks the fingerprint of the folder itself against the one at the start of the
+    # stored fingerprint, this does not need any of the sub-folders to be checked
+    def _isFolderUnchanged(self):
+        if self.fingerprint in [None, ""]:
+            return False
+        return self.fingerprint.split("|")[0] == file_fingerprint(self.folder)
+
+    # A folder only gets a new modified time when items are added or removed from it
+    # so the fingerprint also includes each of the sub-folders, the fingerprint of
+    # the folder itself is kept at the start so it can be checked on its own
+    def _getFingerprint(self):
+        folderFingerprint = file_fingerprint(self.folder)
+        if folderFingerprint is None:
+            return None
+
+        fingerprints = [folderFingerprint]
+        for adir in [subFolder['name'] for subFolder in self.subFolders] + self.bookDirs:
+            subFingerprint = file_fingerprint(os_path_join(self.folder, adir))
+            if subFingerprint is None:
+                return None
+            fingerprints.append(subFingerprint)
+
+        return "%s|%s" % (folderFingerprint, hashlib.md5("|".join(fingerprints)).hexdigest())
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+import os
+import struct
+import traceback
+
+# Import the common settings
+from settings import log
+
+# Nero chapter start times are stored in units of 100 nanoseconds
+NERO_CHAPTER_TIMESCALE = 10000000
+
+# The chapter track is only made of small text samples, anything bigger than this
+# is not a chapter track that can be read
+MAX_CHAPTER_TABLE_SIZE = 1024 * 1024
+
+
+#########################################################
+# Class to read the chapters, cover and duration straight
+# from the boxes of an MP4 (m4b) file. Only the headers of
+# the boxes in moov are read, along with the few boxes that
+# hold the details, everything else (including the audio
+# and its sample tables) is skipped over, so this is fast
+# even for large books and books on network shares
+#########################################################
+class MP4Reader():
+    def __init__(self, mp4File):
+        # Any file object that supports read, seek and tell
+        self.mp4File = mp4File
+        self.fileSize = mp4File.seek(0, os.SEEK_END)
+        if self.fileSize is None:
+            self.fileSize = mp4File.tell()
+
+        self.timescale = 0
+        self.duration = 0
+        self.neroChapters = []
+        self.coverData = None
+        self.tracks = []
+
+    # Reads the details from the file, returning the duration (in seconds), the
+    # chapters (as a list of start time and title) and the cover image data
+    def getDetails(self):
+        moov = self._findBox(b'moov', 0, self.fileSize)
+        if moov is None:
+            log("MP4Reader: No moov box found in %s" % getattr(self.mp4File, 'name', ''))
+            return None
+
+        for boxType, start, end in self._getBoxes(moov[0], moov[1]):
+            if boxType == b'mvhd':
+                self._readMovieHeader(start, end)
+            elif boxType == b'udta':
+                self._readUserData(start, end)
+            elif boxType == b'trak':
+                self._readTrack(start, end)
+
+        duration = 0
+        if self.timescale > 0:
+            duration = int(self.duration / self.timescale)
+
+        # Use the chapter track if there is one, it is what Apple players show
+        chapters = self._readChapterTrack()
+        if len(chapters) < 1:
+            chapters = self.neroChapters
+
+        log("MP4Reader: Found duration = %d, chapters = %d, cover = %s" % (duration, len(chapters), self.coverData is not None))
+        return {'duration': duration, 'chapters': chapters, 'coverData': self.coverData}
+
+    # Lists the boxes between the given positions, as the type of the box and the
+    # start and end of its contents
+    def _getBoxes(self, start, end):
+        boxes = []
+        position = start
+        while position + 8 <= end:
+            self.mp4File.seek(position)
+            header = self.mp4File.read(8)
+            if len(header) < 8:
+                break
+            boxSize, boxType = struct.unpack('>I4s', header)
+            headerSize = 8
+            if boxSize == 1:
+                # The size is too big for 32 bits
+                largeSize = self.mp4File.read(8)
+                if len(largeSize) < 8:
+                    break
+                boxSize = struct.unpack('>Q', largeSize)[0]
+                headerSize = 16
+            elif boxSize == 0:
+                # The box runs to the end of whatever it is in
+                boxSize = end - position
+
+            if (boxSize < headerSize) or (position + boxSize > end):
+                log("MP4Reader: Invalid box %s at %d" % (repr(boxType), position))
+                break
+
+            boxes.append((boxType, position + headerSize, position + boxSize))
+            position += boxSize
+        return boxes
+
+    def _findBox(self, boxType, start, end):
+        for box in self._getBoxes(start, end):
+            if box[0] == boxType:
+                return (box[1], box[2])
+        return None
+
+    def _readData(self, start, end):
+        self.mp4File.seek(start)
+        return self.mp4File.read(end - start)
+
+    # The movie header holds the length of the whole book
+    def _readMovieHeader(self, start, end):
+        data = self._readData(start, min(end, start + 32))
+        if len(data) < 20:
+            return
+        version = ord(data[0:1])
+        if version == 1:
+            if len(data) < 32:
+                return
+            self.timescale, self.duration = struct.unpack('>IQ', data[20:32])
+        else:
+            self.timescale, self.duration = struct.unpack('>II', data[12:20])
+
+    def _readUserData(self, start, end):
+        for boxType, boxStart, boxEnd in self._getBoxes(start, end):
+            if boxType == b'chpl':
+                self._readNeroChapters(boxStart, boxEnd)
+            elif boxType == b'meta':
+                self._readCover(boxStart, boxEnd)
+
+    # Nero chapters are a list of start times and titles
+    def _readNeroChapters(self, start, end):
+        data = self._readData(start, end)
+        if len(data) < 5:
+            return
+        position = 4
+        # Version 1 has an extra four bytes before the number of chapters
+        if ord(data[0:1]) == 1:
+            position += 4
+        if position >= len(data):
+            return
+        numChapters = ord(data[position:position + 1])
+        position += 1
+
+        chapters = []
+        for i in range(numChapters):
+            if position + 9 > len(data):
+                break
+            chapterStart, titleLength = struct.unpack('>QB', data[position:position + 9])
+            position += 9
+            chapterTitle = self._decodeText(data[position:position + titleLength])
+            position += titleLength
+            chapters.append((float(chapterStart) / NERO_CHAPTER_TIMESCALE, chapterTitle))
+        self.neroChapters = chapters
+
+    # Finds where the cover image is without reading it, returning the start and
+    # end of the image data, None if there is no cover
+    def getCoverPosition(self):
+        moov = self._findBox(b'moov', 0, self.fileSize)
+        if moov is None:
+            return None
+        udta = self._findBox(b'udta', moov[0], moov[1])
+        if udta is None:
+            return None
+        meta = self._findBox(b'meta', udta[0], udta[1])
+        if meta is None:
+            return None
+        return self._findCover(meta[0], meta[1])
+
+    def _readCover(self, start, end):
+        coverPosition = self._findCover(start, end)
+        if coverPosition is not None:
+            self.coverData = self._readData(coverPosition[0], coverPosition[1])
+
+    # Finds the first image in meta/ilst/covr/data
+    def _findCover(self, start, end):
+        # In MP4 files meta has a version and flags before its contents, but not
+        # in QuickTime files, where it starts straight away with hdlr
+        firstHeader = self._readData(start, min(end, start + 8))
+        if firstHeader[4:8] != b'hdlr':
+            start += 4
+
+        ilst = self._findBox(b'ilst', start, end)
+        if ilst is None:
+            return None
+        covr = self._findBox(b'covr', ilst[0], ilst[1])
+        if covr is None:
+            return None
+        data = self._findBox(b'data', covr[0], covr[1])
+        if data is None:
+            return None
+        # Skip the type and locale of the data
+        return (data[0] + 8, data[1])
+
+    # Records the details of a track, the sample tables are only found here, they
+    # are only read for a chapter track
+    def _readTrack(self, start, end):
+        track = {'id': None, 'chapterIds': [], 'handler': None, 'timescale': 0, 'tables': {}}
+
+        for boxType, boxStart, boxEnd in self._getBoxes(start, end):
+            if boxType == b'tkhd':
+                data = self._readData(boxStart, min(boxEnd, boxStart + 24))
+                if len(data) >= 24:
+                    if ord(data[0:1]) == 1:
+                        track['id'] = struct.unpack('>I', data[20:24])[0]
+                    else:
+                        track['id'] = struct.unpack('>I', data[12:16])[0]
+            elif boxType == b'tref':
+                chap = self._findBox(b'chap', boxStart, boxEnd)
+                if chap is not None:
+                    data = self._readData(chap[0], chap[1])
+                    track['chapterIds'] = list(struct.unpack('>%dI' % (len(data) // 4), data[:(len(data) // 4) * 4]))
+            elif boxType == b'mdia':
+                self._readMedia(boxStart, boxEnd, track)
+
+        self.tracks.append(track)
+
+    def _readMedia(self, start, end, track):
+        for boxType, boxStart, boxEnd in self._getBoxes(start, end):
+            if boxType == b'mdhd':
+                data = self._readData(boxStart, min(boxEnd, boxStart + 24))
+                if len(data) >= 24 and ord(data[0:1]) == 1:
+                    track['timescale'] = struct.unpack('>I', data[20:24])[0]
+                elif len(data) >= 16:
+                    track['timescale'] = struct.unpack('>I', data[12:16])[0]
+            elif boxType == b'hdlr':
+                data = self._readData(boxStart, min(boxEnd, boxStart + 12))
+                track['handler'] = data[8:12]
+            elif boxType == b'minf':
+                stbl = self._findBox(b'stbl', boxStart, boxEnd)
+                if stbl is not None:
+                    for tableType, tableStart, tableEnd in self._getBoxes(stbl[0], stbl[1]):
+                        if tableType in [b'stts', b'stsc', b'stsz', b'stco', b'co64']:
+                            track['tables'][tableType] = (tableStart, tableEnd)
+
+    # Reads the chapters from the text track that another track refers to as its
+    # chapters, each sample is the title of a chapter
+    def _readChapterTrack(self):
+        chapterIds = []
+        for track in self.tracks:
+            chapterIds.extend(track['chapterIds'])
+
+        for track in self.tracks:
+            if (track['id'] not in chapterIds) or (track['handler'] not in [b'text', b'sbtl']):
+                continue
+            try:
+                chapters = self._readTextSamples(track)
+            except:
+                log("MP4Reader: Failed to read chapter track %s: %s" % (str(track['id']), traceback.format_exc()))
+                chapters = []
+            if len(chapters) > 0:
+                return chapters
+        return []
+
+    def _readTextSamples(self, track):
+        tables = track['tables']
+        if (track['timescale'] < 1) or (b'stts' not in tables) or (b'stsc' not in tables) or (b'stsz' not in tables):
+            return []
+
+        # The size of each sample
+        stszData = self._readTableData(tables[b'stsz'])
+        sampleSize, numSamples = struct.unpack('>II', stszData[4:12])
+        if sampleSize == 0:
+            sampleSizes = list(struct.unpack('>%dI' % numSamples, stszData[12:12 + (numSamples * 4)]))
+        else:
+            sampleSizes = [sampleSize] * min(numSamples, MAX_CHAPTER_TABLE_SIZE)
+
+        # The start time of each sample
+        sampleTimes = []
+        currentTime = 0
+        for count, delta in self._readTable(tables[b'stts'], '>II'):
+            for i in range(min(count, len(sampleSizes) - len(sampleTimes))):
+                sampleTimes.append(float(currentTime) / track['timescale'])
+                currentTime += delta
+
+        # Where each chunk of samples starts
+        if b'co64' in tables:
+            chunkOffsets = [entry[0] for entry in self._readTable(tables[b'co64'], '>Q')]
+        elif b'stco' in tables:
+            chunkOffsets = [entry[0] for entry in self._readTable(tables[b'stco'], '>I')]
+        else:
+            return []
+
+        # Work out where each sample is from how many samples are in each chunk
+        sampleOffsets = []
+        samplesToChunk = self._readTable(tables[b'stsc'], '>III')
+        for idx, entry in enumerate(samplesToChunk):
+            firstChunk, samplesPerChunk, descriptionId = entry
+            lastChunk = len(chunkOffsets)
+            if idx + 1 < len(samplesToChunk):
+                lastChunk = samplesToChunk[idx + 1][0] - 1
+            for chunk in range(firstChunk, lastChunk + 1):
+                sampleOffset = chunkOffsets[chunk - 1]
+                for i in range(samplesPerChunk):
+                    if len(sampleOffsets) >= len(sampleSizes):
+                        break
+                    sampleOffsets.append(sampleOffset)
+                    sampleOffset += sampleSizes[len(sampleOffsets) - 1]
+
+        chapters = []
+        for startTime, sampleOffset, size in zip(sampleTimes, sampleOffsets, sampleSizes):
+            # Each sample is the length of the text followed by the text
+            sample = self._readData(sampleOffset, sampleOffset + size)
+            chapterTitle = u""
+            if len(sample) >= 2:
+                textLength = struct.unpack('>H', sample[0:2])[0]
+                chapterTitle = self._decodeText(sample[2:2 + textLength])
+            chapters.append((startTime, chapterTitle))
+        return chapters
+
+    def _readTableData(self, table):
+        start, end = table
+        if end - start > MAX_CHAPTER_TABLE_SIZE:
+            raise ValueError("Chapter table too large")
+        return self._readData(start, end)
+
+    # Reads the entries of a table that starts with a version, flags and the number
+    # of entries
+    def _readTable(self, table, entryFormat):
+        data = self._readTableData(table)
+        numEntries = struct.unpack('>I', data[4:8])[0]
+        entrySize = struct.calcsize(entryFormat)
+        numEntries = min(numEntries, (len(data) - 8) // entrySize)
+        entries = []
+        for idx in range(numEntries):
+            position = 8 + (idx * entrySize)
+            entries.append(struct.unpack(entryFormat, data[position:position + entrySize]))
+        return entries
+
+    def _decodeText(self, text):
+        # Text may be UTF-16 if it starts with a byte order mark
+        if text.startswith(b'\xfe\xff') or text.startswith(b'\xff\xfe'):
+            try:
+                return text.decode('utf-16')
+            except:
+                pass
+        try:
+            return text.decode('utf-8')
+        except:
+            return text.decode('latin-1')
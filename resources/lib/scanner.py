@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+import sys
+import time
+import traceback
+import xbmc
+
+if sys.version_info >= (2, 7):
+    import json
+else:
+    import simplejson as json
+
+# Import the common settings
+from settings import Settings
+from settings import log
+from settings import os_path_join
+from settings import clear_dir_cache
+from database import AudioBooksDB
+from audiobook import AudioBookHandler
+from foldersnapshot import FolderSnapshot
+from covercache import CoverCache
+from tempcopies import TempCopies
+
+# Name of the value saved in the database with the folders left to scan
+SCAN_RESUME_PROPERTY = "scanResumeFolders"
+
+
+# Converts a path into unicode so it can be saved as json
+def _toUnicode(value):
+    try:
+        return value.decode('utf-8')
+    except:
+        return value
+
+
+#########################################################
+# Class to walk the audiobook folder and make sure every
+# book in it is up to date in the database
+#########################################################
+class LibraryScanner():
+    def __init__(self, progressDialog=None, stopWhilePlaying=False):
+        self.progressDialog = progressDialog
+        self.stopWhilePlaying = stopWhilePlaying
+        self.monitor = xbmc.Monitor()
+        self.numBooks = 0
+        self.numScanned = 0
+
+    # Scans the given folder (and all the folders in it), only books that are new
+    # or have changed since they were last scanned will be read again. If maxSeconds
+    # is given then no more folders are started after that long, returns True once
+    # every folder has been checked, otherwise the next call carries on from where
+    # this one stopped
+    def scan(self, audioBookFolder=None, maxSeconds=None):
+        if audioBookFolder in [None, ""]:
+            audioBookFolder = Settings.getAudioBookFolder()
+
+        if audioBookFolder in [None, ""]:
+            log("LibraryScanner: No audiobook folder set")
+            return True
+
+        stopTime = None
+        if maxSeconds is not None:
+            stopTime = time.time() + maxSeconds
+
+        foldersToScan = self._getResumeFolders(audioBookFolder)
+        if foldersToScan is None:
+            log("LibraryScanner: Scanning %s" % audioBookFolder)
+            # The covers may have been changed since the cache was last listed
+            CoverCache.clear()
+            foldersToScan = [audioBookFolder]
+
+        while len(foldersToScan) > 0:
+            subFolders = self._scanFolder(foldersToScan[0])
+
+            # If stopped part way through a folder, then leave it in the list so
+            # that it is checked again next time
+            if subFolders is None:
+                log("LibraryScanner: Scan stopped, %d folders left to check" % len(foldersToScan))
+                return False
+
+            foldersToScan = foldersToScan[1:] + subFolders
+            self._saveResumeFolders(audioBookFolder, foldersToScan)
+
+            if (len(foldersToScan) > 0) and (stopTime is not None) and (time.time() >= stopTime):
+                log("LibraryScanner: Scan paused, %d folders left to check" % len(foldersToScan))
+                return False
+
+        log("LibraryScanner: Scan complete, %d books checked, %d scanned" % (self.numBooks, self.numScanned))
+        return True
+
+    # Checks if the scan should stop before reading the next book, when scanning
+    # in the background it gives way to anything that is being played
+    def _isStopRequested(self):
+        if self.monitor.abortRequested():
+            return True
+        if self.stopWhilePlaying and xbmc.Player().isPlaying():
+            return True
+        return False
+
+    # Gets the folders still to be checked if the last scan of this folder did not
+    # finish, None if there is no scan to carry on with
+    def _getResumeFolders(self, audioBookFolder):
+        try:
+            resumeDetails = AudioBooksDB.getInstance().getProperty(SCAN_RESUME_PROPERTY)
+            if resumeDetails not in [None, ""]:
+                resumeDetails = json.loads(resumeDetails)
+                if resumeDetails['folder'] == _toUnicode(audioBookFolder):
+                    log("LibraryScanner: Resuming scan, %d folders left to check" % len(resumeDetails['pending']))
+                    return resumeDetails['pending']
+        except:
+            log("LibraryScanner: Failed to read resume details: %s" % traceback.format_exc())
+        return None
+
+    # Records the folders still to be checked, so the scan can carry on from there if it is stopped
+    def _saveResumeFolders(self, audioBookFolder, foldersToScan):
+        resumeDetails = None
+        if len(foldersToScan) > 0:
+            resumeDetails = json.dumps({'folder': _toUnicode(audioBookFolder), 'pending': [_toUnicode(folder) for folder in foldersToScan]})
+        AudioBooksDB.getInstance().setProperty(SCAN_RESUME_PROPERTY, resumeDetails)
+
+    # Checks all the books in a folder, returning the sub-folders that need scanning,
+    # or None if the scan was stopped before all the books were checked
+    def _scanFolder(self, folder):
+        log("LibraryScanner: Checking folder %s" % folder)
+
+        if self.progressDialog is not None:
+            self.progressDialog.update(0, message=folder)
+
+        # Anything listed for an earlier folder may have changed since
+        clear_dir_cache()
+
+        # Reading the folder also updates the snapshot used when it is displayed
+        folderSnapshot = FolderSnapshot(folder)
+        folderSnapshot.scan()
+
+        subFolders = []
+        for subFolder in folderSnapshot.subFolders:
+            subFolders.append(os_path_join(folder, subFolder['name']))
+        audioBooks = folderSnapshot.getAudioBooks()
+
+        # Each book is saved as soon as it has been read, rather than one transaction
+        # for the folder, so that the database is not locked while the media is read
+        for idx, audioBookFile in enumerate(audioBooks):
+            if self._isStopRequested():
+                subFolders = None
+                break
+
+            if self.progressDialog is not None:
+                self.progressDialog.update(int((idx * 100) / len(audioBooks)), message=audioBookFile)
+
+            self.numBooks += 1
+            try:
+                audioBookHandler = AudioBookHandler.createHandler(audioBookFile)
+                if audioBookHandler.refreshIfChanged():
+                    self.numScanned += 1
+                # Make sure the chapters and cover are also stored, so that nothing
+                # needs to be read from the media when the book is displayed
+                audioBookHandler.getChapterDetails()
+                audioBookHandler.getCoverImage()
+                del audioBookHandler
+            except:
+                log("LibraryScanner: Failed to scan %s: %s" % (audioBookFile, traceback.format_exc()), xbmc.LOGERROR)
+
+        # Any media copied locally to read the books is not needed any more
+        TempCopies.clear()
+
+        return subFolders
+
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 import os
+import re
+import uuid
 import xbmc
 import xbmcaddon
 import xbmcvfs
@@ -8,6 +10,17 @@ ADDON = xbmcaddon.Addon(id='script.audiobooks')
 ADDON_ID = ADDON.getAddonInfo('id')
 ICON = ADDON.getAddonInfo('icon')
 
+# Contents of the directories that have already been listed
+DIR_CACHE = {}
+
+# Numbers in titles are padded to this many digits when sorting
+SORT_KEY_DIGITS = 10
+
+# Random token chosen once for each interpreter, used in the names of temporary
+# files. Kodi runs the service and the plugin in the same process, so the
+# process id would be shared by both of them
+INSTANCE_TOKEN = uuid.uuid4().hex
+
 
 # Common logging module
 def log(txt, loglevel=xbmc.LOGDEBUG):
@@ -81,6 +94,76 @@ def dir_exists(dirpath):
     return xbmcvfs.exists(directoryPath)
 
 
+# Lists the contents of a directory, each directory is only read once and then
+# the same result is used for the rest of this invocation. Call clear_dir_cache
+# if the directory may have changed since it was listed
+def list_dir(dirpath):
+    key = dirpath
+    if key.endswith("/") or key.endswith("\\"):
+        key = key[:-1]
+
+    listing = DIR_CACHE.get(key, None)
+    if listing is None:
+        listing = xbmcvfs.listdir(dirpath)
+        DIR_CACHE[key] = listing
+
+    # Return copies, as the callers will often sort them
+    dirs, files = listing
+    return list(dirs), list(files)
+
+
+def clear_dir_cache():
+    DIR_CACHE.clear()
+
+
+# Checks if a file exists using the listing of the directory it is in, so checking
+# for a number of files in the same directory only needs it to be read once
+def file_exists(filepath):
+    pathParts = os_path_split(filepath)
+    if len(pathParts) < 2:
+        return xbmcvfs.exists(filepath)
+
+    # Make sure both are unicode when comparing
+    filename = pathParts[1]
+    try:
+        filename = filename.decode("utf-8")
+    except:
+        pass
+
+    dirs, files = list_dir(pathParts[0])
+    for aFile in files:
+        try:
+            aFile = aFile.decode("utf-8")
+        except:
+            pass
+        if aFile == filename:
+            return True
+    return False
+
+
+# Gets a value that will change if the given file is modified or replaced,
+# None is returned if the file details could not be read
+def file_fingerprint(filepath):
+    try:
+        fileStat = xbmcvfs.Stat(filepath)
+        return "%d:%d" % (fileStat.st_mtime(), fileStat.st_size())
+    except:
+        log("Failed to get fingerprint for %s" % filepath)
+    return None
+
+
+# Gets the key used to sort by the given title, case is ignored and numbers
+# are padded with zeros so that "Part 2" comes before "Part 10"
+def get_sort_key(title):
+    if title in [None, ""]:
+        return u""
+    try:
+        title = title.decode("utf-8")
+    except:
+        pass
+    return re.sub(r'\d+', lambda match: match.group(0).zfill(SORT_KEY_DIGITS), u" ".join(title.lower().split()))
+
+
 ##############################
 # Stores Various Settings
 ##############################
@@ -212,6 +295,34 @@ class Settings():
             audioFileType = True
         return audioFileType
 
+    # Gets how long (in seconds) a folder listing can be used before checking for changes
+    @staticmethod
+    def getFolderCacheTime():
+        try:
+            return int(ADDON.getSetting("folderCacheMinutes")) * 60
+        except:
+            return 60 * 60
+
+    @staticmethod
+    def isBackgroundIndexEnabled():
+        return ADDON.getSetting("backgroundIndex") == 'true'
+
+    # Gets the number of tracks that can be read at the same time
+    @staticmethod
+    def getMetadataWorkers():
+        try:
+            return max(1, int(ADDON.getSetting("metadataWorkers")))
+        except:
+            return 2
+
+    # Gets the number of books (or chapters) to show in each page of a listing, 0 shows them all
+    @staticmethod
+    def getPageSize():
+        try:
+            return max(0, int(ADDON.getSetting("pageSize")))
+        except:
+            return 100
+
     @staticmethod
     def isDeleteSupported():
         return ADDON.getSetting("deleteSupported") == 'true'
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import hashlib
+import threading
+import traceback
+import xbmcvfs
+
+# Import the common settings
+from settings import Settings
+from settings import log
+from settings import os_path_join
+from settings import os_path_split
+from settings import file_fingerprint
+from settings import INSTANCE_TOKEN
+
+# Maximum size of the copies that are kept once they are no longer being used,
+# the least recently used copies are removed first
+TEMP_COPY_BUDGET = 1024 * 1024 * 1024
+
+# Copies that have been made by this interpreter, keyed by the source file and its
+# fingerprint, so a file that changes is copied again
+COPY_INDEX = {}
+INDEX_LOCK = threading.Lock()
+
+
+# Gets the key a copy is stored under, this is also used to give each copy a
+# unique name, files with the same name in different folders would otherwise
+# be copied to the same place
+def _getCopyKey(sourcePath):
+    keySource = sourcePath
+    try:
+        keySource = keySource.encode("utf-8")
+    except:
+        pass
+    fingerprint = file_fingerprint(sourcePath)
+    if fingerprint is not None:
+        keySource = "%s|%s" % (keySource, fingerprint)
+    return hashlib.md5(keySource).hexdigest()
+
+
+#########################################################
+# Class to manage the local copies of media on network
+# shares (needed by FFmpeg), each file is only copied once
+# however many times it is read, and copies are kept until
+# there is no longer space for them
+#########################################################
+class TempCopies():
+    # Gets a local copy of the given file, None if it could not be copied. Every
+    # call must be matched by a call to release once the copy has been used
+    @staticmethod
+    def acquire(sourcePath):
+        copyKey = _getCopyKey(sourcePath)
+
+        isNewCopy = False
+        with INDEX_LOCK:
+            entry = COPY_INDEX.get(copyKey, None)
+            if entry is None:
+                fileExt = os.path.splitext(os_path_split(sourcePath)[-1])[1]
+                localPath = os_path_join(Settings.getTempLocation(), "copy_%s_%s%s" % (INSTANCE_TOKEN, copyKey, fileExt))
+                entry = {'localPath': localPath, 'size': 0, 'refCount': 0, 'lastUsed': 0, 'ready': threading.Event(), 'failed': False}
+                COPY_INDEX[copyKey] = entry
+                isNewCopy = True
+            entry['refCount'] += 1
+
+        if isNewCopy:
+            TempCopies._copy(sourcePath, copyKey, entry)
+        else:
+            # Another thread may still be copying the file
+            entry['ready'].wait()
+            log("TempCopies: Re-using copy %s for %s" % (entry['localPath'], sourcePath))
+
+        if entry['failed']:
+            return None
+
+        entry['lastUsed'] = time.time()
+        return entry['localPath']
+
+    # Records that a copy is no longer being used, it is kept in case it is
+    # needed again unless the space is needed for other copies
+    @staticmethod
+    def release(localPath):
+        with INDEX_LOCK:
+            for entry in COPY_INDEX.values():
+                if entry['localPath'] == localPath:
+                    entry['refCount'] = max(0, entry['refCount'] - 1)
+                    entry['lastUsed'] = time.time()
+                    break
+            TempCopies._removeUnused(TEMP_COPY_BUDGET)
+
+    # Removes all the copies that are not being used, called when the
+    # invocation is finished with them
+    @staticmethod
+    def clear():
+        with INDEX_LOCK:
+            TempCopies._removeUnused(None)
+
+    # Removes everything from the temporary directory, this is anything left
+    # behind if Kodi was stopped (or crashed) while files were being read
+    @staticmethod
+    def removeLeftovers():
+        tempLocation = Settings.getTempLocation()
+        try:
+            dirs, files = xbmcvfs.listdir(tempLocation)
+        except:
+            log("TempCopies: Failed to list %s: %s" % (tempLocation, traceback.format_exc()))
+            return
+
+        for aFile in files:
+            log("TempCopies: Removing leftover file %s" % aFile)
+            xbmcvfs.delete(os_path_join(tempLocation, aFile))
+
+    @staticmethod
+    def _copy(sourcePath, copyKey, entry):
+        try:
+            if xbmcvfs.copy(sourcePath, entry['localPath']):
+                log("TempCopies: copy successful for %s" % entry['localPath'])
+                entry['size'] = xbmcvfs.Stat(entry['localPath']).st_size()
+            else:
+                log("TempCopies: copy failed from %s to %s" % (sourcePath, entry['localPath']))
+                entry['failed'] = True
+        except:
+            log("TempCopies: Failed to copy file %s to local directory: %s" % (sourcePath, traceback.format_exc()))
+            entry['failed'] = True
+
+        with INDEX_LOCK:
+            if entry['failed']:
+                del COPY_INDEX[copyKey]
+                if xbmcvfs.exists(entry['localPath']):
+                    xbmcvfs.delete(entry['localPath'])
+            else:
+                TempCopies._removeUnused(TEMP_COPY_BUDGET)
+        entry['ready'].set()
+
+    # Deletes the least recently used copies that are not being used until the
+    # total size is within the budget (None removes them all), must be called
+    # holding the lock
+    @staticmethod
+    def _removeUnused(budget):
+        totalSize = 0
+        for entry in COPY_INDEX.values():
+            totalSize += entry['size']
+
+        unusedEntries = []
+        for copyKey, entry in COPY_INDEX.items():
+            if (entry['refCount'] < 1) and entry['ready'].is_set():
+                unusedEntries.append((entry['lastUsed'], copyKey))
+        unusedEntries.sort()
+
+        for lastUsed, copyKey in unusedEntries:
+            if (budget is not None) and (totalSize <= budget):
+                break
+            entry = COPY_INDEX.pop(copyKey)
+            log("TempCopies: Removing copy %s" % entry['localPath'])
+            if xbmcvfs.exists(entry['localPath']):
+                xbmcvfs.delete(entry['localPath'])
+            totalSize -= entry['size']
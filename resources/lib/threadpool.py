@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import Queue
+import threading
+import traceback
+import xbmc
+
+# Import the common settings
+from settings import log
+
+
+#########################################################
+# Runs a function for a number of items at the same time,
+# using at most the given number of threads. Used where
+# most of the time is spent waiting on a (remote) file
+#########################################################
+class ThreadPool():
+    def __init__(self, numWorkers=1):
+        self.numWorkers = max(1, numWorkers)
+        self.monitor = xbmc.Monitor()
+        self.aborted = False
+
+    # Calls the function for each set of arguments, returning the results in the
+    # same order as the arguments were given. If any call raises an exception
+    # then it is raised again once all the threads have stopped, if Kodi is
+    # shutting down then the calls that were not started will have no result
+    def map(self, function, argumentsList):
+        argumentsList = list(argumentsList)
+        results = [None] * len(argumentsList)
+
+        # No point starting threads if there is only one to run at a time
+        if (self.numWorkers < 2) or (len(argumentsList) < 2):
+            for idx, arguments in enumerate(argumentsList):
+                results[idx] = function(*arguments)
+            self.aborted = self.monitor.abortRequested()
+            return results
+
+        workQueue = Queue.Queue()
+        for idx, arguments in enumerate(argumentsList):
+            workQueue.put((idx, arguments))
+
+        errors = []
+        threads = []
+        for i in range(min(self.numWorkers, len(argumentsList))):
+            thread = threading.Thread(target=self._runWorker, args=(function, workQueue, results, errors))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+        if len(errors) > 0:
+            raise errors[0]
+
+        self.aborted = self.monitor.abortRequested()
+        return results
+
+    # Checks if Kodi was shutting down during the last call to map, in which case
+    # some of the results will be missing
+    def isAborted(self):
+        return self.aborted
+
+    def _runWorker(self, function, workQueue, results, errors):
+        while (len(errors) < 1) and (not self.monitor.abortRequested()):
+            try:
+                idx, arguments = workQueue.get_nowait()
+            except Queue.Empty:
+                break
+
+            try:
+                results[idx] = function(*arguments)
+            except Exception as ex:
+                log("ThreadPool: Call failed: %s" % traceback.format_exc())
+                errors.append(ex)
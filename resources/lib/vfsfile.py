@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import os
+import xbmcvfs
+
+# Import the common settings
+from settings import log
+
+# Amount read from the file at a time, small reads (like tag headers) are
+# served from this buffer rather than each being a separate network request
+READ_AHEAD_SIZE = 64 * 1024
+
+
+#########################################################
+# Read only file object for any file Kodi can open, this
+# allows mutagen to read files on network shares without
+# the whole file being copied locally first, only the
+# parts that are actually read are transferred
+#########################################################
+class VfsFile():
+    def __init__(self, filePath, readAheadSize=READ_AHEAD_SIZE):
+        # Mutagen uses the name to help decide what type of file it is
+        self.name = filePath
+        self.readAheadSize = readAheadSize
+        self.vfsFile = xbmcvfs.File(filePath)
+        self.fileSize = self.vfsFile.size()
+        self.position = 0
+        self.buffer = b""
+        self.bufferStart = 0
+        self.bytesTransferred = 0
+
+        if self.fileSize < 1:
+            self.vfsFile.close()
+            raise IOError("Unable to open %s" % filePath)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, excTraceback):
+        self.close()
+
+    def read(self, size=-1):
+        if (size is None) or (size < 0):
+            size = max(0, self.fileSize - self.position)
+
+        data = []
+        while size > 0:
+            bufferOffset = self.position - self.bufferStart
+            if (bufferOffset >= 0) and (bufferOffset < len(self.buffer)):
+                chunk = self.buffer[bufferOffset:bufferOffset + size]
+            elif size >= self.readAheadSize:
+                # Large reads (like cover images) are not worth buffering
+                chunk = self._readFromFile(self.position, size)
+            else:
+                self.buffer = self._readFromFile(self.position, self.readAheadSize)
+                self.bufferStart = self.position
+                chunk = self.buffer[:size]
+
+            # Reached the end of the file
+            if len(chunk) < 1:
+                break
+
+            data.append(chunk)
+            self.position += len(chunk)
+            size -= len(chunk)
+
+        return b"".join(data)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset = self.position + offset
+        elif whence == os.SEEK_END:
+            offset = self.fileSize + offset
+
+        if offset < 0:
+            raise IOError("Invalid seek to %d in %s" % (offset, self.name))
+
+        # Nothing is read until it is needed, so moving past data is free
+        self.position = offset
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        if self.vfsFile is not None:
+            log("VfsFile: Read %d of %d bytes from %s" % (self.bytesTransferred, self.fileSize, self.name))
+            self.vfsFile.close()
+            self.vfsFile = None
+        self.buffer = b""
+
+    def _readFromFile(self, position, size):
+        self.vfsFile.seek(position, os.SEEK_SET)
+        data = self.vfsFile.read(size)
+        self.bytesTransferred += len(data)
+        return data
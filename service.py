@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 import sys
+import time
+import traceback
 import xbmc
 import xbmcaddon
 import xbmcvfs
@@ -11,11 +13,24 @@ from resources.lib.settings import os_path_split
 from resources.lib.settings import dir_exists
 from resources.lib.settings import Settings
 from resources.lib.database import AudioBooksDB
+from resources.lib.foldersnapshot import FolderSnapshot
 from resources.lib.ffmpegLib import FFMpegLib
+from resources.lib.scanner import LibraryScanner
+from resources.lib.tempcopies import TempCopies
 
 
 ADDON = xbmcaddon.Addon(id='script.audiobooks')
 
+# How long to wait after startup before indexing, and then between each index (in seconds)
+INDEX_START_DELAY = 60
+INDEX_INTERVAL = 6 * 60 * 60
+
+# How often to check if the plugin has queued any folders to be checked for changes (in seconds)
+REFRESH_CHECK_INTERVAL = 2
+
+# How long the index runs before giving the queued folders a chance to be checked (in seconds)
+INDEX_SLICE_TIME = 10
+
 
 #########################
 # Main
@@ -29,9 +44,9 @@ if __name__ == '__main__':
 
     # If the database file exists, check if it needs updating
     if xbmcvfs.exists(databasefile):
-        audiobookDB = AudioBooksDB()
+        audiobookDB = AudioBooksDB.getInstance()
         audiobookDB.createDatabase()
-        del audiobookDB
+        AudioBooksDB.closeInstance()
 
     if Settings.isFFmpegAutoDetect():
         log("AudioBookService: Performing refresh check on FFmpeg")
@@ -109,3 +124,56 @@ if __name__ == '__main__':
         Settings.setFFmpegSetting(defaultFFmpegSetting)
     else:
         log("AudioBookService: FFmpeg check not required")
+
+    # Nothing should be reading media yet, so anything left in the temporary
+    # directory is from when Kodi was last stopped
+    TempCopies.removeLeftovers()
+
+    # Keep the database up to date with the library in the background, so that
+    # books do not need to be read when they are displayed
+    monitor = xbmc.Monitor()
+    nextIndexTime = time.time() + INDEX_START_DELAY
+    indexRunning = False
+    while not monitor.waitForAbort(REFRESH_CHECK_INTERVAL):
+        # Folders that were displayed using old contents are checked as soon as they
+        # are queued, if the one still being shown has changed it is displayed again
+        try:
+            for folder in FolderSnapshot.refreshQueued():
+                if FolderSnapshot.isDisplayed(folder):
+                    xbmc.executebuiltin("Container.Refresh")
+                    break
+        except:
+            log("AudioBookService: Folder check failed: %s" % traceback.format_exc(), xbmc.LOGERROR)
+        AudioBooksDB.closeInstance()
+
+        if not indexRunning:
+            if time.time() < nextIndexTime:
+                continue
+            nextIndexTime = time.time() + INDEX_INTERVAL
+
+            if not Settings.isBackgroundIndexEnabled():
+                log("AudioBookService: Background indexing disabled")
+                continue
+
+            log("AudioBookService: Starting background index")
+            indexRunning = True
+
+        # The index waits until nothing is playing, so it does not compete with
+        # the playback for reading the media
+        if xbmc.Player().isPlaying():
+            continue
+
+        # The index is run a few folders at a time, so that queued folders are
+        # still checked while a large library is being read
+        try:
+            scanner = LibraryScanner(stopWhilePlaying=True)
+            indexRunning = not scanner.scan(maxSeconds=INDEX_SLICE_TIME)
+            del scanner
+        except:
+            log("AudioBookService: Background index failed: %s" % traceback.format_exc(), xbmc.LOGERROR)
+            indexRunning = False
+
+        # Do not keep the database open while waiting
+        AudioBooksDB.closeInstance()
+
+    log("AudioBookService: Stopping")
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Common set up for the tests, the Kodi modules are replaced by the stubs in
+# benchmark/stubs so the tests run outside of Kodi (they still need Python 2)
+#
+# Usage: python -m unittest discover -s tests
+import os
+import sys
+import shutil
+import tempfile
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'resources', 'lib'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'benchmark', 'stubs'))
+
+import xbmcaddon
+
+
+# Gives the test a new addon_data directory, so it starts with no database
+def createProfile():
+    profileDir = tempfile.mkdtemp(prefix='audiobooks_test_')
+    xbmcaddon.PROFILE = profileDir
+    return profileDir
+
+
+# Closes the database and removes the addon_data directory made by createProfile
+def removeProfile(profileDir):
+    from database import AudioBooksDB
+    AudioBooksDB.closeInstance()
+    shutil.rmtree(profileDir, ignore_errors=True)
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import support
+from audiobook import _getChapterList
+
+
+class ChapterListTest(unittest.TestCase):
+    def testLastChapterEndsAtDuration(self):
+        chapters = _getChapterList([(600, None, 'Two'), (0, None, 'One')], 1800)
+        self.assertEqual([chapter['title'] for chapter in chapters], ['One', 'Two'])
+        self.assertEqual((chapters[0]['endTime'], chapters[0]['duration']), (600, 600))
+        self.assertEqual((chapters[1]['endTime'], chapters[1]['duration']), (1800, 1200))
+
+    def testUnknownDuration(self):
+        for duration in [-1, 0, None]:
+            chapters = _getChapterList([(0, None, 'One'), (600, None, 'Two')], duration)
+            self.assertEqual((chapters[0]['endTime'], chapters[0]['duration']), (600, 600))
+            self.assertEqual((chapters[1]['endTime'], chapters[1]['duration']), (0, 0))
+
+    def testStoredEndTime(self):
+        chapters = _getChapterList([(0, 500, 'One'), (600, None, 'Two')], -1)
+        self.assertEqual((chapters[0]['endTime'], chapters[0]['duration']), (500, 500))
+        self.assertEqual((chapters[1]['endTime'], chapters[1]['duration']), (0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+# Checks that databases created by earlier versions of the addon are upgraded
+# to the latest schema without losing any of their data
+#
+# A database is built for each of the earlier versions, then it is opened with
+# AudioBooksDB so the migrations are applied. The schema is compared with a
+# database created from scratch, and the book and chapters that were stored
+# are read back
+import os
+import sqlite3
+import unittest
+
+import support
+from database import AudioBooksDB
+from database import MIGRATIONS
+from settings import get_sort_key
+
+BOOK_PATH = '/books/Some Author/Book 2 of the Series.m4b'
+BOOK_TITLE = 'Book 2 of the Series'
+ORPHAN_BOOK_ID = 999
+
+# The statements each released version ran to create a new database, version 2
+# was never created from scratch, it is an upgraded version 1 database
+OLD_SCHEMAS = {
+    1: ["CREATE TABLE version (version text primary key)",
+        "CREATE TABLE books (id integer primary key, fullpath text unique, title text, num_chapters integer, position integer, complete integer)"],
+    2: ["CREATE TABLE version (version text primary key)",
+        "CREATE TABLE books (id integer primary key, fullpath text unique, title text, num_chapters integer, position integer, complete integer)",
+        "ALTER TABLE books ADD COLUMN chapter_position integer DEFAULT 0"],
+    3: ["CREATE TABLE version (version text primary key)",
+        "CREATE TABLE books (id integer primary key, fullpath text unique, title text, num_chapters integer, position integer, complete integer, chapter_position integer, has_artwork integer)"],
+    4: ["CREATE TABLE version (version text primary key)",
+        "CREATE TABLE books (id integer primary key, fullpath text unique, title text, num_chapters integer, position integer, complete integer, chapter_position integer, has_artwork integer, duration integer DEFAULT -1, chapters_loaded integer DEFAULT 0)",
+        "CREATE TABLE chapters (id integer primary key, book_id integer, chapter_index integer, title text, start_time integer, end_time integer, duration integer, file_path text, UNIQUE (book_id, chapter_index))"],
+    5: ["CREATE TABLE version (version text primary key)",
+        "CREATE TABLE books (id integer primary key, fullpath text unique, title text, num_chapters integer, position integer, complete integer, chapter_position integer, has_artwork integer, duration integer DEFAULT -1, chapters_loaded integer DEFAULT 0, fingerprint text)",
+        "CREATE TABLE chapters (id integer primary key, book_id integer, chapter_index integer, title text, start_time integer, end_time integer, duration integer, file_path text, fingerprint text, UNIQUE (book_id, chapter_index))"]
+}
+LAST_RELEASED_VERSION = max(OLD_SCHEMAS.keys())
+
+
+# Creates the database for the given earlier version, with a single book in it
+# (and its chapters, plus a chapter with no book, for versions that have them).
+# Versions after the last released one are the last released database with
+# the migrations up to that version applied
+def createOldDatabase(databaseFile, version):
+    conn = sqlite3.connect(databaseFile)
+    c = conn.cursor()
+    schemaVersion = min(version, LAST_RELEASED_VERSION)
+    for statement in OLD_SCHEMAS[schemaVersion]:
+        c.execute(statement)
+
+    values = {'fullpath': BOOK_PATH, 'title': BOOK_TITLE, 'num_chapters': 2, 'position': 754, 'complete': 0}
+    if version >= 2:
+        values['chapter_position'] = 2
+    if version >= 3:
+        values['has_artwork'] = 1
+    if version >= 4:
+        values['duration'] = 3600
+        values['chapters_loaded'] = 1
+    if version >= 5:
+        values['fingerprint'] = '1400000000:4096'
+    columns = sorted(values.keys())
+    c.execute("INSERT INTO books (%s) VALUES (%s)" % (', '.join(columns), ', '.join('?' * len(columns))), [values[column] for column in columns])
+
+    if version >= 4:
+        bookId = c.lastrowid
+        chapters = [(bookId, 1, 'Opening', 0, 1500, 1500), (bookId, 2, 'Closing', 1500, 3600, 2100), (ORPHAN_BOOK_ID, 1, 'Orphan', 0, 10, 10)]
+        c.executemany("INSERT INTO chapters (book_id, chapter_index, title, start_time, end_time, duration) VALUES (?, ?, ?, ?, ?, ?)", chapters)
+
+    for migrationVersion, steps in MIGRATIONS:
+        if schemaVersion < migrationVersion <= version:
+            for step in steps:
+                if callable(step):
+                    step(c)
+                else:
+                    c.execute(step)
+
+    c.execute("INSERT INTO version VALUES (?)", (str(version),))
+    conn.commit()
+    conn.close()
+
+
+# Gets the columns of each table and the names of the indexes in the database
+def getSchema(conn):
+    c = conn.cursor()
+    c.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'books_search%' AND name NOT LIKE 'sqlite_%'")
+    tables = {}
+    for row in c.fetchall():
+        c.execute("PRAGMA table_info(%s)" % row[0])
+        tables[row[0]] = set([column[1] for column in c.fetchall()])
+    c.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name NOT LIKE 'sqlite_%'")
+    indexes = set([row[0] for row in c.fetchall()])
+    return tables, indexes
+
+
+class MigrationTest(unittest.TestCase):
+    # The schema of a new database is what every upgraded one should end up with
+    def _getNewSchema(self):
+        profileDir = support.createProfile()
+        try:
+            audiobookDB = AudioBooksDB.getInstance()
+            audiobookDB.createDatabase()
+            return getSchema(audiobookDB.getConnection())
+        finally:
+            support.removeProfile(profileDir)
+
+    def _checkVersion(self, version, expectedSchema):
+        profileDir = support.createProfile()
+        try:
+            createOldDatabase(os.path.join(profileDir, "audiobooks_database.db"), version)
+            audiobookDB = AudioBooksDB.getInstance()
+            audiobookDB.createDatabase()
+            conn = audiobookDB.getConnection()
+            message = "upgrading version %d" % version
+
+            c = conn.cursor()
+            c.execute("SELECT version FROM version")
+            self.assertEqual([row[0] for row in c.fetchall()], [str(MIGRATIONS[-1][0])], message)
+            self.assertEqual(getSchema(conn), expectedSchema, message)
+
+            details = audiobookDB.getAudioBookDetails(BOOK_PATH)
+            self.assertNotEqual(details, None, message)
+            expected = {'title': BOOK_TITLE, 'numChapters': 2, 'position': 754, 'complete': False,
+                        'chapterPosition': 0, 'hasArtwork': -1, 'duration': -1, 'fingerprint': None,
+                        'parentPath': '/books/Some Author', 'sortKey': get_sort_key(BOOK_TITLE)}
+            if version >= 2:
+                expected['chapterPosition'] = 2
+            if version >= 3:
+                expected['hasArtwork'] = 1
+            if version >= 4:
+                expected['duration'] = 3600
+            if version >= 5:
+                expected['fingerprint'] = '1400000000:4096'
+            for key in sorted(expected.keys()):
+                self.assertEqual(details.get(key, None), expected[key], "%s, book %s" % (message, key))
+
+            chapters = audiobookDB.getChapters(BOOK_PATH)
+            if version >= 4:
+                self.assertEqual([chapter['title'] for chapter in chapters], ['Opening', 'Closing'], message)
+                c.execute("SELECT count(*) FROM chapters WHERE book_id = ?", (ORPHAN_BOOK_ID,))
+                self.assertEqual(c.fetchone()[0], 0, message)
+            else:
+                self.assertEqual(chapters, None, message)
+        finally:
+            support.removeProfile(profileDir)
+
+    def testEveryVersionIsUpgraded(self):
+        expectedSchema = self._getNewSchema()
+        for version, steps in MIGRATIONS[:-1]:
+            self._checkVersion(version, expectedSchema)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import support
+import xbmc
+import xbmcplugin
+from plugin import MenuNavigator
+from plugin import getPageArg
+
+
+class PageArgTest(unittest.TestCase):
+    def testMissing(self):
+        self.assertEqual(getPageArg(None, 0), 0)
+        self.assertEqual(getPageArg([], None), None)
+
+    def testNumbers(self):
+        self.assertEqual(getPageArg(['3'], 0), 3)
+        self.assertEqual(getPageArg(['-2'], None), 0)
+
+    def testNotANumber(self):
+        self.assertEqual(getPageArg(['abc'], 0), 0)
+        self.assertEqual(getPageArg([''], None), None)
+
+
+class SearchTest(unittest.TestCase):
+    def setUp(self):
+        self.endCalls = []
+        self.realEndOfDirectory = xbmcplugin.endOfDirectory
+        self.realKeyboard = xbmc.Keyboard
+        xbmcplugin.endOfDirectory = lambda handle, succeeded=True, **kwargs: self.endCalls.append(succeeded)
+
+    def tearDown(self):
+        xbmcplugin.endOfDirectory = self.realEndOfDirectory
+        xbmc.Keyboard = self.realKeyboard
+
+    def _setKeyboard(self, confirmed, text):
+        class Keyboard(self.realKeyboard):
+            def isConfirmed(self):
+                return confirmed
+
+            def getText(self):
+                return text
+        xbmc.Keyboard = Keyboard
+
+    def testCancelledKeyboard(self):
+        self._setKeyboard(False, 'ignored')
+        MenuNavigator('plugin://script.audiobooks/', 1).search()
+        self.assertEqual(self.endCalls, [False])
+
+    def testEmptyText(self):
+        self._setKeyboard(True, '')
+        MenuNavigator('plugin://script.audiobooks/', 1).search()
+        self.assertEqual(self.endCalls, [False])
+
+
+if __name__ == '__main__':
+    unittest.main()
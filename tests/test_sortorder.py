@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import support
+from database import AudioBooksDB
+
+FOLDER = u'/library/Some Author'
+
+
+class SortOrderTest(unittest.TestCase):
+    def setUp(self):
+        self.profileDir = support.createProfile()
+        self.audiobookDB = AudioBooksDB.getInstance()
+        self.audiobookDB.createDatabase()
+
+    def tearDown(self):
+        support.removeProfile(self.profileDir)
+
+    def _getPath(self, name):
+        return u'%s/%s' % (FOLDER, name)
+
+    # Reads each page of the folder in turn, adding the books on the page to the
+    # database as the listing would, returns the books on each page
+    def _visitPages(self, books, pageSize):
+        pages = []
+        page = 0
+        while True:
+            sortedBooks = self.audiobookDB.sortAudioBooks(books)
+            pageBooks = sortedBooks[page * pageSize:(page + 1) * pageSize]
+            if len(pageBooks) < 1:
+                break
+            pages.append(pageBooks)
+            for book in pageBooks:
+                if self.audiobookDB.getAudioBookDetails(book) is None:
+                    self.audiobookDB.addAudioBook(book, book.split('/')[-1][:-4], 0)
+            page += 1
+        return pages
+
+    def testUnknownBooksAreMergedByName(self):
+        books = [self._getPath(name) for name in [u'Part 10.m4b', u'Part 5.m4b', u'Part 1.m4b', u'Part 9.m4b', u'Part 2.m4b']]
+        self.audiobookDB.addAudioBook(self._getPath(u'Part 9.m4b'), u'Part 9', 0)
+
+        expected = [self._getPath(name) for name in [u'Part 1.m4b', u'Part 2.m4b', u'Part 5.m4b', u'Part 9.m4b', u'Part 10.m4b']]
+        self.assertEqual(self.audiobookDB.sortAudioBooks(books), expected)
+
+        # Adding the books while paging must not move any of them to another page
+        firstVisit = self._visitPages(books, 2)
+        secondVisit = self._visitPages(books, 2)
+        self.assertEqual(firstVisit, [expected[0:2], expected[2:4], expected[4:]])
+        self.assertEqual(secondVisit, firstVisit)
+
+    def testStoredTitlesAreUsed(self):
+        books = [self._getPath(u'a.m4b'), self._getPath(u'b.m4b'), self._getPath(u'Book Three')]
+        # The title of a.m4b comes after the names of the others
+        self.audiobookDB.addAudioBook(books[0], u'Zebra', 0)
+        self.assertEqual(self.audiobookDB.sortAudioBooks(books), [books[1], books[2], books[0]])
+
+
+if __name__ == '__main__':
+    unittest.main()